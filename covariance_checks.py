@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright (c) 2018, John Skinner, David Hall, Niko Sünderhauf, and Feras Dayoub,
+ARC Centre of Excellence for Robotic Vision, Queensland University of Technology
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+-----------------------------------
+
+Checks for the 2x2 corner covariance matrices, shared by the submission builder and the submission validator.
+
+Each check works on a whole stack of matrices at once, that is, any array with shape (..., 2, 2),
+and returns a boolean mask with one entry for each matrix (shape (...)), True where the matrix passes.
+This lets an entire image or sequence of covariances be checked in one call,
+rather than calling np.linalg.eigh for each matrix.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+
+
+def is_symmetric_mask(mats, rtol=0.0, atol=0.0):
+    """
+    Check which of a stack of 2x2 matrices are symmetric.
+    By default the off-diagonal elements must be exactly equal,
+    give a tolerance to compare them the same way as np.allclose.
+    :param mats: An array of shape (..., 2, 2)
+    :param rtol: The relative tolerance, as in np.isclose
+    :param atol: The absolute tolerance, as in np.isclose
+    :return: A boolean array of shape (...), True for each matrix that is symmetric
+    """
+    mats = np.asarray(mats)
+    upper = mats[..., 0, 1]
+    lower = mats[..., 1, 0]
+    if rtol == 0 and atol == 0:
+        return upper == lower
+    # Compare both ways around, since np.isclose is not symmetric in its arguments
+    return np.isclose(upper, lower, rtol=rtol, atol=atol) & np.isclose(lower, upper, rtol=rtol, atol=atol)
+
+
+def is_positive_semi_definite_mask(mats, tolerance=1e-14):
+    """
+    Check which of a stack of symmetric 2x2 matrices are positive semi-definite,
+    that is, the smallest eigenvalue is not negative (within a small tolerance).
+    The smallest eigenvalue of a symmetric 2x2 matrix [[a, b], [b, c]] has the closed form
+        (a + c) / 2 - sqrt(((a - c) / 2)^2 + b^2)
+    which is half the trace less the square root of (trace^2 / 4 - determinant), written to avoid cancellation.
+    Like np.linalg.eigh, only the lower triangle is used, so check the matrices are symmetric first.
+    Matrices containing NaN fail the check.
+
+    :param mats: An array of shape (..., 2, 2)
+    :param tolerance: How far below zero the smallest eigenvalue can be, to allow for rounding error.
+    :return: A boolean array of shape (...), True for each matrix that is positive semi-definite
+    """
+    mats = np.asarray(mats, dtype=np.float64)
+    half_trace = (mats[..., 0, 0] + mats[..., 1, 1]) / 2
+    half_diff = (mats[..., 0, 0] - mats[..., 1, 1]) / 2
+    min_eigenvalue = half_trace - np.hypot(half_diff, mats[..., 1, 0])
+    return min_eigenvalue >= -tolerance
+
+
+def first_failure(mask):
+    """
+    Find the first entry of a pass/fail mask that failed, for error reporting.
+    :param mask: A boolean array, True where the check passed
+    :return: The index of the first False entry, as a tuple for multi-dimensional masks, or None if all passed
+    """
+    mask = np.asarray(mask)
+    failures = np.argwhere(~mask)
+    if len(failures) <= 0:
+        return None
+    if mask.ndim == 1:
+        return int(failures[0][0])
+    return tuple(int(idx) for idx in failures[0])
+
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright (c) 2018, John Skinner, David Hall, Niko Sünderhauf, and Feras Dayoub,
+ARC Centre of Excellence for Robotic Vision, Queensland University of Technology
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+-----------------------------------
+
+An index of the images in each sequence of the downloaded test data, so that a submission can be checked
+against the number of images in each sequence.
+Listing the images in every sequence folder is slow, so the sorted list of images for each sequence is saved
+to a small cache file, and only re-read when the modification time of the sequence folder changes.
+
+To build the index ahead of time, run this script on the test data folder:
+```
+python image_index.py test_data
+```
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import os
+import os.path
+
+# The file extensions of the test images
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+
+# The name of the cache file created in the test data folder
+INDEX_NAME = '.image_index.json'
+
+
+def list_sequence_images(sequence_folder):
+    """
+    List the images in a sequence folder, in order.
+    :param sequence_folder: The folder containing the images for a sequence
+    :return: The sorted list of image file names
+    """
+    return sorted(
+        file_name for file_name in os.listdir(sequence_folder)
+        if os.path.splitext(file_name)[1].lower() in IMAGE_EXTENSIONS
+    )
+
+
+class ImageIndex(object):
+    """
+    The list of images in each sequence folder of the test data, cached in a file.
+    Sequences are indexed the first time they are needed, and re-indexed when their folder changes.
+    Call 'save' to write the cache file, if it cannot be written (for instance, if the data is read only),
+    the index still works but is rebuilt next time.
+    ```
+    index = ImageIndex('test_data')
+    num_images = index.get_image_count('000000')
+    index.save()
+    ```
+    """
+
+    def __init__(self, data_root, cache_file=None):
+        """
+        :param data_root: The test data folder, containing a folder of images for each sequence
+        :param cache_file: The file to store the index in. Defaults to INDEX_NAME in the data folder.
+        """
+        self.data_root = data_root
+        self.cache_file = cache_file if cache_file is not None else os.path.join(data_root, INDEX_NAME)
+        self._sequences = {}
+        self._changed = False
+        if os.path.isfile(self.cache_file):
+            try:
+                with open(self.cache_file, 'r') as fp:
+                    self._sequences = json.load(fp)['sequences']
+            except (ValueError, KeyError, TypeError):
+                # The cache is corrupt, rebuild it
+                self._sequences = {}
+
+    @property
+    def sequence_names(self):
+        """
+        :return: The sorted list of sequences in the test data folder
+        """
+        return sorted(name for name in os.listdir(self.data_root)
+                      if os.path.isdir(os.path.join(self.data_root, name)) and not name.startswith('.'))
+
+    def get_images(self, sequence_name):
+        """
+        Get the sorted list of images for a sequence, re-reading the sequence folder only if it has changed.
+        :param sequence_name: The name of the sequence, such as '000000'
+        :return: The list of image file names, or None if there is no folder for that sequence
+        """
+        sequence_folder = os.path.join(self.data_root, sequence_name)
+        try:
+            mtime = os.stat(sequence_folder).st_mtime_ns
+        except OSError:
+            return None
+        entry = self._sequences.get(sequence_name)
+        if entry is None or entry['mtime'] != mtime:
+            entry = {'mtime': mtime, 'images': list_sequence_images(sequence_folder)}
+            self._sequences[sequence_name] = entry
+            self._changed = True
+        return entry['images']
+
+    def get_image_count(self, sequence_name):
+        """
+        :param sequence_name: The name of the sequence
+        :return: The number of images in the sequence, or None if there is no folder for that sequence
+        """
+        images = self.get_images(sequence_name)
+        return None if images is None else len(images)
+
+    def save(self):
+        """
+        Write the index to the cache file, if anything has changed.
+        :return: True if the index was saved, or does not need to be, False if it could not be written
+        """
+        if not self._changed:
+            return True
+        try:
+            with open(self.cache_file + '.tmp', 'w') as fp:
+                json.dump({'sequences': self._sequences}, fp)
+            os.replace(self.cache_file + '.tmp', self.cache_file)
+        except OSError:
+            return False
+        self._changed = False
+        return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Index the images in each sequence of the test data, '
+                                                 'so that submissions can be checked against the number of images.')
+    parser.add_argument('data_root', type=str, help='The test data folder, containing a folder for each sequence')
+    args = parser.parse_args()
+
+    index = ImageIndex(args.data_root)
+    for name in index.sequence_names:
+        print("{0}: {1} images".format(name, index.get_image_count(name)))
+    if not index.save():
+        print("Could not write the index to {0}".format(index.cache_file))
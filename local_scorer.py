@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright (c) 2018, John Skinner, David Hall, Niko Sünderhauf, and Feras Dayoub,
+ARC Centre of Excellence for Robotic Vision, Queensland University of Technology
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+-----------------------------------
+
+Fast local scoring of a submission against ground truth, such as the 'validation_data' sequence.
+
+This is not the challenge score, which is computed by the evaluation code
+(https://github.com/jskinn/rvchallenge-evaluation) using the segmentation masks and the corner covariances.
+Instead, it is a quick approximation using only the boxes, fast enough to run inside a hyperparameter search.
+For each image, the quality of a detection for a ground truth object is the geometric mean of
+the IoU of the boxes and the probability the detection gives to the true class.
+Detections and ground truth objects are paired to give the greatest total quality, and the score is
+the total quality of the pairs divided by the number of pairs, unpaired detections, and unpaired objects.
+The score is between 0 and 1, and only 1 if every object is found exactly, with certainty, and nothing else.
+As for the evaluation, detections are ignored if the total probability of the challenge classes is 0.5 or less.
+
+The ground truth for each sequence is a folder containing a 'labels.json' file, which is an object with an entry
+for each image, by image number. Each image is an object with an entry for each object instance, which gives
+the 'class' name and the 'bbox' as [xmin, ymin, xmax, ymax]. Other entries, such as the '_metadata', are ignored:
+```
+{
+  "000000": {
+    "_metadata": {...},
+    "1": {"class": "cup", "bbox": [12, 14, 55, 46], ...},
+    ...
+  },
+  ...
+}
+```
+
+If scipy is available, the pairs are found with the Hungarian algorithm, otherwise they are chosen greedily
+in order of quality, which is almost always the same.
+Run on a submission and the ground truth folder:
+```
+python local_scorer.py submission/ validation_data/
+```
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import os
+import os.path
+import zipfile
+import numpy as np
+
+# Use scipy for the optimal assignment, if it is available
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# Import relative to the package when the starter kit is imported as one
+try:
+    from . import submission_validator
+except ImportError:
+    import submission_validator
+
+# The name of the ground truth file in each sequence folder
+LABELS_NAME = 'labels.json'
+
+
+class SequenceDetections(object):
+    """
+    The detections for a sequence, as flat arrays for all the images,
+    with the class probabilities re-ordered to the challenge class list.
+    The detections for image i are those from image_offsets[i] up to image_offsets[i + 1].
+    """
+
+    def __init__(self, probs, boxes, image_offsets):
+        """
+        :param probs: An N x C array of class probabilities, where C is the length of the challenge class list
+        :param boxes: An N x 4 array of boxes, as [xmin, ymin, xmax, ymax]
+        :param image_offsets: An array of the index of the first detection for each image, and the total at the end
+        """
+        self.probs = probs
+        self.boxes = boxes
+        self.image_offsets = image_offsets
+
+    @property
+    def num_images(self):
+        return len(self.image_offsets) - 1
+
+
+class SequenceGroundTruth(object):
+    """
+    The ground truth objects for a sequence, as flat arrays for all the images.
+    The objects in image i are those from image_offsets[i] up to image_offsets[i + 1].
+    """
+
+    def __init__(self, class_ids, boxes, image_offsets):
+        """
+        :param class_ids: An array of the class of each object, as an index in the challenge class list
+        :param boxes: An N x 4 array of boxes, as [xmin, ymin, xmax, ymax]
+        :param image_offsets: An array of the index of the first object in each image, and the total at the end
+        """
+        self.class_ids = class_ids
+        self.boxes = boxes
+        self.image_offsets = image_offsets
+
+    @property
+    def num_images(self):
+        return len(self.image_offsets) - 1
+
+
+def load_detections(sequence_json):
+    """
+    Load the detections for a sequence, mapping the classes to the challenge class list.
+    The submission should be valid, see submission_validator.validate_sequence.
+    The file is read one image at a time, see submission_validator.open_sequence_reader.
+    Detections with a total probability for the challenge classes of 0.5 or less are left out,
+    and those with more than 1 are normalized, as in the evaluation.
+    :param sequence_json: The path to the sequence file, or a (zip path, member name) tuple
+    :return: A SequenceDetections
+    """
+    num_classes = len(submission_validator.CLASSES)
+    image_probs = [np.zeros((0, num_classes), dtype=np.float64)]
+    image_boxes = [np.zeros((0, 4), dtype=np.float64)]
+    counts = []
+    with submission_validator.open_sequence_reader(sequence_json) as (header, reader, _):
+        our_class_ids, sub_class_ids = submission_validator.get_class_mapping(header['classes'])
+        our_class_ids = np.asarray(our_class_ids, dtype=np.intp)
+        sub_class_ids = np.asarray(sub_class_ids, dtype=np.intp)
+        for img_dets in reader.iter_images():
+            if len(img_dets) <= 0:
+                counts.append(0)
+                continue
+            probs = np.zeros((len(img_dets), num_classes), dtype=np.float64)
+            probs[:, our_class_ids] = np.array([det['label_probs'] for det in img_dets],
+                                               dtype=np.float64)[:, sub_class_ids]
+            boxes = np.array([det['bbox'] for det in img_dets], dtype=np.float64)
+
+            # Drop the detections that are ignored, using the same threshold as the validator, and normalize the rest
+            total_probs = np.sum(probs, axis=1)
+            is_used = total_probs > 0.5
+            image_probs.append(probs[is_used] / np.maximum(total_probs[is_used], 1)[:, np.newaxis])
+            image_boxes.append(boxes[is_used])
+            counts.append(int(np.count_nonzero(is_used)))
+    return SequenceDetections(np.concatenate(image_probs), np.concatenate(image_boxes),
+                              np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+
+
+def load_ground_truth(sequence_folder):
+    """
+    Load the ground truth objects for a sequence, from the labels file in the sequence folder.
+    Objects that are not one of the challenge classes are left out.
+    :param sequence_folder: The ground truth folder for the sequence
+    :return: A SequenceGroundTruth
+    """
+    with open(os.path.join(sequence_folder, LABELS_NAME), 'r') as fp:
+        labels = json.load(fp)
+    image_names = sorted(labels.keys(), key=lambda name: (int(name), name) if name.isdigit() else (-1, name))
+    class_ids = []
+    boxes = []
+    counts = []
+    for image_name in image_names:
+        count = 0
+        for instance_name, instance in sorted(labels[image_name].items()):
+            if instance_name.startswith('_') or not isinstance(instance, dict):
+                continue
+            class_id = submission_validator.get_class_id(instance.get('class'))
+            if class_id is not None and 'bbox' in instance:
+                class_ids.append(class_id)
+                boxes.append(instance['bbox'])
+                count += 1
+        counts.append(count)
+    return SequenceGroundTruth(
+        np.array(class_ids, dtype=np.intp),
+        np.array(boxes, dtype=np.float64).reshape((len(boxes), 4)),
+        np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    )
+
+
+def get_image_pairs(det_offsets, gt_offsets):
+    """
+    Find every pair of a detection and a ground truth object in the same image, for all the images at once.
+    :param det_offsets: The offsets of the first detection in each image, and the total, see SequenceDetections
+    :param gt_offsets: The offsets of the first object in each image, and the total, see SequenceGroundTruth
+    :return: Arrays of the image, the detection index, and the ground truth index for each pair,
+    grouped by image, with the detections in order and the ground truth objects in order for each detection.
+    """
+    det_counts = np.diff(det_offsets)
+    gt_counts = np.diff(gt_offsets)
+    pair_counts = det_counts * gt_counts
+    pair_offsets = np.concatenate([[0], np.cumsum(pair_counts)])
+    image_ids = np.repeat(np.arange(len(pair_counts)), pair_counts)
+    within_image = np.arange(pair_offsets[-1]) - pair_offsets[image_ids]
+    det_ids = det_offsets[image_ids] + within_image // gt_counts[image_ids]
+    gt_ids = gt_offsets[image_ids] + within_image % gt_counts[image_ids]
+    return image_ids, det_ids, gt_ids
+
+
+def box_iou(boxes_1, boxes_2):
+    """
+    Find the intersection over union of pairs of boxes
+    :param boxes_1: An N x 4 array of boxes, as [xmin, ymin, xmax, ymax]
+    :param boxes_2: Another N x 4 array of boxes
+    :return: An array of the IoU for each pair of boxes
+    """
+    widths = np.minimum(boxes_1[:, 2], boxes_2[:, 2]) - np.maximum(boxes_1[:, 0], boxes_2[:, 0])
+    heights = np.minimum(boxes_1[:, 3], boxes_2[:, 3]) - np.maximum(boxes_1[:, 1], boxes_2[:, 1])
+    intersection = np.maximum(widths, 0) * np.maximum(heights, 0)
+    area_1 = (boxes_1[:, 2] - boxes_1[:, 0]) * (boxes_1[:, 3] - boxes_1[:, 1])
+    area_2 = (boxes_2[:, 2] - boxes_2[:, 0]) * (boxes_2[:, 3] - boxes_2[:, 1])
+    union = area_1 + area_2 - intersection
+    return np.where(union > 0, intersection / np.where(union > 0, union, 1), 0.0)
+
+
+def match_pairs(image_ids, det_ids, gt_ids, quality):
+    """
+    Choose which detections to pair with which ground truth objects, in each image,
+    to get the greatest total quality. Pairs with zero quality are never chosen.
+    :param image_ids: The image for each possible pair, grouped by image, see get_image_pairs
+    :param det_ids: The detection for each possible pair
+    :param gt_ids: The ground truth object for each possible pair
+    :param quality: The quality of each possible pair
+    :return: The indexes of the chosen pairs
+    """
+    chosen = []
+    is_possible = quality > 0
+    image_starts = np.flatnonzero(np.concatenate([[True], image_ids[1:] != image_ids[:-1]])) \
+        if len(image_ids) > 0 else np.zeros(0, dtype=np.intp)
+    image_ends = np.concatenate([image_starts[1:], [len(image_ids)]]).astype(np.intp)
+    for start, end in zip(image_starts, image_ends):
+        if not np.any(is_possible[start:end]):
+            continue
+        if linear_sum_assignment is not None:
+            # The pairs for an image are a dense grid, detections by objects
+            num_gt = len(np.unique(gt_ids[start:end]))
+            grid = quality[start:end].reshape((-1, num_gt))
+            rows, cols = linear_sum_assignment(grid, maximize=True)
+            indices = start + rows * num_gt + cols
+            chosen.append(indices[quality[indices] > 0])
+        else:
+            # Greedily take the best remaining pair, until there are no more
+            used_dets = set()
+            used_gts = set()
+            order = start + np.argsort(-quality[start:end], kind='stable')
+            order = order[quality[order] > 0]
+            image_chosen = []
+            for idx in order:
+                if det_ids[idx] not in used_dets and gt_ids[idx] not in used_gts:
+                    used_dets.add(det_ids[idx])
+                    used_gts.add(gt_ids[idx])
+                    image_chosen.append(idx)
+            chosen.append(np.array(image_chosen, dtype=np.intp))
+    if len(chosen) <= 0:
+        return np.zeros(0, dtype=np.intp)
+    return np.concatenate(chosen).astype(np.intp)
+
+
+def score_sequence(detections, ground_truth):
+    """
+    Score the detections for a sequence against the ground truth.
+    :param detections: The SequenceDetections
+    :param ground_truth: The SequenceGroundTruth
+    :return: A dict of the totals for the sequence, see make_scores
+    """
+    if detections.num_images != ground_truth.num_images:
+        raise ValueError("There are detections for {0} images, but ground truth for {1} images".format(
+            detections.num_images, ground_truth.num_images))
+    image_ids, det_ids, gt_ids = get_image_pairs(detections.image_offsets, ground_truth.image_offsets)
+    iou = box_iou(detections.boxes[det_ids], ground_truth.boxes[gt_ids])
+    label_probs = detections.probs[det_ids, ground_truth.class_ids[gt_ids]]
+    quality = np.sqrt(iou * label_probs)
+    chosen = match_pairs(image_ids, det_ids, gt_ids, quality)
+    return make_scores({
+        'images': detections.num_images,
+        'detections': len(detections.boxes),
+        'objects': len(ground_truth.boxes),
+        'true_positives': len(chosen),
+        'total_quality': float(np.sum(quality[chosen])),
+        'total_iou': float(np.sum(iou[chosen])),
+        'total_label_prob': float(np.sum(label_probs[chosen]))
+    })
+
+
+def make_scores(totals):
+    """
+    Work out the summary scores from the totals for one or more sequences.
+    :param totals: A dict of the numbers of images, detections, objects, and true positives (pairs),
+    and the total quality, IoU, and label probability of the pairs.
+    :return: The totals, with the number of false positives and false negatives,
+    the overall score, and the average quality, IoU and label probability of the pairs
+    """
+    scores = dict(totals)
+    true_positives = totals['true_positives']
+    scores['false_positives'] = totals['detections'] - true_positives
+    scores['false_negatives'] = totals['objects'] - true_positives
+    denominator = true_positives + scores['false_positives'] + scores['false_negatives']
+    scores['score'] = totals['total_quality'] / denominator if denominator > 0 else 1.0
+    for name in ['quality', 'iou', 'label_prob']:
+        scores['avg_' + name] = totals['total_' + name] / true_positives if true_positives > 0 else 0.0
+    return scores
+
+
+def score_submission(submission, ground_truth_root, sequence_names=None):
+    """
+    Score a submission against the ground truth for some sequences.
+    :param submission: The submission folder or zip file
+    :param ground_truth_root: The folder containing a ground truth folder for each sequence
+    :param sequence_names: The names of the sequences to score. By default, all the sequences in the ground truth.
+    :return: A dict of the scores for each sequence, and the overall scores over all the sequences under 'total'
+    """
+    if sequence_names is None:
+        sequence_names = sorted(
+            name for name in os.listdir(ground_truth_root)
+            if os.path.isfile(os.path.join(ground_truth_root, name, LABELS_NAME))
+        )
+    if os.path.isfile(submission) and zipfile.is_zipfile(submission):
+        sequences = submission_validator.find_zip_sequences(submission, set(sequence_names))
+    elif os.path.isdir(submission):
+        sequences = submission_validator.find_folder_sequences(submission, set(sequence_names))
+    else:
+        raise ValueError("Submission {0} does not exist".format(submission))
+    missing = set(sequence_names) - set(sequences.keys())
+    if len(missing) > 0:
+        raise ValueError("The following sequences do not have any detections submitted: {0}".format(sorted(missing)))
+
+    results = {}
+    for sequence_name in sequence_names:
+        results[sequence_name] = score_sequence(
+            load_detections(sequences[sequence_name]),
+            load_ground_truth(os.path.join(ground_truth_root, sequence_name))
+        )
+    results['total'] = make_scores({
+        key: sum(results[sequence_name][key] for sequence_name in sequence_names)
+        for key in ['images', 'detections', 'objects', 'true_positives', 'total_quality', 'total_iou',
+                    'total_label_prob']
+    })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Score a submission against ground truth using the boxes. '
+                                                 'This is a quick approximation, not the challenge score.')
+    parser.add_argument('submission', type=str, help='The submission folder or zip file')
+    parser.add_argument('ground_truth', type=str, help='The folder containing the ground truth for each sequence, '
+                                                       'such as validation_data')
+    parser.add_argument('--sequence', type=str, action='append', default=None,
+                        help='Only score this sequence. Can be given more than once.')
+    parser.add_argument('--output', type=str, default=None, help='A json file to write the scores to.')
+    args = parser.parse_args()
+
+    all_scores = score_submission(args.submission, args.ground_truth, args.sequence)
+    for name in sorted(all_scores.keys()):
+        print("{0}: score {1:.4f}, avg IoU {2:.4f}, avg label prob {3:.4f}, TP {4}, FP {5}, FN {6}".format(
+            name, all_scores[name]['score'], all_scores[name]['avg_iou'], all_scores[name]['avg_label_prob'],
+            all_scores[name]['true_positives'], all_scores[name]['false_positives'],
+            all_scores[name]['false_negatives']))
+    if args.output is not None:
+        with open(args.output, 'w') as fp:
+            json.dump(all_scores, fp, indent=2)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright (c) 2018, John Skinner, David Hall, Niko Sünderhauf, and Feras Dayoub,
+ARC Centre of Excellence for Robotic Vision, Queensland University of Technology
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+-----------------------------------
+
+A binary, columnar format for the detections of a sequence, for working with submissions without parsing json.
+
+Each sequence is saved as an uncompressed numpy .npz file, containing the arrays:
+- 'classes': The class list, as an array of strings
+- 'probs': An N x C float64 array of the class probabilities for all N detections in the sequence,
+  at full precision so that converting to json gives the same values as writing json directly
+- 'boxes': An N x 4 array of the boxes, as [xmin, ymin, xmax, ymax]
+- 'covars': An N x 2 x 2 x 2 array of the corner covariances, zero where a detection has none
+- 'has_covars': A boolean array, which of the detections have covariances
+- 'image_offsets': The index of the first detection of each image, with the total number of detections at the end,
+  so the detections for image i are from image_offsets[i] up to image_offsets[i + 1]
+
+Since the file is not compressed, the arrays are memory-mapped from the file when it is loaded, rather than read,
+so loading is near-instant and only the parts that are used are read from disk.
+The challenge only accepts json files, convert a folder of these files into a submission with:
+```
+python sequence_arrays.py submission_arrays/ submission/
+```
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import json
+import os
+import os.path
+import struct
+import zipfile
+import numpy as np
+
+# The file extension of sequence array files
+ARRAYS_EXTENSION = '.npz'
+
+# The names of the arrays in each file, see the module docstring
+ARRAY_NAMES = ['classes', 'probs', 'boxes', 'covars', 'has_covars', 'image_offsets']
+
+
+class SequenceArrays(object):
+    """
+    The detections for a sequence, as arrays for the whole sequence. See the module docstring for the arrays.
+    """
+
+    def __init__(self, classes, probs, boxes, covars, has_covars, image_offsets):
+        self.classes = classes
+        self.probs = probs
+        self.boxes = boxes
+        self.covars = covars
+        self.has_covars = has_covars
+        self.image_offsets = image_offsets
+
+    @property
+    def num_images(self):
+        return len(self.image_offsets) - 1
+
+    @property
+    def num_detections(self):
+        return int(self.image_offsets[-1])
+
+    def get_image_arrays(self, img_idx):
+        """
+        Get the arrays of detections for one image, as views of the arrays for the sequence.
+        :param img_idx: The index of the image
+        :return: The class probabilities, boxes, covariances, and whether each detection has covariances
+        """
+        start = int(self.image_offsets[img_idx])
+        end = int(self.image_offsets[img_idx + 1])
+        return self.probs[start:end], self.boxes[start:end], self.covars[start:end], self.has_covars[start:end]
+
+    def get_image(self, img_idx):
+        """
+        Build the list of detection dicts for an image, as they appear in the sequence json file.
+        :param img_idx: The index of the image
+        :return: A list of detections, in the same form as submission_builder.make_detection
+        """
+        probs, boxes, covars, has_covars = self.get_image_arrays(img_idx)
+        detections = [
+            {'label_probs': det_probs, 'bbox': bbox}
+            for det_probs, bbox in zip(probs.tolist(), boxes.tolist())
+        ]
+        for det_idx in np.nonzero(has_covars)[0]:
+            detections[det_idx]['covars'] = covars[det_idx].tolist()
+        return detections
+
+
+def is_array_file(sequence_file):
+    """
+    Check if a sequence file is an array file, rather than json
+    :param sequence_file: The path to the sequence file, or a (zip path, member name) tuple
+    :return: True if the file is a sequence array file
+    """
+    return not isinstance(sequence_file, tuple) and sequence_file.endswith(ARRAYS_EXTENSION)
+
+
+def save_sequence_arrays(output_file, classes, probs, boxes, covars, has_covars, image_offsets):
+    """
+    Save the detections for a sequence to an array file.
+    :param output_file: The file to write
+    :param classes: The class list
+    :param probs: An N x C array of class probabilities
+    :param boxes: An N x 4 array of boxes
+    :param covars: An N x 2 x 2 x 2 array of covariances
+    :param has_covars: A boolean array, which detections have covariances
+    :param image_offsets: The offset of the first detection in each image, and the total number of detections
+    :return:
+    """
+    # Write to a file object, so that numpy doesn't change the extension, and without compression,
+    # so that the arrays can be memory-mapped
+    with open(output_file, 'wb') as fp:
+        np.savez(
+            fp,
+            classes=np.array(classes, dtype=np.str_),
+            probs=np.asarray(probs, dtype=np.float64),
+            boxes=np.asarray(boxes, dtype=np.float64),
+            covars=np.asarray(covars, dtype=np.float64),
+            has_covars=np.asarray(has_covars, dtype=bool),
+            image_offsets=np.asarray(image_offsets, dtype=np.int64)
+        )
+
+
+def load_sequence_arrays(array_file, mmap=True):
+    """
+    Load the detections for a sequence from an array file.
+    :param array_file: The file to load
+    :param mmap: Memory-map the arrays rather than reading them, if they are not compressed
+    :return: A SequenceArrays
+    """
+    arrays = {}
+    with zipfile.ZipFile(array_file, 'r') as zip_file:
+        for name in ARRAY_NAMES:
+            info = zip_file.getinfo(name + '.npy')
+            array = _map_member(array_file, zip_file, info) if mmap else None
+            if array is None:
+                with zip_file.open(info, 'r') as fp:
+                    array = np.lib.format.read_array(fp, allow_pickle=False)
+            arrays[name] = array
+    arrays['classes'] = [str(class_name) for class_name in arrays['classes']]
+    return SequenceArrays(**arrays)
+
+
+def _map_member(array_file, zip_file, info):
+    """
+    Memory-map an array stored in an npz file, without reading it.
+    This only works for arrays that are stored without compression.
+    :param array_file: The path to the npz file
+    :param zip_file: The open ZipFile
+    :param info: The ZipInfo for the array
+    :return: A read-only numpy memmap of the array, or None if it cannot be mapped
+    """
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    fp = zip_file.fp
+    fp.seek(info.header_offset)
+    local_header = fp.read(30)
+    # The member data follows the local header, the file name, and the extra field, see the zip specification
+    name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+    fp.seek(info.header_offset + 30 + name_length + extra_length)
+    version = np.lib.format.read_magic(fp)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+    if dtype.hasobject:
+        return None
+    if int(np.prod(shape)) == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(array_file, dtype=dtype, mode='r', offset=fp.tell(), shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def convert_to_json(array_file, json_file):
+    """
+    Convert a sequence array file to the json sequence file for a submission.
+    The json is the same as is written by submission_builder.SubmissionWriter.
+    :param array_file: The array file to read
+    :param json_file: The json file to write
+    :return:
+    """
+    arrays = load_sequence_arrays(array_file)
+    with open(json_file, 'w') as fp:
+        fp.write('{{"classes": {0}, "detections": ['.format(json.dumps(arrays.classes)))
+        for img_idx in range(arrays.num_images):
+            if img_idx > 0:
+                fp.write(', ')
+            fp.write(json.dumps(arrays.get_image(img_idx)))
+        fp.write(']}')
+
+
+def convert_folder(input_folder, output_folder):
+    """
+    Convert all the sequence array files in a folder into json files in another folder.
+    :param input_folder: The folder of array files
+    :param output_folder: The folder to write the json files to, which can be the same folder
+    :return: The list of sequence names that were converted
+    """
+    if not os.path.isdir(output_folder):
+        os.makedirs(output_folder)
+    sequence_names = []
+    for file_name in sorted(os.listdir(input_folder)):
+        sequence_name, extension = os.path.splitext(file_name)
+        if extension == ARRAYS_EXTENSION:
+            convert_to_json(os.path.join(input_folder, file_name),
+                            os.path.join(output_folder, sequence_name + '.json'))
+            sequence_names.append(sequence_name)
+    return sequence_names
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a folder of sequence array files to the json files '
+                                                 'for a submission.')
+    parser.add_argument('input_folder', type=str, help='The folder containing the .npz files for each sequence')
+    parser.add_argument('output_folder', type=str, help='The folder to write the json files to')
+    args = parser.parse_args()
+
+    for converted in convert_folder(args.input_folder, args.output_folder):
+        print("Converted sequence {0}".format(converted))
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright (c) 2018, John Skinner, David Hall, Niko Sünderhauf, and Feras Dayoub,
+ARC Centre of Excellence for Robotic Vision, Queensland University of Technology
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+-----------------------------------
+
+Iterate over the images of the test data in order, decoding them on background threads.
+
+The detections in each sequence file must be in the same order as the images, but os.listdir does not give
+the images in order. SequenceIterator lists the images of each sequence once, in sorted order
+(using the cached index from image_index), and decodes them with a pool of threads, keeping a limited number
+of images ready ahead of the one being used, so that reading images overlaps with running the detector.
+Given a SubmissionWriter, it also calls 'start_sequence', 'next_image' and 'save_sequence' at the right times:
+```
+with submission_builder.SubmissionWriter('submission', classes) as writer:
+    images = SequenceIterator('test_data', writer=writer)
+    for sequence_name, sequence_images in images:
+        for img_idx, image in sequence_images:
+            writer.add_detections(*detect(image))
+```
+Images are decoded with OpenCV (cv2.imread, giving BGR arrays) if it is installed, or otherwise PIL (giving RGB).
+To use something else, pass a function taking the path of the image as 'load_image'.
+"""
+from __future__ import absolute_import, division, print_function
+
+import collections
+import concurrent.futures
+import os.path
+
+# Use OpenCV or PIL to decode images, if they are available
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# numpy is only needed to convert PIL images to arrays
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Import relative to the package when the starter kit is imported as one
+try:
+    from . import image_index
+except ImportError:
+    import image_index
+
+
+def load_image(image_path):
+    """
+    Decode an image, using OpenCV if it is available, or PIL.
+    :param image_path: The path to the image file
+    :return: The image as a numpy array, BGR if read with OpenCV and RGB if read with PIL
+    """
+    if cv2 is not None:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise IOError("Could not read image {0}".format(image_path))
+        return image
+    if Image is not None and np is not None:
+        with Image.open(image_path) as pil_image:
+            return np.asarray(pil_image.convert('RGB'))
+    raise ImportError("Reading images requires OpenCV (cv2) or PIL, or pass a function as 'load_image'")
+
+
+class SequenceIterator(object):
+    """
+    Gives the images of each sequence in the test data in order, decoded ahead of time on background threads.
+    See the module docstring.
+    """
+
+    def __init__(self, data_root, sequence_names=None, writer=None, skip_complete=True, num_workers=4, prefetch=8,
+                 load_image=load_image):
+        """
+        :param data_root: The test data folder, containing a folder of images for each sequence
+        :param sequence_names: The sequences to read, in order. By default, every sequence in the data folder.
+        :param writer: A SubmissionWriter to call 'start_sequence', 'next_image', and 'save_sequence' on. Optional.
+        :param skip_complete: Skip the sequences the writer has already saved, see SubmissionWriter.is_complete,
+        so that generating a submission can be resumed.
+        :param num_workers: The number of threads decoding images
+        :param prefetch: The maximum number of images to decode ahead of the current one
+        :param load_image: The function to decode each image, which takes the path to the image file
+        """
+        self.data_root = data_root
+        self.writer = writer
+        self.num_workers = max(int(num_workers), 1)
+        self.prefetch = max(int(prefetch), 1)
+        self.load_image = load_image
+        self._index = image_index.ImageIndex(data_root)
+        if sequence_names is None:
+            sequence_names = self._index.sequence_names
+        if writer is not None and skip_complete:
+            sequence_names = [name for name in sequence_names if not writer.is_complete(name)]
+        self.sequence_names = list(sequence_names)
+
+    def __iter__(self):
+        """
+        Go through each of the sequences in turn.
+        Each sequence should be read to the end before going to the next one.
+        :return: A generator of (sequence name, image generator) pairs, see iter_sequence
+        """
+        for sequence_name in self.sequence_names:
+            yield sequence_name, self.iter_sequence(sequence_name)
+
+    def get_image_paths(self, sequence_name):
+        """
+        :param sequence_name: The name of the sequence
+        :return: The paths of the images in the sequence, in order
+        """
+        images = self._index.get_images(sequence_name)
+        if images is None:
+            raise ValueError("There is no folder for sequence {0} in {1}".format(sequence_name, self.data_root))
+        # The listing is cached for next time, but the index still works if it cannot be saved
+        self._index.save()
+        return [os.path.join(self.data_root, sequence_name, image_name) for image_name in images]
+
+    def iter_sequence(self, sequence_name):
+        """
+        Go through the images of one sequence in order, decoding the next few in the background.
+        If there is a writer, the sequence is started before the first image, 'next_image' is called after each
+        image, when asking for the next one, and the sequence is saved after the last.
+        If the loop stops early, the sequence is not saved, and is abandoned with 'abort_sequence',
+        so that the writer can go on to the next sequence.
+        :param sequence_name: The name of the sequence
+        :return: A generator of (image index, image) for each image in the sequence
+        """
+        image_paths = self.get_image_paths(sequence_name)
+        if self.writer is not None:
+            self.writer.start_sequence(sequence_name)
+        pending = collections.deque()
+        next_submit = 0
+        is_finished = False
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+                try:
+                    for img_idx in range(len(image_paths)):
+                        while next_submit < len(image_paths) and len(pending) < self.prefetch:
+                            pending.append(pool.submit(self.load_image, image_paths[next_submit]))
+                            next_submit += 1
+                        image = pending.popleft().result()
+                        yield img_idx, image
+                        if self.writer is not None:
+                            self.writer.next_image()
+                finally:
+                    # If the loop stopped early, don't decode the remaining images
+                    for future in pending:
+                        future.cancel()
+            is_finished = True
+        finally:
+            if self.writer is not None and not is_finished:
+                self.writer.abort_sequence()
+        if self.writer is not None:
+            self.writer.save_sequence(sequence_name)
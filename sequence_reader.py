@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright (c) 2018, John Skinner, David Hall, Niko Sünderhauf, and Feras Dayoub,
+ARC Centre of Excellence for Robotic Vision, Queensland University of Technology
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+-----------------------------------
+
+Incremental reading of sequence json files, so that a whole sequence never needs to be held in memory.
+
+A sequence file (see submission_builder) is a json object with a list of classes and a list of detections
+for each image. The detections list can be very large, so rather than parsing the whole file with json.load,
+SequenceReader parses the other keys, and then gives the detections for one image at a time.
+Only the standard library json decoder is used, on a buffer that is read from the file as needed.
+"""
+from __future__ import absolute_import, division, print_function
+
+import codecs
+import json
+import re
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# How much of the end of a file to search for keys after the detections, see read_trailing_keys
+TRAILING_KEYS_SIZE = 1 << 16
+
+# A decoding error this close to the end of the buffer may just be a value that continues in the next read,
+# such as a number, 'true', '-Infinity', or a unicode escape that has been cut off.
+_INCOMPLETE_MARGIN = 16
+
+
+class SequenceReader(object):
+    """
+    Reads a sequence json file incrementally. Call 'read_header' first, which reads the keys of the top-level
+    object up to the start of the 'detections' list, then 'iter_images' to read the detections one image at a time.
+    ```
+    with open('000000.json', 'rb') as fp:
+        reader = SequenceReader(fp)
+        header = reader.read_header()
+        for img_dets in reader.iter_images():
+            ...
+    ```
+    Any keys after the 'detections' list are added to 'header' once all the images have been read.
+    Syntax errors are raised as ValueError as soon as they are reached, giving the image and the position in the file.
+    """
+
+    def __init__(self, fp, chunk_size=1 << 20, name=None):
+        """
+        :param fp: The file to read, opened in either binary or text mode. Binary files are decoded as utf-8.
+        :param chunk_size: The amount to read from the file at a time
+        :param name: The name of the sequence, to include in error messages. Optional.
+        """
+        self.header = {}
+        self.has_detections = False
+        self.bytes_read = 0     # Characters rather than bytes if the file is in text mode
+        self.name = name
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._json_decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._offset = 0        # The number of characters dropped from the start of the buffer
+        self._img_idx = 0
+        self._eof = False
+        self._in_detections = False
+        self._need_comma = False
+
+    def read_header(self):
+        """
+        Read the start of the file, up to the start of the detections.
+        If there is no 'detections' key, this reads the whole file, and 'has_detections' is False.
+        :return: A dict of the keys read so far, other than 'detections'
+        """
+        self._expect('{')
+        self._read_members()
+        return self.header
+
+    def iter_images(self):
+        """
+        Read the detections list, one image at a time. Call 'read_header' first.
+        Once the end of the list is reached, the rest of the file is read, adding any further keys to the header.
+        :return: A generator of the list of detections for each image
+        """
+        self._img_idx = 0
+        while self._in_detections:
+            if self._peek() == ']':
+                self._pos += 1
+                self._in_detections = False
+                self._read_members()
+                return
+            if self._img_idx > 0:
+                self._expect(',')
+            yield self._decode_value()
+            self._img_idx += 1
+
+    def _read_members(self):
+        """
+        Read key-value pairs of the top-level object, adding them to the header,
+        until either the start of the detections list or the end of the object.
+        :return:
+        """
+        while True:
+            if self._peek() == '}':
+                self._pos += 1
+                self._skip_whitespace()
+                if self._pos < len(self._buffer):
+                    raise self._make_error("Extra data after the end of the sequence: {0!r}".format(
+                        self._buffer[self._pos:self._pos + 20]))
+                return
+            if self._need_comma:
+                self._expect(',')
+            key = self._decode_value()
+            if not isinstance(key, type(u'')):
+                raise self._make_error("Expected a key, found {0!r}".format(key))
+            self._expect(':')
+            self._need_comma = True
+            if key == 'detections':
+                if self._peek() != '[':
+                    raise self._make_error("'detections' must be a list")
+                self._pos += 1
+                self.has_detections = True
+                self._in_detections = True
+                return
+            self.header[key] = self._decode_value()
+
+    def _decode_value(self):
+        """
+        Decode the next json value from the buffer, reading more of the file until the whole value is available.
+        An error in the middle of the buffer is raised straight away, rather than reading the rest of the file.
+        :return: The decoded value
+        """
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+            except ValueError as error:
+                # The value may just be incomplete, if the error is at the end of what has been read so far.
+                # Unterminated strings are reported at the start of the string, so they may be incomplete too.
+                message = getattr(error, 'msg', str(error))
+                error_pos = getattr(error, 'pos', len(self._buffer))
+                invalid = self._make_error(message, error_pos)
+                if (error_pos >= len(self._buffer) - _INCOMPLETE_MARGIN or
+                        message.startswith('Unterminated string')) and self._fill():
+                    continue
+                raise invalid
+            if end >= len(self._buffer) - _INCOMPLETE_MARGIN and not self._eof:
+                # The value ends near the end of the buffer, so it may be a number that continues, such as '1.5e-07'
+                # cut off after '1.5'. Decode it again with more data, which also moves the buffer, even at the end.
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def _peek(self):
+        """
+        :return: The next character that is not whitespace, without consuming it, or '' at the end of the file
+        """
+        self._skip_whitespace()
+        return self._buffer[self._pos] if self._pos < len(self._buffer) else ''
+
+    def _expect(self, char):
+        """
+        Consume the next non-whitespace character, which must be a particular character
+        :param char: The expected character
+        :return: The character
+        """
+        found = self._peek()
+        if found != char:
+            raise self._make_error("Expected '{0}' but found {1}".format(
+                char, repr(found) if found != '' else 'the end of the file'))
+        self._pos += 1
+        return found
+
+    def _skip_whitespace(self):
+        """
+        Move past any whitespace, reading more of the file if the buffer runs out.
+        :return:
+        """
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._fill():
+                return
+
+    def _fill(self):
+        """
+        Read more of the file into the buffer, dropping the part of the buffer that has been consumed.
+        At least as much as is left in the buffer is read, so that a value spanning many reads is decoded
+        a logarithmic number of times, rather than once per read.
+        :return: True if more was read, False at the end of the file
+        """
+        if self._eof:
+            return False
+        data = self._fp.read(max(self._chunk_size, len(self._buffer) - self._pos))
+        self.bytes_read += len(data)
+        if len(data) <= 0:
+            self._eof = True
+        if isinstance(data, bytes):
+            data = self._text_decoder.decode(data, final=self._eof)
+        self._offset += self._pos
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+        return not self._eof
+
+    def _make_error(self, message, pos=None):
+        """
+        Make an error for invalid json, saying where it is in the file
+        :param message: The error message
+        :param pos: The position of the error in the buffer, defaults to the current position
+        :return: A ValueError to raise
+        """
+        location = 'image {0}'.format(self._img_idx) if self._in_detections else 'the sequence keys'
+        return ValueError("{0}Invalid json in {1}, at character {2} of the file: {3}".format(
+            '' if self.name is None else '{0} : '.format(self.name), location,
+            self._offset + (self._pos if pos is None else pos), message))
+
+
+def read_trailing_keys(fp, file_size, key, max_size=TRAILING_KEYS_SIZE):
+    """
+    Find a key that comes after the 'detections' list, by reading only the end of the file.
+    This is much faster than reading through all the detections to get to it, for files where the classes are last.
+    The file position is restored afterwards.
+    :param fp: The file, opened in binary mode. It must be seekable.
+    :param file_size: The size of the file in bytes
+    :param key: The key to look for, such as 'classes'
+    :param max_size: How much of the end of the file to read
+    :return: A dict of the key and any keys after it, or None if the key could not be found near the end of the file
+    """
+    position = fp.tell()
+    try:
+        fp.seek(max(file_size - max_size, 0))
+        tail = fp.read().decode('utf-8', errors='replace')
+    finally:
+        fp.seek(position)
+
+    # Try each place the key could start, from the last. The key must follow a comma, since detections come first
+    pattern = re.compile(r',[ \t\n\r]*({0}[ \t\n\r]*:)'.format(re.escape(json.dumps(key))))
+    for match in reversed(list(pattern.finditer(tail))):
+        try:
+            members = json.loads('{' + tail[match.start(1):])
+        except ValueError:
+            continue
+        if isinstance(members, dict) and key in members:
+            return members
+    return None
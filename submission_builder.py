@@ -77,12 +77,34 @@ from __future__ import absolute_import, division, print_function
 import os
 import os.path
 import json
+import hashlib
+import threading
+import zipfile
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# The name of the file recording which sequences have been written, see SubmissionWriter.
+# This must match submission_validator.MANIFEST_NAME
+MANIFEST_NAME = 'manifest.json'
 
 # Load numpy if it is available
 try:
     import numpy as np
 except ImportError:
     np = None
+else:
+    # The covariance checks need numpy. Import relative to the package when the starter kit is imported as one
+    try:
+        from . import covariance_checks
+        from . import submission_validator
+        from . import sequence_arrays
+    except ImportError:
+        import covariance_checks
+        import submission_validator
+        import sequence_arrays
 
 
 def make_detection(class_probabilities, xmin, ymin, xmax, ymax, upper_left_cov=None, lower_right_cov=None):
@@ -169,6 +191,84 @@ def make_detection_height_width(class_probabilities, x, y, width, height, upper_
     return make_detection(class_probabilities, x, y, x + width, y + height, upper_left_cov, lower_right_cov)
 
 
+def make_detections(class_probabilities, boxes, covars=None):
+    """
+    Batch form of make_detection, above, creating all the detections for an image at once.
+    Each argument is an array with one row per detection, all the checks and the normalization
+    are done on the whole array at once, which is much faster than calling make_detection for each box.
+    Requires numpy.
+
+    :param class_probabilities: An N x C array of class probabilities, one row for each detection
+    :param boxes: An N x 4 array of bounding boxes, as [xmin, ymin, xmax, ymax] for each detection
+    :param covars: An N x 2 x 2 x 2 array of covariances, the upper-left and lower-right covariance for each detection.
+    Optional.
+    :return: A list of N detections, in the same form as make_detection
+    """
+    class_probabilities, boxes, covars = check_detection_arrays(class_probabilities, boxes, covars)
+    detections = [
+        {'label_probs': probs, 'bbox': bbox}
+        for probs, bbox in zip(class_probabilities.tolist(), boxes.tolist())
+    ]
+    if covars is not None:
+        for detection, detection_covars in zip(detections, covars.tolist()):
+            detection['covars'] = detection_covars
+    return detections
+
+
+def check_detection_arrays(class_probabilities, boxes, covars=None):
+    """
+    Check and normalize arrays of detections, as passed to make_detections.
+    Raises a ValueError identifying the first invalid detection.
+    Requires numpy.
+
+    :param class_probabilities: An N x C array of class probabilities, one row for each detection
+    :param boxes: An N x 4 array of bounding boxes, as [xmin, ymin, xmax, ymax] for each detection
+    :param covars: An N x 2 x 2 x 2 array of upper-left and lower-right covariances for each detection. Optional.
+    :return: The normalized class probabilities, the boxes, and the covariances, as numpy arrays.
+    """
+    if np is None:
+        raise ImportError("Checking arrays of detections requires numpy")
+    class_probabilities = np.asarray(class_probabilities, dtype=np.float64)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    num_detections = boxes.shape[0] if boxes.ndim > 0 else 0
+
+    if class_probabilities.ndim != 2 or class_probabilities.shape[0] != num_detections:
+        raise ValueError("Class probabilities must be an N x C array, with a row for each box")
+    if boxes.shape != (num_detections, 4):
+        raise ValueError("Boxes must be an N x 4 array")
+
+    # Check the corners are ordered correctly, reporting the first bad box
+    bad_boxes = np.nonzero(boxes[:, 2] < boxes[:, 0])[0]
+    if len(bad_boxes) > 0:
+        raise ValueError("xmax is less than xmin for detection {0}".format(bad_boxes[0]))
+    bad_boxes = np.nonzero(boxes[:, 3] < boxes[:, 1])[0]
+    if len(bad_boxes) > 0:
+        raise ValueError("ymax is less than ymin for detection {0}".format(bad_boxes[0]))
+
+    # Normalize each row of class probabilities
+    total_probs = np.sum(class_probabilities, axis=1, keepdims=True)
+    bad_probs = np.nonzero(total_probs[:, 0] <= 0)[0]
+    if len(bad_probs) > 0:
+        raise ValueError("The class probabilities for detection {0} do not sum to more than 0".format(bad_probs[0]))
+    class_probabilities = class_probabilities / total_probs
+
+    if covars is not None:
+        covars = np.asarray(covars, dtype=np.float64)
+        if covars.shape != (num_detections, 2, 2, 2):
+            raise ValueError("Covariances must be an N x 2 x 2 x 2 array")
+        # Check both corners of all the detections at once, each mask is N x 2
+        corners = ['upper-left', 'lower-right']
+        bad_covar = covariance_checks.first_failure(covariance_checks.is_symmetric_mask(covars))
+        if bad_covar is not None:
+            raise ValueError("The {0} covariance for detection {1} is not symmetric".format(
+                corners[bad_covar[1]], bad_covar[0]))
+        bad_covar = covariance_checks.first_failure(covariance_checks.is_positive_semi_definite_mask(covars))
+        if bad_covar is not None:
+            raise ValueError("The {0} covariance for detection {1} is not positive definite".format(
+                corners[bad_covar[1]], bad_covar[0]))
+    return class_probabilities, boxes, covars
+
+
 def make_sequence_output(detections, classes):
     """
     Create the output object for an entire sequence
@@ -177,12 +277,250 @@ def make_sequence_output(detections, classes):
     :param classes: The list of classes in the order they appear in the label probabilities
     :return:
     """
+    # Classes come first, matching the documented format, so that files can be written and read one image at a time.
+    # Files from earlier versions had the detections first, so the bytes differ, but the json values are the same.
     return {
-        'detections': detections,
-        'classes': classes
+        'classes': classes,
+        'detections': detections
     }
 
 
+def check_class_indices(class_indices, class_probabilities, num_classes):
+    """
+    Check the class indices for sparse class probabilities, such as the top-k classes for each detection.
+    Each detection must have a probability for each of its classes, and each class can only appear once.
+    Requires numpy.
+
+    :param class_indices: An N x K array of class indices, which class each of the class probabilities is for.
+    :param class_probabilities: The matching N x K array of class probabilities
+    :param num_classes: The number of classes, each class index must be less than this.
+    :return: The class indices as a numpy integer array
+    """
+    if np is None:
+        raise ImportError("Checking arrays of detections requires numpy")
+    class_indices = np.asarray(class_indices)
+    if class_indices.shape != np.shape(class_probabilities):
+        raise ValueError("Class indices must be the same shape as the class probabilities")
+    if class_indices.size > 0:
+        if not np.issubdtype(class_indices.dtype, np.integer):
+            raise ValueError("Class indices must be integers")
+        bad_indices = np.nonzero(np.any((class_indices < 0) | (class_indices >= num_classes), axis=1))[0]
+        if len(bad_indices) > 0:
+            raise ValueError("The class indices for detection {0} are outside the class list".format(bad_indices[0]))
+        sorted_indices = np.sort(class_indices, axis=1)
+        bad_indices = np.nonzero(np.any(sorted_indices[:, 1:] == sorted_indices[:, :-1], axis=1))[0]
+        if len(bad_indices) > 0:
+            raise ValueError("The class indices for detection {0} contain duplicates".format(bad_indices[0]))
+    return class_indices.astype(np.int64)
+
+
+def make_class_projection(class_list):
+    """
+    Work out how to map the classes of a detector onto the challenge classes, see submission_validator.CLASSES.
+    Class names are matched using submission_validator.get_class_id, so synonyms like 'tv' are recognised.
+    Classes that are not part of the challenge are dropped.
+    The result is used to pick the columns of an N x C array of class probabilities in one indexing operation:
+    ```
+    projection, projected_classes = make_class_projection(model_classes)
+    challenge_probabilities = class_probabilities[:, projection]
+    ```
+    Requires numpy.
+
+    :param class_list: The list of class names output by the detector, in order
+    :return: An array of indices in the class list, the column for each of the projected classes,
+    and the list of the projected class names, as they appear in submission_validator.CLASSES
+    """
+    projection = []
+    projected_classes = []
+    source_classes = {}
+    for idx, class_name in enumerate(class_list):
+        class_id = submission_validator.get_class_id(class_name)
+        if class_id is None:
+            continue
+        if class_id in source_classes:
+            raise ValueError("Classes '{0}' and '{1}' are both the challenge class '{2}'".format(
+                source_classes[class_id], class_name, submission_validator.CLASSES[class_id]))
+        source_classes[class_id] = class_name
+        projection.append(idx)
+        projected_classes.append(submission_validator.CLASSES[class_id])
+    if len(projection) <= 0:
+        raise ValueError("None of the classes are challenge classes")
+    return np.array(projection, dtype=np.int64), projected_classes
+
+
+def round_probabilities(class_probabilities, significant_digits=6):
+    """
+    Round class probabilities to a number of significant digits, keeping the total of each row at most 1.
+    Rounding each probability separately can push the total over 1, which the validator warns about,
+    so any excess is taken off the largest probability in the row, in steps of its last digit.
+    The validator adds up the probabilities as float32, so the total is kept far enough below 1
+    that the float32 sum cannot be over 1, whatever order the classes are in.
+    Requires numpy.
+
+    :param class_probabilities: An N x C array of class probabilities, each row summing to at most 1
+    :param significant_digits: The number of significant digits to keep
+    :return: An N x C array of the rounded probabilities
+    """
+    class_probabilities = np.asarray(class_probabilities, dtype=np.float64)
+    significant_digits = int(significant_digits)
+    if class_probabilities.size <= 0:
+        return class_probabilities
+
+    # The smallest step in the last digit kept for each probability, zero where the probability is zero
+    is_positive = class_probabilities > 0
+    exponents = np.floor(np.log10(np.where(is_positive, class_probabilities, 1.0)))
+    quanta = np.where(is_positive, np.power(10.0, exponents - significant_digits + 1), 0.0)
+    rounded = np.where(is_positive, np.round(class_probabilities / np.where(is_positive, quanta, 1.0)) * quanta, 0.0)
+
+    # Take the excess off the largest probability, in whole steps of its last digit.
+    # Adding up C float32 values is out by less than C * 2^-24, so rows changed by rounding are kept below 1
+    # by that much. Rows that rounding did not change are left as they were given.
+    is_changed = ~np.all(np.isclose(rounded, class_probabilities, rtol=1e-12, atol=0), axis=1)
+    limit = np.where(is_changed, 1.0 - class_probabilities.shape[1] * np.finfo(np.float32).eps / 2, 1.0)
+    excess = np.sum(rounded, axis=1) - limit
+    rows = np.nonzero(excess > 0)[0]
+    if len(rows) > 0:
+        largest = np.argmax(rounded[rows], axis=1)
+        steps = quanta[rows, largest]
+        rounded[rows, largest] = np.maximum(rounded[rows, largest] - np.ceil(excess[rows] / steps) * steps, 0.0)
+    return rounded
+
+
+def encode_detections(class_probabilities, boxes, covars=None, has_covars=None, significant_digits=6):
+    """
+    Encode the detections for an image as compact json text, in the same form as make_detections
+    but without spaces, and with the class probabilities and boxes rounded to a given number of significant digits.
+    All the numbers are formatted in a single operation, rather than one float at a time.
+    Rounding cannot swap the order of the box corners, but it could make a covariance that is only just positive
+    semi-definite invalid, so covariances are written at full precision.
+    The class probabilities are rounded so that they still sum to at most 1, see round_probabilities.
+    Requires numpy.
+
+    :param class_probabilities: An N x C array of class probabilities, already normalized
+    :param boxes: An N x 4 array of bounding boxes, as [xmin, ymin, xmax, ymax]
+    :param covars: An N x 2 x 2 x 2 array of covariances for each detection. Optional.
+    :param has_covars: A boolean array of length N, which of the detections have covariances.
+    Defaults to all the detections if covariances are given.
+    :param significant_digits: The number of significant digits for the class probabilities and boxes
+    :return: A string containing a json list of detections
+    """
+    class_probabilities = np.asarray(class_probabilities, dtype=np.float64)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    num_detections = len(boxes)
+    if num_detections <= 0:
+        return '[]'
+    if covars is None:
+        covars = np.zeros((num_detections, 2, 2, 2))
+        has_covars = np.zeros(num_detections, dtype=bool)
+    elif has_covars is None:
+        has_covars = np.ones(num_detections, dtype=bool)
+
+    # Round the probabilities here rather than in the template, so that each row still sums to at most 1
+    class_probabilities = round_probabilities(class_probabilities, significant_digits)
+
+    # Build a template for each detection, with or without covariances
+    number_format = '%.{0}g'.format(int(significant_digits))
+    detection_template = '{{"label_probs":[{0}],"bbox":[{1}]'.format(
+        ','.join([number_format] * class_probabilities.shape[1]), ','.join([number_format] * 4))
+    templates = [detection_template + '}', detection_template + ',"covars":[[[%r,%r],[%r,%r]],[[%r,%r],[%r,%r]]]}']
+    template = '[' + ','.join([templates[1] if has_cov else templates[0] for has_cov in has_covars.tolist()]) + ']'
+
+    # Flatten all the values in the order they appear in the template, leaving out the missing covariances
+    values = np.concatenate([class_probabilities, boxes, np.reshape(covars, (num_detections, 8))], axis=1)
+    mask = np.ones(values.shape, dtype=bool)
+    mask[:, -8:] = has_covars[:, np.newaxis]
+    return template % tuple(values[mask].tolist())
+
+
+def non_max_suppression(class_probabilities, boxes, iou_threshold=0.5, score_threshold=0.0):
+    """
+    Class-aware non-maximum suppression for the detections in an image.
+    The class of each detection is the most likely class, and its score is the probability of that class.
+    Detections with a score below the score threshold are dropped, then, going from the highest score down,
+    each remaining detection suppresses the lower-scoring detections of the same class that overlap it by more than
+    the IoU threshold. Each detection is compared to all the others at once, only the loop over the survivors
+    is in python.
+    Requires numpy.
+
+    :param class_probabilities: An N x C array of class probabilities
+    :param boxes: An N x 4 array of bounding boxes, as [xmin, ymin, xmax, ymax]
+    :param iou_threshold: Detections that overlap a better detection of the same class by more than this are removed
+    :param score_threshold: Detections with a most likely class probability less than this are removed
+    :return: The indices of the detections that are kept, in order, and for each detection, the index of the kept
+    detection that suppressed it (or its own index if it is kept), or -1 if it was below the score threshold.
+    """
+    class_probabilities = np.asarray(class_probabilities)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    num_detections = len(boxes)
+    suppressed_by = np.full(num_detections, -1, dtype=np.int64)
+    if num_detections <= 0:
+        return np.zeros(0, dtype=np.int64), suppressed_by
+    labels = np.argmax(class_probabilities, axis=1)
+    scores = class_probabilities[np.arange(num_detections), labels]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+    is_open = scores >= score_threshold
+    for idx in np.argsort(-scores, kind='stable'):
+        if not is_open[idx]:
+            continue
+        suppressed_by[idx] = idx
+        is_open[idx] = False
+        candidates = np.nonzero(is_open & (labels == labels[idx]))[0]
+        if len(candidates) <= 0:
+            continue
+        widths = np.minimum(boxes[candidates, 2], boxes[idx, 2]) - np.maximum(boxes[candidates, 0], boxes[idx, 0])
+        heights = np.minimum(boxes[candidates, 3], boxes[idx, 3]) - np.maximum(boxes[candidates, 1], boxes[idx, 1])
+        intersection = np.maximum(widths, 0) * np.maximum(heights, 0)
+        union = areas[candidates] + areas[idx] - intersection
+        overlapping = candidates[intersection > iou_threshold * union]
+        suppressed_by[overlapping] = idx
+        is_open[overlapping] = False
+    return np.nonzero(suppressed_by == np.arange(num_detections))[0], suppressed_by
+
+
+def merge_covariances(class_probabilities, boxes, covars, has_covars, suppressed_by):
+    """
+    Merge the corner covariances of suppressed detections into the detection that suppressed them,
+    see non_max_suppression. The box of the kept detection does not change, and its covariance becomes the
+    covariance of the corners of all the detections it suppressed, weighted by their scores:
+    the average of their covariances plus the spread of their corners around the kept corners.
+    Detections without covariances count as having zero covariance.
+    Requires numpy.
+
+    :param class_probabilities: An N x C array of class probabilities
+    :param boxes: An N x 4 array of bounding boxes
+    :param covars: An N x 2 x 2 x 2 array of covariances
+    :param has_covars: A boolean array, which detections have covariances
+    :param suppressed_by: The index of the kept detection for each detection, or -1, from non_max_suppression
+    :return: The new covariances and has_covars arrays for all N detections.
+    Only the detections that suppressed something with covariances change.
+    """
+    covars = np.array(covars, dtype=np.float64)
+    has_covars = np.array(has_covars, dtype=bool)
+    merged = np.nonzero(suppressed_by >= 0)[0]
+    survivors = suppressed_by[merged]
+    weights = np.max(class_probabilities, axis=1)[merged]
+
+    # The offset of each corner from the corners of the kept box, as N x 2 corners x 2 coordinates
+    offsets = (np.asarray(boxes, dtype=np.float64)[merged] - np.asarray(boxes, dtype=np.float64)[survivors])
+    offsets = offsets.reshape((-1, 2, 2))
+    contributions = np.where(has_covars[merged, np.newaxis, np.newaxis, np.newaxis], covars[merged], 0)
+    contributions = contributions + offsets[:, :, :, np.newaxis] * offsets[:, :, np.newaxis, :]
+
+    totals = np.zeros(covars.shape, dtype=np.float64)
+    np.add.at(totals, survivors, weights[:, np.newaxis, np.newaxis, np.newaxis] * contributions)
+    total_weights = np.zeros(len(covars), dtype=np.float64)
+    np.add.at(total_weights, survivors, weights)
+
+    # Only merge into detections that suppressed at least one detection with covariances
+    any_covars = np.zeros(len(covars), dtype=bool)
+    any_covars[survivors[has_covars[merged]]] = True
+    update = any_covars & (np.bincount(survivors, minlength=len(covars)) > 1) & (total_weights > 0)
+    covars[update] = totals[update] / total_weights[update, np.newaxis, np.newaxis, np.newaxis]
+    has_covars[update] = True
+    return covars, has_covars
+
+
 def make_simple_covariance(xvar, yvar):
     """
     Make simple spherical covariance, as can be passed as upper_left_cov or lower_right_cov.
@@ -219,18 +557,265 @@ def is_positive_definite(mat):
     """
     Check if a matrix is positive semi-definite, that is, all it's eigenvalues are positive.
     All covariance matrices must be positive semi-definite.
-    Only works on symmetric matrices (due to eigh), so check that first
+    Only works on symmetric 2x2 matrices (uses the lower triangle), so check that first
     :param mat:
     :return:
     """
     if np is not None:
-        mat = np.asarray(mat)
-        eigvals, _ = np.linalg.eigh(mat)
-        return np.all(eigvals >= -1e-14)
+        return bool(covariance_checks.is_positive_semi_definite_mask(mat))
     # Numpy is unavailable, assume the matrix is valid
     return True
 
 
+class _DetectionStore(object):
+    """
+    Accumulated detections, stored in growable, contiguous numpy arrays rather than as a dict per detection.
+    Detections are appended in order, and the image offsets mark where each finished image starts and ends.
+    Detections after the last image offset belong to the image that is still being built.
+
+    Class probabilities are stored either densely, as a row of the 'probs' array,
+    or sparsely, as (detection, class, probability) triples for only the given classes.
+    'prob_index' is the row in 'probs' for each dense detection, and -1 for the sparse ones.
+    Sparse detections are only expanded to the full class list when the image is read back.
+    Probabilities are kept as float64, so that they are written at full precision, with the same values as json.dump.
+    Everything is stored as floats, so integer boxes or covariances are written as 1.0 rather than 1.
+    """
+
+    def __init__(self, num_classes, capacity=256):
+        self.num_classes = num_classes
+        self.size = 0
+        self.image_offsets = [0]
+        self.boxes = np.zeros((capacity, 4), dtype=np.float64)
+        self.covars = np.zeros((capacity, 2, 2, 2), dtype=np.float64)
+        self.has_covars = np.zeros(capacity, dtype=bool)
+        self.prob_index = np.zeros(capacity, dtype=np.int64)
+
+        self.num_dense = 0
+        self.probs = np.zeros((capacity, num_classes), dtype=np.float64)
+
+        self.num_sparse = 0
+        self.sparse_detections = np.zeros(0, dtype=np.int64)
+        self.sparse_classes = np.zeros(0, dtype=np.int64)
+        self.sparse_probs = np.zeros(0, dtype=np.float64)
+        self._dense_buffer = np.zeros((0, num_classes), dtype=np.float64)
+
+    @property
+    def num_images(self):
+        """
+        :return: The number of finished images
+        """
+        return len(self.image_offsets) - 1
+
+    @property
+    def num_pending(self):
+        """
+        :return: The number of detections added to the current, unfinished, image
+        """
+        return self.size - self.image_offsets[-1]
+
+    def append(self, class_probabilities, boxes, covars=None, class_indices=None):
+        """
+        Add detections to the current image. The arguments must already be checked, see check_detection_arrays.
+        :param class_probabilities: N x C array of normalized class probabilities,
+        or N x K if class indices are given.
+        :param boxes: N x 4 array of bounding boxes
+        :param covars: N x 2 x 2 x 2 array of covariances, or None
+        :param class_indices: N x K array of the classes for each of the class probabilities, or None if they are dense.
+        Entries with class index -1 are left out.
+        :return:
+        """
+        num_new = len(boxes)
+        end = self.size + num_new
+        self._reserve(['boxes', 'covars', 'has_covars', 'prob_index'], end)
+        self.boxes[self.size:end] = boxes
+        if covars is not None:
+            self.covars[self.size:end] = covars
+            self.has_covars[self.size:end] = True
+        else:
+            self.has_covars[self.size:end] = False
+
+        if class_indices is None:
+            dense_end = self.num_dense + num_new
+            self._reserve(['probs'], dense_end)
+            self.probs[self.num_dense:dense_end] = class_probabilities
+            self.prob_index[self.size:end] = np.arange(self.num_dense, dense_end)
+            self.num_dense = dense_end
+        else:
+            class_indices = np.asarray(class_indices)
+            detection_ids = np.repeat(np.arange(self.size, end), class_indices.shape[1])
+            class_indices = class_indices.ravel()
+            class_probabilities = np.ravel(class_probabilities)
+            keep = class_indices >= 0
+            if not np.all(keep):
+                detection_ids = detection_ids[keep]
+                class_indices = class_indices[keep]
+                class_probabilities = class_probabilities[keep]
+            sparse_end = self.num_sparse + len(class_indices)
+            self._reserve(['sparse_detections', 'sparse_classes', 'sparse_probs'], sparse_end)
+            self.sparse_detections[self.num_sparse:sparse_end] = detection_ids
+            self.sparse_classes[self.num_sparse:sparse_end] = class_indices
+            self.sparse_probs[self.num_sparse:sparse_end] = class_probabilities
+            self.prob_index[self.size:end] = -1
+            self.num_sparse = sparse_end
+        self.size = end
+
+    def end_image(self):
+        """
+        Finish the current image, further detections will be added to the next image.
+        :return:
+        """
+        self.image_offsets.append(self.size)
+
+    def get_arrays(self):
+        """
+        Get the arrays of detections for all the finished images, with the sparse class probabilities expanded.
+        :return: The class probabilities, boxes, covariances, and whether each detection has covariances
+        """
+        end = self.image_offsets[-1]
+        return self._get_probs(0, end), self.boxes[:end], self.covars[:end], self.has_covars[:end]
+
+    def get_pending_arrays(self):
+        """
+        Get the arrays of detections for the current, unfinished image, see get_image_arrays.
+        :return: The class probabilities, boxes, covariances, and whether each detection has covariances
+        """
+        start = self.image_offsets[-1]
+        return self._get_probs(start, self.size), self.boxes[start:self.size], self.covars[start:self.size], \
+            self.has_covars[start:self.size]
+
+    def filter_pending(self, keep, covars=None, has_covars=None):
+        """
+        Remove detections from the current, unfinished image, keeping the rest in order.
+        :param keep: The indices of the detections to keep, in increasing order, counting from the start of the image
+        :param covars: New covariances for all the detections in the image, or None to leave them unchanged
+        :param has_covars: Whether each detection in the image has covariances, given with covars
+        :return:
+        """
+        start = self.image_offsets[-1]
+        keep = np.asarray(keep, dtype=np.int64)
+        end = start + len(keep)
+        if covars is not None:
+            self.covars[start:self.size] = covars
+            self.has_covars[start:self.size] = has_covars
+        old_ids = start + keep
+        self.boxes[start:end] = self.boxes[old_ids]
+        self.covars[start:end] = self.covars[old_ids]
+        self.has_covars[start:end] = self.has_covars[old_ids]
+
+        # The dense rows for the image are at the end of the probs array, move the kept rows down
+        prob_index = self.prob_index[old_ids]
+        is_dense = prob_index >= 0
+        dense_start = self.num_dense - int(np.count_nonzero(self.prob_index[start:self.size] >= 0))
+        dense_end = dense_start + int(np.count_nonzero(is_dense))
+        self.probs[dense_start:dense_end] = self.probs[prob_index[is_dense]]
+        prob_index[is_dense] = np.arange(dense_start, dense_end)
+        self.prob_index[start:end] = prob_index
+        self.num_dense = dense_end
+
+        # Likewise, the sparse entries for the image are at the end, drop those for removed detections
+        first = int(np.searchsorted(self.sparse_detections[:self.num_sparse], start))
+        new_ids = np.full(self.size - start, -1, dtype=np.int64)
+        new_ids[keep] = np.arange(start, end)
+        sparse_ids = new_ids[self.sparse_detections[first:self.num_sparse] - start]
+        is_kept = sparse_ids >= 0
+        sparse_end = first + int(np.count_nonzero(is_kept))
+        self.sparse_classes[first:sparse_end] = self.sparse_classes[first:self.num_sparse][is_kept]
+        self.sparse_probs[first:sparse_end] = self.sparse_probs[first:self.num_sparse][is_kept]
+        self.sparse_detections[first:sparse_end] = sparse_ids[is_kept]
+        self.num_sparse = sparse_end
+        self.size = end
+
+    def get_image(self, img_idx):
+        """
+        Build the list of detection dicts for a finished image, for serialization.
+        :param img_idx: The index of the image
+        :return: A list of detections, in the same form as make_detection
+        """
+        probs, boxes, covars, has_covars = self.get_image_arrays(img_idx)
+        detections = [
+            {'label_probs': det_probs, 'bbox': bbox}
+            for det_probs, bbox in zip(probs.tolist(), boxes.tolist())
+        ]
+        for det_idx in np.nonzero(has_covars)[0]:
+            detections[det_idx]['covars'] = covars[det_idx].tolist()
+        return detections
+
+    def get_image_arrays(self, img_idx):
+        """
+        Get the arrays of detections for a finished image.
+        The boxes and covariances are views, not copies. If any of the detections are sparse,
+        the class probabilities are expanded into a buffer that is re-used by the next call.
+        :param img_idx: The index of the image
+        :return: The class probabilities, boxes, covariances, and whether each detection has covariances
+        """
+        start = self.image_offsets[img_idx]
+        end = self.image_offsets[img_idx + 1]
+        return self._get_probs(start, end), self.boxes[start:end], self.covars[start:end], self.has_covars[start:end]
+
+    def _get_probs(self, start, end):
+        """
+        Get the full class probabilities for a range of detections
+        :param start: The first detection
+        :param end: The detection after the last one
+        :return: An (end - start) x C array of class probabilities
+        """
+        if self.num_sparse <= 0:
+            # Every detection is dense, so the rows of probs line up with the detections
+            return self.probs[start:end]
+        self._reserve(['_dense_buffer'], end - start)
+        dense = self._dense_buffer[:end - start]
+        dense[:] = 0
+        prob_index = self.prob_index[start:end]
+        is_dense = prob_index >= 0
+        dense[is_dense] = self.probs[prob_index[is_dense]]
+
+        # The sparse entries are in detection order, so those for this range are contiguous
+        first, last = np.searchsorted(self.sparse_detections[:self.num_sparse], [start, end])
+        dense[self.sparse_detections[first:last] - start, self.sparse_classes[first:last]] = \
+            self.sparse_probs[first:last]
+        return dense
+
+    def _reserve(self, attrs, capacity):
+        """
+        Make sure there is space for a given number of entries, growing the arrays if necessary.
+        Capacity is doubled each time so that appending is amortized constant time.
+        :param attrs: The names of the arrays to grow
+        :param capacity: The required number of entries
+        :return:
+        """
+        for attr in attrs:
+            old = getattr(self, attr)
+            if capacity > len(old):
+                new = np.zeros((max(capacity, 2 * len(old)),) + old.shape[1:], dtype=old.dtype)
+                new[:len(old)] = old
+                setattr(self, attr, new)
+
+
+class _HashingWriter(object):
+    """
+    Wraps a binary output file, encoding the text written to it,
+    and keeping track of the number of bytes written and their sha256 hash.
+    This lets the hash of a sequence file be recorded without reading it back.
+    """
+
+    def __init__(self, fp):
+        self._fp = fp
+        self._hash = hashlib.sha256()
+        self.num_bytes = 0
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self._fp.write(data)
+        self._hash.update(data)
+        self.num_bytes += len(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def close(self):
+        self._fp.close()
+
+
 class SubmissionWriter(object):
     """
     A helper class to handle writing ACRV Robotic Vision Challenge 1 submissions in the correct format.
@@ -239,33 +824,188 @@ class SubmissionWriter(object):
     and 'save_sequence' after each sequence. e.g.:
     ```
     writer = submission_builder.SubmissionWriter('submission', classes)
-    for sequence_name in os.listdir('test_dir'):
+    for sequence_name in sorted(os.listdir('test_dir')):
         if not sequence_name.endswith('.zip'):
-            for image_file in os.listdir(os.path.join('test_dir', sequence_name)):
+            for image_file in sorted(os.listdir(os.path.join('test_dir', sequence_name))):
                 detections = do_detection(image_file, ...)
                 for detection in detections:
                     writer.add_detection(...)
                 writer.next_image()
             writer.save_sequence(sequence_name)
     ```
+    The images must be given in sorted order, os.listdir does not sort them. To read the images in order
+    on background threads, while the detector runs, see sequence_iterator.SequenceIterator.
+    If your detector produces arrays of detections, use 'add_detections' to add a whole image at once.
+    If it only gives probabilities for a few classes per detection (say the top 5), pass those and their indices
+    in the class list as 'class_indices', the full list of class probabilities is only built when writing.
+    Detections are accumulated in numpy arrays, so the writer requires numpy.
+
+    If the detector was trained on a different set of classes (such as COCO), pass 'project_classes=True'
+    with the detector's class list. The class probabilities are then given in the detector's class order,
+    and only the columns for the challenge classes are written, see make_class_projection.
+
+    If the detector produces many overlapping boxes, pass 'nms_iou_threshold' to remove them in 'next_image',
+    before the image is stored or written, see non_max_suppression. Detections of the same most likely class
+    that overlap a better one by more than the threshold are removed, as are those with scores below
+    'nms_score_threshold'. With 'nms_merge_covars=True', the covariances of the removed boxes are merged into the
+    box that replaced them, see merge_covariances.
+
+    For long sequences, pass 'streaming=True' to write each image to file as it is finished,
+    rather than holding the whole sequence in memory. This requires calling 'start_sequence' before each sequence:
+    ```
+    writer = submission_builder.SubmissionWriter('submission', classes, streaming=True)
+    for sequence_name in ...:
+        writer.start_sequence(sequence_name)
+        for image_file in ...:
+            ...
+            writer.next_image()
+        writer.save_sequence(sequence_name)
+    ```
+
+    To keep inference from waiting on encoding and writing files, pass 'background=True',
+    which does all the writing on a background thread. Then call 'close' at the end, or use it as a context manager,
+    to wait for the files to be finished:
+    ```
+    with submission_builder.SubmissionWriter('submission', classes, background=True) as writer:
+        ...
+    ```
 
 
-    To create the final submission zip file (on linux/unix), simply cd into the submission folder and run
+    To create the final submission zip file directly, give a path ending in '.zip' instead of a folder,
+    and call 'close' (or use the writer as a context manager) when done:
+    ```
+    with submission_builder.SubmissionWriter('submission.zip', classes) as writer:
+        ...
+    ```
+    Alternatively, write to a folder, then to create the final submission zip file (on linux/unix),
+    simply cd into the submission folder and run
     ```
     zip -r submission.zip ./*
     ```
+
+    To analyse the detections before submitting them, pass 'output_format='npz'' to save each sequence
+    as a binary array file, which loads much faster than json, see sequence_arrays.
+    These are converted to the json files for the submission with sequence_arrays.convert_folder.
+
+    The writer records each finished sequence in a manifest file (see MANIFEST_NAME) in the submission folder,
+    with the path of the file, the number of images and detections, the size of the file, and its sha256 hash.
+    The validator uses the manifest to find the sequence files, rather than searching the folder.
+    If generating the submission is interrupted, create the writer again with the same folder,
+    and skip the sequences that are already done:
+    ```
+    writer = submission_builder.SubmissionWriter('submission', classes)
+    for sequence_name in ...:
+        if not writer.is_complete(sequence_name):
+            ...
+            writer.save_sequence(sequence_name)
+    ```
+    Files for sequences that were started but not finished are deleted when the sequence is written again.
+    Several writers can share a folder, such as one per GPU, as long as each writes different sequences.
+    Each writer merges its entries into the manifest on disk, rather than replacing the entries of the others.
+    When writing to a zip file, the manifest is added to the zip when it is closed, but the zip cannot be resumed.
     """
 
-    def __init__(self, submission_folder, class_list):
-        self.submission_folder = submission_folder
+    def __init__(self, submission_folder, class_list, streaming=False, background=False, max_pending=2,
+                 significant_digits=None, compression_level=6, project_classes=False,
+                 nms_iou_threshold=None, nms_score_threshold=0.0, nms_merge_covars=False, output_format='json'):
+        """
+        :param submission_folder: The folder to write the sequence json files to.
+        If this ends with '.zip', the sequences are written straight into a zip file instead, call 'close' at the end.
+        :param class_list: The list of class names, in the order of the class probabilities
+        :param streaming: If true, write each image to file as soon as it is finished, instead of keeping the whole
+        sequence in memory until 'save_sequence'. Requires calling 'start_sequence' at the start of each sequence.
+        :param background: If true, encode and write files on a background thread, so that 'save_sequence'
+        (or 'next_image' when streaming) returns immediately. Call 'close' when finished.
+        :param max_pending: The maximum number of writes waiting for the background thread,
+        when this many are waiting the writer blocks until one finishes. Limits the memory used.
+        :param significant_digits: If given, write class probabilities and boxes with this many significant digits,
+        and leave out the spaces in the json, see encode_detections. This makes much smaller files that are faster
+        to write. By default, all values are written at full precision.
+        :param compression_level: The compression level when writing a zip file, from 0 (no compression)
+        to 9 (smallest file, slowest). Ignored when writing to a folder.
+        When writing to a folder, any existing manifest is loaded, see 'is_complete'.
+        :param project_classes: If true, the class list is the classes of the detector, which are mapped onto the
+        challenge classes when each detection is added. Columns for other classes are dropped,
+        and the challenge class names are written instead of the class list.
+        :param nms_iou_threshold: If given, do class-aware non-maximum suppression on each image when it is finished,
+        removing detections that overlap a better detection of the same class by more than this IoU.
+        :param nms_score_threshold: When doing non-maximum suppression, also remove detections where the
+        probability of the most likely class is less than this.
+        :param nms_merge_covars: When doing non-maximum suppression, merge the covariances of the removed detections
+        into the detection that removed them.
+        :param output_format: The format of the sequence files, either 'json', or 'npz' for binary array files,
+        see sequence_arrays. Array files cannot be streamed or written to a zip file.
+        """
+        if np is None:
+            raise ImportError("SubmissionWriter requires numpy")
+        if output_format not in {'json', 'npz'}:
+            raise ValueError("Unknown output format '{0}', must be 'json' or 'npz'".format(output_format))
+        # Keep the folder as a string, so that pathlib paths work too
+        self.submission_folder = str(submission_folder)
+        if output_format == 'npz' and (streaming or self.is_zip):
+            raise ValueError("Sequence array files cannot be streamed or written to a zip file")
+        self.output_format = output_format
         self.class_list = class_list
-        self._all_detections = []
-        self._current_detections = []
+        self.output_classes = class_list
+        self._projection = None
+        self._projection_lookup = None
+        if project_classes:
+            self._projection, self.output_classes = make_class_projection(class_list)
+            # The column in the output for each of the classes in the class list, or -1 if it is dropped
+            self._projection_lookup = np.full(len(class_list), -1, dtype=np.int64)
+            self._projection_lookup[self._projection] = np.arange(len(self._projection))
+        self.streaming = bool(streaming)
+        self.nms_iou_threshold = nms_iou_threshold
+        self.nms_score_threshold = nms_score_threshold
+        self.nms_merge_covars = bool(nms_merge_covars)
+        self.significant_digits = significant_digits
+        self._separators = (', ', ': ') if significant_digits is None else (',', ':')
+        self._detections = _DetectionStore(len(self.output_classes))
+        self._sequence_name = None
+
+        # State for the file currently being written, only used by the thread doing the writing
+        self._output_file = None
+        self._output_name = None
+        self._output_images = 0
+        self._output_detections = 0
+        self._zip_file = None
+        self.compression_level = int(compression_level)
+
+        # The manifest entry for each sequence that has been started, by this writer or another using the folder
+        self._manifest = {}
+        # The entries for the sequences started by this writer, which replace those on disk when saving
+        self._own_entries = {}
+        if not self.is_zip:
+            self._manifest = self._read_manifest()
+
+        self._error = None
+        self._queue = None
+        self._worker = None
+        if background:
+            self._queue = queue.Queue(maxsize=max(1, max_pending))
+            self._worker = threading.Thread(target=self._run_worker, name='SubmissionWriter')
+            self._worker.daemon = True
+            self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.close()
+        except Exception:
+            # Don't hide an exception that is already being raised
+            if exc_type is None:
+                raise
 
-    def add_detection(self, class_probabilities, xmin, ymin, xmax, ymax, upper_left_cov=None, lower_right_cov=None):
+    def add_detection(self, class_probabilities, xmin, ymin, xmax, ymax, upper_left_cov=None, lower_right_cov=None,
+                      class_indices=None):
         """
         Add a detection for the current image.
         The parameters are the same as make_detection, see above.
+        If the detector only gives probabilities for some of the classes, such as the top 5,
+        pass the indices of those classes in the class list as 'class_indices'.
+        The other classes will have probability 0.
 
         :param xmin: The x coordinate of the upper left corner (mean)
         :param ymin: The y coordinate of the upper left corner (mean)
@@ -275,11 +1015,14 @@ class SubmissionWriter(object):
         :param lower_right_cov: 2x2 covariance matrix for the lower right corner, as a list of lists
         :param class_probabilities: A list of class confidences as floats,
                                     which correspond to the matching entry in the class list
+        :param class_indices: A list of indices in the class list, one for each of the class probabilities. Optional.
         :return:
         """
-        if len(class_probabilities) != len(self.class_list):
+        if class_indices is not None:
+            class_indices = check_class_indices([class_indices], [class_probabilities], len(self.class_list))
+        elif len(class_probabilities) != len(self.class_list):
             raise RuntimeError("Class probabilities are not the same length as the class list")
-        self._current_detections.append(make_detection(
+        detection = make_detection(
             xmin=xmin,
             ymin=ymin,
             xmax=xmax,
@@ -287,7 +1030,51 @@ class SubmissionWriter(object):
             upper_left_cov=upper_left_cov,
             lower_right_cov=lower_right_cov,
             class_probabilities=class_probabilities
-        ))
+        )
+        self._append_detections(
+            [detection['label_probs']],
+            [detection['bbox']],
+            [detection['covars']] if 'covars' in detection else None,
+            class_indices
+        )
+
+    def add_detections(self, class_probabilities, boxes, covars=None, class_indices=None):
+        """
+        Add all the detections for the current image at once.
+        This is much faster than calling add_detection for each box, see make_detections above.
+        Can be mixed with calls to add_detection for the same image.
+        As for add_detection, give 'class_indices' if there are only probabilities for some of the classes.
+
+        :param class_probabilities: An N x C array of class probabilities, where C is the length of the class list.
+        If class indices are given, this is N x K, a probability for each of the K classes given for each detection.
+        :param boxes: An N x 4 array of bounding boxes, as [xmin, ymin, xmax, ymax]
+        :param covars: An N x 2 x 2 x 2 array of upper-left and lower-right covariances for each box. Optional.
+        :param class_indices: An N x K array of indices in the class list, the class for each class probability.
+        Optional.
+        :return:
+        """
+        if class_indices is None and np.ndim(class_probabilities) == 2 and \
+                np.shape(class_probabilities)[1] != len(self.class_list):
+            raise RuntimeError("Class probabilities are not the same length as the class list")
+        class_probabilities, boxes, covars = check_detection_arrays(class_probabilities, boxes, covars)
+        if class_indices is not None:
+            class_indices = check_class_indices(class_indices, class_probabilities, len(self.class_list))
+        self._append_detections(class_probabilities, boxes, covars, class_indices)
+
+    def start_sequence(self, sequence_name):
+        """
+        Start a new image sequence. This is required before the first image of each sequence when streaming,
+        where it opens the output file for the sequence, and is optional otherwise.
+
+        :param sequence_name: The name of the folder containing the images (not the full path)
+        :return: None
+        """
+        if self._sequence_name is not None:
+            raise RuntimeError("Cannot start sequence {0}, sequence {1} has not been saved".format(
+                sequence_name, self._sequence_name))
+        if self.streaming:
+            self._submit(self._open_output, sequence_name)
+        self._sequence_name = sequence_name
 
     def next_image(self):
         """
@@ -295,8 +1082,13 @@ class SubmissionWriter(object):
         even if there are no detections.
         :return:
         """
-        self._all_detections.append(self._current_detections)
-        self._current_detections = []
+        if self.streaming and self._sequence_name is None:
+            raise RuntimeError("Call 'start_sequence' before adding images when streaming")
+        if self.nms_iou_threshold is not None and self._detections.num_pending > 0:
+            self._suppress_detections()
+        self._detections.end_image()
+        if self.streaming:
+            self._submit(self._write_images, self._detach_detections())
 
     def save_sequence(self, sequence_name):
         """
@@ -308,16 +1100,394 @@ class SubmissionWriter(object):
         :param sequence_name: The name of the folder containing the images (not the full path)
         :return: None
         """
+        if self._sequence_name is not None and self._sequence_name != sequence_name:
+            raise RuntimeError("Cannot save sequence {0}, sequence {1} was started instead".format(
+                sequence_name, self._sequence_name))
+        if self.streaming and self._sequence_name is None:
+            # The sequence was never started, which can only happen if it has no images
+            self.start_sequence(sequence_name)
+
         # If there are outstanding detections, add them as another image
-        if len(self._current_detections) > 0:
+        if self._detections.num_pending > 0:
             self.next_image()
 
-        # Create the output folder if it doesn't exist
+        if self.streaming:
+            self._submit(self._close_output)
+        else:
+            self._submit(self._write_sequence, sequence_name, self._detach_detections())
+        self._sequence_name = None
+
+    def abort_sequence(self):
+        """
+        Abandon the current sequence without saving it, dropping the detections that have not been written,
+        so that the next sequence can be started. When streaming to a folder, the partial file is deleted.
+        The partial member of a zip file cannot be removed, so the zip file must be written again.
+        :return: None
+        """
+        self._detections = _DetectionStore(len(self.output_classes))
+        if self.streaming and self._sequence_name is not None:
+            self._submit(self._discard_output)
+        self._sequence_name = None
+
+    def is_complete(self, sequence_name):
+        """
+        Check if a sequence has been completely written, either by this writer, or by another one
+        writing to the same folder. Sequences whose files are missing or the wrong size are not complete.
+        When writing in the background, call 'flush' first to include pending writes.
+        :param sequence_name: The name of the sequence
+        :return: True if the file for the sequence is finished
+        """
+        entry = self._manifest.get(sequence_name)
+        if entry is None or not entry.get('complete', False):
+            return False
+        if self.is_zip:
+            return True
+        sequence_path = self._get_entry_path(sequence_name, entry)
+        return os.path.isfile(sequence_path) and os.path.getsize(sequence_path) == entry.get('bytes')
+
+    def flush(self):
+        """
+        Wait for all the pending writes to finish.
+        If writing in the background failed, the error is raised here.
+        :return:
+        """
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """
+        Finish writing, waiting for any pending writes and stopping the background thread.
+        When writing a zip file, this finishes the zip file.
+        Call this after the last sequence, or use the writer as a context manager:
+        ```
+        with submission_builder.SubmissionWriter('submission', classes, background=True) as writer:
+            ...
+        ```
+        If writing in the background failed, the error is raised here.
+        :return:
+        """
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
+            self._worker = None
+            self._queue = None
+        if self._output_file is not None:
+            # A sequence was started but not saved, close the incomplete file
+            self._output_file.close()
+            self._output_file = None
+        if self._zip_file is not None:
+            with self._zip_file.open(MANIFEST_NAME, 'w') as fp:
+                fp.write(self._encode_manifest())
+            # This writes the zip central directory, the zip file cannot be read without it
+            self._zip_file.close()
+            self._zip_file = None
+        self._raise_error()
+
+    @property
+    def is_zip(self):
+        """
+        :return: True if the sequences are being written to a zip file, rather than a folder
+        """
+        return self.submission_folder.lower().endswith('.zip')
+
+    def _append_detections(self, class_probabilities, boxes, covars, class_indices):
+        """
+        Add checked detections to the store, mapping the class probabilities onto the output classes if required.
+        :param class_probabilities: The normalized class probabilities, in the order of the class list
+        :param boxes: The bounding boxes
+        :param covars: The box covariances, or None
+        :param class_indices: The indices in the class list for each class probability, or None if they are dense
+        :return:
+        """
+        if self._projection is not None:
+            if class_indices is None:
+                class_probabilities = np.asarray(class_probabilities)[:, self._projection]
+            else:
+                # Classes that are dropped become -1, which the store leaves out
+                class_indices = self._projection_lookup[class_indices]
+        self._detections.append(class_probabilities, boxes, covars, class_indices)
+
+    def _suppress_detections(self):
+        """
+        Do non-maximum suppression on the detections for the current image, removing those that are suppressed.
+        :return:
+        """
+        probs, boxes, covars, has_covars = self._detections.get_pending_arrays()
+        keep, suppressed_by = non_max_suppression(probs, boxes, self.nms_iou_threshold, self.nms_score_threshold)
+        if len(keep) == len(boxes):
+            return
+        merged_covars = None
+        merged_has_covars = None
+        if self.nms_merge_covars:
+            merged_covars, merged_has_covars = merge_covariances(probs, boxes, covars, has_covars, suppressed_by)
+        self._detections.filter_pending(keep, merged_covars, merged_has_covars)
+
+    def _detach_detections(self):
+        """
+        Take the accumulated detections so they can be written, replacing them with an empty store.
+        :return: The detections that were accumulated
+        """
+        detections = self._detections
+        self._detections = _DetectionStore(len(self.output_classes), capacity=len(detections.boxes))
+        return detections
+
+    def _submit(self, func, *args):
+        """
+        Run a write operation, either immediately or by handing it to the background thread.
+        Writes are always done in the order they are submitted.
+        :param func: The function to call
+        :param args: Arguments to the function
+        :return:
+        """
+        self._raise_error()
+        if self._queue is None:
+            func(*args)
+        else:
+            self._queue.put((func, args))
+
+    def _run_worker(self):
+        """
+        The main loop of the background thread, which does the writes in order until it is given None.
+        After an error, later writes are skipped, and the error is raised on the next call from the main thread.
+        :return:
+        """
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                if self._error is None:
+                    func, args = job
+                    func(*args)
+            except Exception as err:
+                self._error = err
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        """
+        Raise an error from the background thread, if there was one
+        :return:
+        """
+        if self._error is not None:
+            raise self._error
+
+    def _write_sequence(self, sequence_name, detections):
+        """
+        Write an entire sequence to file
+        :param sequence_name: The name of the sequence
+        :param detections: The _DetectionStore containing all the images of the sequence
+        :return:
+        """
+        if self.output_format == 'npz':
+            self._write_arrays(sequence_name, detections)
+            return
+        self._open_output(sequence_name)
+        self._write_images(detections)
+        self._close_output()
+
+    def _write_arrays(self, sequence_name, detections):
+        """
+        Write an entire sequence to a binary array file, see sequence_arrays.
+        :param sequence_name: The name of the sequence
+        :param detections: The _DetectionStore containing all the images of the sequence
+        :return:
+        """
+        # Record the path of the partial file, so that it is removed if this is interrupted
+        self._discard_partial_file(sequence_name)
+        self._update_manifest(sequence_name, {'complete': False, 'path': self._get_file_name(sequence_name)})
+        sequence_path = self._make_sequence_path(sequence_name)
+        probs, boxes, covars, has_covars = detections.get_arrays()
+        sequence_arrays.save_sequence_arrays(sequence_path, self.output_classes, probs, boxes, covars, has_covars,
+                                             detections.image_offsets)
+        file_hash = hashlib.sha256()
+        with open(sequence_path, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b''):
+                file_hash.update(chunk)
+        self._update_manifest(sequence_name, {
+            'complete': True,
+            'path': self._get_file_name(sequence_name),
+            'images': detections.num_images,
+            'detections': detections.image_offsets[-1],
+            'bytes': os.path.getsize(sequence_path),
+            'sha256': file_hash.hexdigest()
+        })
+
+    def _open_output(self, sequence_name):
+        """
+        Open the file for a sequence, and write everything up to the start of the detections list.
+        :param sequence_name: The name of the sequence
+        :return:
+        """
+        item_separator, key_separator = self._separators
+        # Record the sequence as started before creating the file, so that it is discarded if it is never finished
+        self._discard_partial_file(sequence_name)
+        self._update_manifest(sequence_name, {'complete': False, 'path': self._get_file_name(sequence_name)})
+        self._output_file = _HashingWriter(self._open_sequence_file(sequence_name))
+        self._output_name = sequence_name
+        self._output_file.write('{{"classes"{1}{0}{2}"detections"{1}['.format(
+            json.dumps(self.output_classes, separators=self._separators), key_separator, item_separator))
+        self._output_images = 0
+        self._output_detections = 0
+
+    def _write_images(self, detections):
+        """
+        Write finished images to the open sequence file, encoding one image at a time.
+        :param detections: A _DetectionStore of finished images
+        :return:
+        """
+        for img_idx in range(detections.num_images):
+            if self._output_images > 0:
+                self._output_file.write(self._separators[0])
+            if self.significant_digits is None:
+                self._output_file.write(json.dumps(detections.get_image(img_idx)))
+            else:
+                self._output_file.write(encode_detections(*detections.get_image_arrays(img_idx),
+                                                          significant_digits=self.significant_digits))
+            self._output_images += 1
+        self._output_detections += detections.image_offsets[-1]
+
+    def _close_output(self):
+        """
+        Close the detections list and the top-level object, and close the file.
+        Together with _open_output and _write_images, this produces the same output as make_sequence_output.
+        :return:
+        """
+        self._output_file.write(']}')
+        self._output_file.close()
+        self._update_manifest(self._output_name, {
+            'complete': True,
+            'path': self._get_file_name(self._output_name),
+            'images': self._output_images,
+            'detections': self._output_detections,
+            'bytes': self._output_file.num_bytes,
+            'sha256': self._output_file.hexdigest()
+        })
+        self._output_file = None
+        self._output_name = None
+
+    def _discard_output(self):
+        """
+        Close the file of a sequence that was abandoned, and delete it if it is not in a zip file.
+        The sequence is left unfinished in the manifest, so that it is written again when resuming.
+        :return:
+        """
+        if self._output_file is None:
+            return
+        self._output_file.close()
+        if not self.is_zip:
+            os.remove(self._make_sequence_path(self._output_name))
+        self._output_file = None
+        self._output_name = None
+
+    def _open_sequence_file(self, sequence_name):
+        """
+        Open the output file for a sequence, either in the submission folder or as a member of the zip file
+        :param sequence_name: The name of the sequence
+        :return: A binary file object to write the sequence json to
+        """
+        if not self.is_zip:
+            return open(self._make_sequence_path(sequence_name), 'wb')
+        if self._zip_file is None:
+            zip_folder = os.path.dirname(self.submission_folder)
+            if zip_folder != '' and not os.path.exists(zip_folder):
+                os.makedirs(zip_folder)
+            if self.compression_level > 0:
+                self._zip_file = zipfile.ZipFile(self.submission_folder, 'w', compression=zipfile.ZIP_DEFLATED,
+                                                 compresslevel=min(self.compression_level, 9))
+            else:
+                self._zip_file = zipfile.ZipFile(self.submission_folder, 'w', compression=zipfile.ZIP_STORED)
+        member_name = self._get_file_name(sequence_name)
+        if member_name in self._zip_file.namelist():
+            raise RuntimeError("Sequence {0} has already been written to {1}".format(
+                sequence_name, self.submission_folder))
+        # Members are streamed, so allow for them being larger than 4 GB
+        return self._zip_file.open(member_name, 'w', force_zip64=True)
+
+    def _make_sequence_path(self, sequence_name):
+        """
+        Get the path of the file for a given sequence, creating the output folder if it doesn't exist
+        :param sequence_name: The name of the sequence
+        :return: The path to write the sequence to
+        """
         if not os.path.exists(self.submission_folder):
             os.makedirs(self.submission_folder)
+        return os.path.join(self.submission_folder, self._get_file_name(sequence_name))
+
+    def _get_file_name(self, sequence_name):
+        """
+        :param sequence_name: The name of the sequence
+        :return: The name of the file for the sequence, within the submission folder or zip file
+        """
+        return '{0}.{1}'.format(sequence_name, self.output_format)
+
+    def _get_entry_path(self, sequence_name, entry):
+        """
+        :param sequence_name: The name of the sequence
+        :param entry: The manifest entry for the sequence
+        :return: The path of the file for the sequence in the submission folder
+        """
+        return os.path.join(self.submission_folder, entry.get('path', '{0}.json'.format(sequence_name)))
 
-        # Write all the accumulated detections to file
-        with open(os.path.join(self.submission_folder, '{0}.json'.format(sequence_name)), 'w') as fp:
-            json.dump(make_sequence_output(self._all_detections, self.class_list), fp)
+    def _discard_partial_file(self, sequence_name):
+        """
+        Before writing a sequence, delete the file left for it by a writer that did not finish it.
+        Only this writer is about to write the sequence, so this cannot remove a file another writer is using.
+        :param sequence_name: The name of the sequence
+        :return:
+        """
+        entry = self._manifest.get(sequence_name)
+        if self.is_zip or entry is None or self.is_complete(sequence_name):
+            return
+        sequence_path = self._get_entry_path(sequence_name, entry)
+        if os.path.isfile(sequence_path):
+            os.remove(sequence_path)
 
-        self._all_detections = []
+    def _read_manifest(self):
+        """
+        Read the manifest in the submission folder, left by an earlier writer or another writer using the folder.
+        :return: The manifest entry for each sequence, or an empty dict if there is no manifest
+        """
+        manifest_path = os.path.join(self.submission_folder, MANIFEST_NAME)
+        if not os.path.isfile(manifest_path):
+            return {}
+        with open(manifest_path, 'r') as fp:
+            return json.load(fp).get('sequences', {})
+
+    def _update_manifest(self, sequence_name, entry):
+        """
+        Set the manifest entry for a sequence this writer is writing, and save the manifest.
+        :param sequence_name: The name of the sequence
+        :param entry: The new manifest entry
+        :return:
+        """
+        self._own_entries[sequence_name] = entry
+        self._save_manifest()
+
+    def _save_manifest(self):
+        """
+        Merge the entries from this writer into the manifest on disk, so that the entries of other writers
+        using the same folder are kept, and write it out, replacing the old one in a single step so it is never
+        left half written. When writing a zip file, the manifest is only written when the zip is closed.
+        :return:
+        """
+        manifest = {} if self.is_zip else self._read_manifest()
+        manifest.update(self._own_entries)
+        self._manifest = manifest
+        if self.is_zip:
+            return
+        if not os.path.exists(self.submission_folder):
+            os.makedirs(self.submission_folder)
+        manifest_path = os.path.join(self.submission_folder, MANIFEST_NAME)
+        # Each writer has its own temporary file, so that writers in other processes don't write into it
+        temp_path = '{0}.{1}-{2}.tmp'.format(manifest_path, os.getpid(), id(self))
+        with open(temp_path, 'wb') as fp:
+            fp.write(self._encode_manifest())
+        os.replace(temp_path, manifest_path)
+
+    def _encode_manifest(self):
+        """
+        :return: The contents of the manifest file, as bytes
+        """
+        return json.dumps({'sequences': self._manifest}, indent=2, sort_keys=True).encode('utf-8')
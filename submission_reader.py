@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+BSD 3-Clause License
+
+Copyright (c) 2018, John Skinner, David Hall, Niko Sünderhauf, and Feras Dayoub,
+ARC Centre of Excellence for Robotic Vision, Queensland University of Technology
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+-----------------------------------
+
+Lazy reading of existing submissions for analysis, as numpy arrays.
+
+A SubmissionReader finds the sequence files in a submission folder or zip file the same way as the validator,
+but only reads each sequence when it is first used. Each sequence is decoded into a
+sequence_arrays.SequenceArrays, with the class probabilities re-ordered to the challenge classes
+(submission_validator.CLASSES), and only the last few sequences used are kept in memory.
+```
+reader = SubmissionReader('submission')
+for sequence_name in reader.sequence_names:
+    arrays = reader[sequence_name]
+    print(sequence_name, arrays.num_images, arrays.num_detections)
+```
+Decoding json is slow, so give a 'sidecar_folder' to save each decoded sequence as an array file,
+which is memory-mapped the next time that sequence is read, as long as the submission file has not changed.
+The submission should be valid, see submission_validator.
+"""
+from __future__ import absolute_import, division, print_function
+
+import collections
+import json
+import os
+import os.path
+import zipfile
+import numpy as np
+
+# Import relative to the package when the starter kit is imported as one
+try:
+    from . import submission_validator
+    from . import sequence_arrays
+except ImportError:
+    import submission_validator
+    import sequence_arrays
+
+# The name of the index of decoded sequences in the sidecar folder
+SIDECAR_INDEX_NAME = 'sidecar_index.json'
+
+# The covariances for detections that do not have any
+_ZERO_COVARS = [[[0, 0], [0, 0]], [[0, 0], [0, 0]]]
+
+
+class SubmissionReader(object):
+    """
+    Reads the sequences of a submission as arrays, when they are needed, see the module docstring.
+    Sequences can be read by name, like a read-only dict.
+    """
+
+    def __init__(self, submission, sequence_ids=np.arange(18), max_cached=2, sidecar_folder=None):
+        """
+        :param submission: The submission folder or zip file
+        :param sequence_ids: The ids of the sequences to look for. Sequences that are not found are left out.
+        :param max_cached: The number of decoded sequences to keep in memory
+        :param sidecar_folder: A folder to save decoded sequences in, so that they load quickly next time. Optional.
+        """
+        expected_sequence_names = {'{0:06}'.format(idx) for idx in sequence_ids}
+        if os.path.isfile(submission) and zipfile.is_zipfile(submission):
+            self._sources = submission_validator.find_zip_sequences(submission, expected_sequence_names)
+        elif os.path.isdir(submission):
+            self._sources = submission_validator.find_folder_sequences(submission, expected_sequence_names)
+        else:
+            raise ValueError("Submission {0} does not exist".format(submission))
+        self.submission = submission
+        self.max_cached = max(int(max_cached), 0)
+        self.sidecar_folder = sidecar_folder
+        self._cache = collections.OrderedDict()
+        self._sidecar_index = None
+
+    @property
+    def sequence_names(self):
+        """
+        :return: The sorted list of sequences in the submission
+        """
+        return sorted(self._sources.keys())
+
+    def __len__(self):
+        return len(self._sources)
+
+    def __contains__(self, sequence_name):
+        return sequence_name in self._sources
+
+    def __iter__(self):
+        return iter(self.sequence_names)
+
+    def __getitem__(self, sequence_name):
+        return self.get_sequence(sequence_name)
+
+    def get_source(self, sequence_name):
+        """
+        :param sequence_name: The name of the sequence
+        :return: The path of the sequence file, or the (zip path, member name) for a zip file
+        """
+        return self._sources[sequence_name]
+
+    def get_sequence(self, sequence_name):
+        """
+        Get the detections for a sequence, reading it if it is not already in memory.
+        :param sequence_name: The name of the sequence
+        :return: A SequenceArrays for the sequence, with the classes in the order of submission_validator.CLASSES
+        """
+        if sequence_name not in self._sources:
+            raise KeyError("There is no sequence {0} in submission {1}".format(sequence_name, self.submission))
+        if sequence_name in self._cache:
+            self._cache.move_to_end(sequence_name)
+            return self._cache[sequence_name]
+        arrays = self._read_sidecar(sequence_name)
+        if arrays is None:
+            arrays = load_sequence(self._sources[sequence_name])
+            self._write_sidecar(sequence_name, arrays)
+        if self.max_cached > 0:
+            self._cache[sequence_name] = arrays
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return arrays
+
+    def iter_sequences(self):
+        """
+        Read each of the sequences in turn.
+        :return: A generator of (sequence name, SequenceArrays) pairs
+        """
+        for sequence_name in self.sequence_names:
+            yield sequence_name, self.get_sequence(sequence_name)
+
+    def clear_cache(self):
+        """
+        Remove all the decoded sequences from memory.
+        :return:
+        """
+        self._cache.clear()
+
+    def _load_sidecar_index(self):
+        """
+        Read the index of the sidecar folder, the first time it is needed
+        :return: A dict mapping the key of each sequence file to its entry
+        """
+        if self._sidecar_index is None:
+            self._sidecar_index = {}
+            index_path = os.path.join(self.sidecar_folder, SIDECAR_INDEX_NAME)
+            if os.path.isfile(index_path):
+                try:
+                    with open(index_path, 'r') as fp:
+                        self._sidecar_index = json.load(fp)['sequences']
+                except (ValueError, KeyError, TypeError):
+                    self._sidecar_index = {}
+        return self._sidecar_index
+
+    def _read_sidecar(self, sequence_name):
+        """
+        Load a decoded sequence from the sidecar folder, if it is there and the sequence file has not changed.
+        :param sequence_name: The name of the sequence
+        :return: The SequenceArrays, or None if it needs to be decoded
+        """
+        if self.sidecar_folder is None:
+            return None
+        source = self._sources[sequence_name]
+        entry = self._load_sidecar_index().get(submission_validator.get_sequence_key(source))
+        if entry is None or entry['fingerprint'] != submission_validator.get_sequence_fingerprint(source):
+            return None
+        array_file = os.path.join(self.sidecar_folder, entry['file'])
+        if not os.path.isfile(array_file):
+            return None
+        return sequence_arrays.load_sequence_arrays(array_file)
+
+    def _write_sidecar(self, sequence_name, arrays):
+        """
+        Save a decoded sequence to the sidecar folder, and update the index.
+        :param sequence_name: The name of the sequence
+        :param arrays: The decoded SequenceArrays
+        :return:
+        """
+        if self.sidecar_folder is None:
+            return
+        if not os.path.isdir(self.sidecar_folder):
+            os.makedirs(self.sidecar_folder)
+        source = self._sources[sequence_name]
+        key = submission_validator.get_sequence_key(source)
+        index = self._load_sidecar_index()
+
+        # Sequences from different submissions can share the folder, so name the file from the key
+        file_name = index[key]['file'] if key in index else '{0}_{1}{2}'.format(
+            sequence_name, len(index), sequence_arrays.ARRAYS_EXTENSION)
+        sequence_arrays.save_sequence_arrays(os.path.join(self.sidecar_folder, file_name), arrays.classes,
+                                             arrays.probs, arrays.boxes, arrays.covars, arrays.has_covars,
+                                             arrays.image_offsets)
+        index[key] = {'file': file_name, 'fingerprint': submission_validator.get_sequence_fingerprint(source)}
+        index_path = os.path.join(self.sidecar_folder, SIDECAR_INDEX_NAME)
+        with open(index_path + '.tmp', 'w') as fp:
+            json.dump({'sequences': index}, fp)
+        os.replace(index_path + '.tmp', index_path)
+
+
+def load_sequence(sequence_json):
+    """
+    Read a sequence file, and convert it to arrays with the class probabilities in the challenge class order.
+    Classes that are not challenge classes are dropped, and the probabilities are not normalized.
+    The file is read one image at a time, and each image is converted to arrays as it is read.
+    :param sequence_json: The path to the sequence file, or a (zip path, member name) tuple.
+    This can also be an array file, see sequence_arrays.
+    :return: A SequenceArrays, with the classes submission_validator.CLASSES
+    """
+    num_classes = len(submission_validator.CLASSES)
+    all_probs = [np.zeros((0, num_classes), dtype=np.float64)]
+    boxes = [np.zeros((0, 4), dtype=np.float64)]
+    covars = [np.zeros((0, 2, 2, 2), dtype=np.float64)]
+    has_covars = [np.zeros(0, dtype=bool)]
+    counts = []
+    with submission_validator.open_sequence_reader(sequence_json) as (header, reader, _):
+        our_class_ids, sub_class_ids = submission_validator.get_class_mapping(header['classes'])
+        our_class_ids = np.asarray(our_class_ids, dtype=np.intp)
+        sub_class_ids = np.asarray(sub_class_ids, dtype=np.intp)
+        for img_dets in reader.iter_images():
+            counts.append(len(img_dets))
+            if len(img_dets) <= 0:
+                continue
+            probs = np.zeros((len(img_dets), num_classes), dtype=np.float64)
+            probs[:, our_class_ids] = np.array([det['label_probs'] for det in img_dets],
+                                               dtype=np.float64)[:, sub_class_ids]
+            all_probs.append(probs)
+            boxes.append(np.array([det['bbox'] for det in img_dets], dtype=np.float64).reshape((len(img_dets), 4)))
+            covars.append(np.array([det.get('covars', _ZERO_COVARS) for det in img_dets],
+                                   dtype=np.float64).reshape((len(img_dets), 2, 2, 2)))
+            has_covars.append(np.array(['covars' in det for det in img_dets], dtype=bool))
+    return sequence_arrays.SequenceArrays(
+        classes=list(submission_validator.CLASSES),
+        probs=np.concatenate(all_probs),
+        boxes=np.concatenate(boxes),
+        covars=np.concatenate(covars),
+        has_covars=np.concatenate(has_covars),
+        image_offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    )
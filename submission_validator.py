@@ -35,33 +35,103 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 -----------------------------------
 
-usage: submission_validator.py [-h] [-q] submission_directory
+usage: submission_validator.py [-h] [-q] [--warning-examples WARNING_EXAMPLES]
+                               [-j JOBS] [--data-root DATA_ROOT]
+                               [--cache CACHE] [--metrics-out METRICS_OUT]
+                               [--profile PROFILE]
+                               submission_directory
 
 Validator script for submissions to the challenge. Call this script on a
 submission to check for errors and invalid values in your submission before
 uploading.
 
 positional arguments:
-  submission_directory  The folder containing the submission to validate. Zip
-                        up and submit this folder when done.
+  submission_directory  The folder containing the submission to validate, or
+                        the submission zip file. Zip up and submit this folder
+                        when done.
 
 optional arguments:
   -h, --help            show this help message and exit
-  -q, --quiet           Suppress warning messages, which may occur when class
-                        probabilities are not normalized or detections are
-                        ignored. These are not errors, and may produce
+  -q, --quiet           Suppress the summary of warnings, which may occur when
+                        class probabilities are not normalized or detections
+                        are ignored. These are not errors, and may produce
                         excessive output
+  --warning-examples WARNING_EXAMPLES
+                        The number of example warning messages to show in the
+                        summary. Default 10.
+  -j JOBS, --jobs JOBS  The number of sequences to validate at once, in
+                        separate processes. Use 0 for the number of CPUs.
+                        Default 1.
+  --data-root DATA_ROOT
+                        The test data folder. If given, check that there are
+                        detections for every image in each sequence.
+  --cache CACHE         A file to save the results for each sequence in. When
+                        run again with the same file, sequences that have not
+                        changed are not validated again.
+  --metrics-out METRICS_OUT
+                        A json file to write the time, throughput, and peak
+                        memory use for validating each sequence to.
+  --profile PROFILE     Profile the validator with cProfile, and save the
+                        stats to this file. View them with "python -m pstats".
+                        With --jobs, only the main process is profiled.
 
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import argparse
 import sys
+import os
 import os.path
+import posixpath
+import contextlib
+import zipfile
+import hashlib
+import json
+import time
 import warnings
+import concurrent.futures
 import numpy as np
-import json
 
+# The resource module is only available on unix, without it the peak memory use is not measured
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Import relative to the package when the starter kit is imported as one
+try:
+    from . import covariance_checks
+    from . import sequence_reader
+    from . import sequence_arrays
+    from . import image_index
+except ImportError:
+    import covariance_checks
+    import sequence_reader
+    import sequence_arrays
+    import image_index
+
+
+# The version of the checks done by the validator. Change this when the checks change,
+# so that results saved in a ValidationCache are not re-used.
+VALIDATOR_VERSION = 1
+
+# The name of the index of sequence files written by submission_builder.SubmissionWriter, see find_folder_sequences.
+# This must match submission_builder.MANIFEST_NAME
+MANIFEST_NAME = 'manifest.json'
+
+# The number of detections (or images) to read before checking them, see validate_sequence
+VALIDATION_BATCH_SIZE = 5000
+
+# The minimum time between updates of the progress bar, in seconds
+PROGRESS_INTERVAL = 0.2
+
+# The warnings the validator can give, by category, see WarningCollector.
+# Some include the total probability of the detection.
+WARNING_MESSAGES = {
+    'ignored': "The detection was ignored as it's total probability across all known classes was {0}, "
+               "which is less than 0.5",
+    'normalized': "The class probabilities were greater than 1, and were normalized"
+}
 
 # This is the list of valid classes for this challenge, in order
 # The class id is the index in this list
@@ -121,7 +191,8 @@ SYNONYMS = {
 }
 
 
-def validate_submission(directory, sequence_ids=np.arange(18)):
+def validate_submission(directory, sequence_ids=np.arange(18), jobs=1, warning_collector=None, cache=None,
+                        data_root=None, metrics=None):
     """
     Validate all the submissions for all the sequences outlined in the given folder.
     Each sequence's detections are provided in a file ending with 'detections.json'.
@@ -141,18 +212,92 @@ def validate_submission(directory, sequence_ids=np.arange(18)):
     Note that they must have valid submissions for all sequences before submission to the competition.
 
     :param directory: location of each sequence's submission json file.
+    This can also be the submission zip file, in which case the sequences are read straight from the zip.
     :param sequence_ids: list of sequence identification numbers for all sequences to be validated.
     Defaults to all 18 sequence ids needed for submission to competition ([0,1,2, ..., 17]).
+    :param jobs: The number of sequences to validate at the same time, each in a separate process.
+    Results are still reported in sequence order. If 0 or None, use one process per CPU.
+    :param warning_collector: A WarningCollector to count warnings, instead of issuing each one with warnings.warn
+    :param cache: A ValidationCache, to skip validating sequences that have not changed since they were last validated.
+    When using a cache, warnings are always counted, so give a warning_collector to see them.
+    :param data_root: The folder containing the test images for each sequence. If given, check that there are
+    detections for every image in each sequence. The list of images is cached, see image_index.ImageIndex.
+    :param metrics: A ValidationMetrics, to record the time and memory taken to validate each sequence.
+    Sequences with results in the cache are not validated, and so are not recorded.
     """
-    if not os.path.isdir(directory):
+    expected_sequence_names = {'{0:06}'.format(idx) for idx in sequence_ids}
+    if os.path.isfile(directory) and zipfile.is_zipfile(directory):
+        sequences = find_zip_sequences(directory, expected_sequence_names)
+    elif os.path.isdir(directory):
+        sequences = find_folder_sequences(directory, expected_sequence_names)
+    else:
         raise ValueError("Submission directory {0} does not exist".format(directory))
 
-    expected_sequence_names = {'{0:06}'.format(idx) for idx in sequence_ids}
+    missing = expected_sequence_names - set(sequences.keys())
+    if len(missing) > 0:
+        raise ValueError("The following sequences do not have any detections submitted: {0}".format(sorted(missing)))
+
+    sequence_names = sorted(sequences.keys())
+    num_images = [None for _ in sequence_names]
+    if data_root is not None:
+        num_images = get_sequence_image_counts(data_root, sequence_names)
+
+    if jobs is None or jobs <= 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(sequences))
+    if cache is not None:
+        validate_sequences_cached([sequences[sequence_name] for sequence_name in sequence_names], cache,
+                                  jobs=jobs, warning_collector=warning_collector, num_images=num_images,
+                                  metrics=metrics)
+    elif jobs <= 1:
+        for sequence_name, sequence_images in zip(sequence_names, num_images):
+            print("Validating submission for sequence {0}...".format(sequence_name))
+            validate_sequence(sequences[sequence_name], warning_collector=warning_collector,
+                              num_images=sequence_images, metrics=metrics)
+    else:
+        validate_sequences_parallel([sequences[sequence_name] for sequence_name in sequence_names], jobs,
+                                    warning_collector=warning_collector, num_images=num_images, metrics=metrics)
+
+
+def get_sequence_image_counts(data_root, sequence_names):
+    """
+    Get the number of test images in each sequence, using the cached image index in the test data folder.
+    :param data_root: The test data folder, containing a folder of images for each sequence
+    :param sequence_names: The names of the sequences
+    :return: A list of the number of images in each sequence, or None for sequences with no folder
+    """
+    if not os.path.isdir(data_root):
+        raise ValueError("Test data directory {0} does not exist".format(data_root))
+    index = image_index.ImageIndex(data_root)
+    num_images = [index.get_image_count(sequence_name) for sequence_name in sequence_names]
+    index.save()
+    for sequence_name, sequence_images in zip(sequence_names, num_images):
+        if sequence_images is None:
+            warnings.warn("There is no folder for sequence {0} in {1}, the number of images will not be checked".format(
+                sequence_name, data_root))
+    return num_images
+
+
+def find_folder_sequences(directory, sequence_names):
+    """
+    Find the json files for each sequence in a submission folder, which may be in sub-folders.
+    If the folder has a manifest listing the sequence files (see submission_builder.SubmissionWriter),
+    and the files listed match it, they are used without searching the folder.
+    Otherwise, the folder is searched once, skipping hidden folders such as '.git'.
+    :param directory: The submission folder
+    :param sequence_names: The set of sequence names to look for
+    :return: A dict mapping sequence name to the path of the json file for that sequence
+    """
+    sequences = _find_manifest_sequences(directory, sequence_names)
+    if sequences is not None:
+        return sequences
+
     sequences = {}
-    for root, _, files in os.walk(directory):
-        for sequence_name in expected_sequence_names:
-            json_file = sequence_name + '.json'
-            if json_file in files:
+    for root, folders, files in os.walk(directory):
+        folders[:] = [folder for folder in folders if not folder.startswith('.')]
+        for json_file in files:
+            sequence_name, extension = os.path.splitext(json_file)
+            if extension == '.json' and sequence_name in sequence_names:
                 if sequence_name in sequences:
                     raise ValueError("{0} : more than one json file found for sequence, {1} and {2}".format(
                         sequence_name,
@@ -161,17 +306,280 @@ def validate_submission(directory, sequence_ids=np.arange(18)):
                     ))
                 else:
                     sequences[sequence_name] = os.path.join(root, json_file)
+    return sequences
+
+
+def _find_manifest_sequences(directory, sequence_names):
+    """
+    Find the json files for each sequence from the manifest in the submission folder, if there is one.
+    The manifest is only used if it lists a finished file for every sequence,
+    and each of those files exists and is the size given in the manifest.
+    :param directory: The submission folder
+    :param sequence_names: The set of sequence names to look for
+    :return: A dict mapping sequence name to the path of the json file, or None if the manifest cannot be used
+    """
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.isfile(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r') as fp:
+            entries = json.load(fp)['sequences']
+    except (ValueError, KeyError, TypeError):
+        warnings.warn("{0} could not be read, searching for the sequence files instead".format(manifest_path))
+        return None
+    sequences = {}
+    for sequence_name in sequence_names:
+        entry = entries.get(sequence_name)
+        if entry is None or not entry.get('complete', False) or not entry.get('path', '').endswith('.json'):
+            # The sequence may have been written some other way, or as an array file that isn't part of the submission
+            return None
+        sequence_path = os.path.join(directory, *entry['path'].split('/'))
+        if not os.path.isfile(sequence_path) or os.path.getsize(sequence_path) != entry.get('bytes'):
+            warnings.warn("{0} does not match the manifest, searching for the sequence files instead".format(
+                sequence_path))
+            return None
+        sequences[sequence_name] = sequence_path
+    return sequences
+
+
+def find_zip_sequences(zip_path, sequence_names):
+    """
+    Find the json files for each sequence in a submission zip file, using the zip's list of members,
+    so nothing needs to be extracted.
+    :param zip_path: The submission zip file
+    :param sequence_names: The set of sequence names to look for
+    :return: A dict mapping sequence name to a (zip path, member name) tuple, see open_sequence
+    """
+    sequences = {}
+    with zipfile.ZipFile(zip_path, 'r') as zip_file:
+        for member_name in zip_file.namelist():
+            sequence_name, extension = posixpath.splitext(posixpath.basename(member_name))
+            if extension == '.json' and sequence_name in sequence_names:
+                if sequence_name in sequences:
+                    raise ValueError("{0} : more than one json file found for sequence, {1} and {2}".format(
+                        sequence_name, sequences[sequence_name][1], member_name))
+                sequences[sequence_name] = (zip_path, member_name)
+    return sequences
+
+
+@contextlib.contextmanager
+def open_sequence(sequence_json):
+    """
+    Open a sequence json file for reading, either a file on disk or a member of a zip file.
+    Use as a context manager:
+    ```
+    with open_sequence(('submission.zip', '000000.json')) as (fp, size):
+        ...
+    ```
+    :param sequence_json: The path to the json file, or a (zip path, member name) tuple
+    :return: A binary file object, and the uncompressed size of the file
+    """
+    if isinstance(sequence_json, tuple):
+        zip_path, member_name = sequence_json
+        with zipfile.ZipFile(zip_path, 'r') as zip_file:
+            with zip_file.open(member_name, 'r') as fp:
+                yield fp, zip_file.getinfo(member_name).file_size
+    else:
+        with open(sequence_json, 'rb') as fp:
+            yield fp, os.path.getsize(sequence_json)
 
-    missing = expected_sequence_names - set(sequences.keys())
-    if len(missing) > 0:
-        raise ValueError("The following sequences do not have any detections submitted: {0}".format(sorted(missing)))
 
-    for sequence_name in sorted(sequences.keys()):
-        print("Validating submission for sequence {0}...".format(sequence_name))
-        validate_sequence(sequences[sequence_name])
+@contextlib.contextmanager
+def open_sequence_reader(sequence_json):
+    """
+    Open a sequence file to read the images one at a time, see sequence_reader.SequenceReader.
+    Binary array files (see sequence_arrays) are read through an object with the same interface,
+    which builds the detection dicts for each image from the arrays, so they get exactly the same checks.
+    Use as a context manager:
+    ```
+    with open_sequence_reader('000000.json') as (header, reader, size):
+        for img_dets in reader.iter_images():
+            ...
+    ```
+    :param sequence_json: The path to the sequence file, or a (zip path, member name) tuple
+    :return: The keys of the sequence other than the detections, the reader, and the size of the file
+    """
+    if sequence_arrays.is_array_file(sequence_json):
+        file_size = os.path.getsize(sequence_json)
+        reader = _ArraySequenceReader(sequence_arrays.load_sequence_arrays(sequence_json), file_size)
+        yield reader.read_header(), reader, file_size
+        return
+    sequence_name = get_sequence_file_name(sequence_json)
+    with open_sequence(sequence_json) as (fp, file_size):
+        # Read the file incrementally, so that only a few images are in memory at a time
+        reader = sequence_reader.SequenceReader(fp, name=sequence_name)
+        header = reader.read_header()
+        if 'classes' not in header and reader.has_detections:
+            # The classes may come after the detections, as SubmissionWriter used to write them.
+            # Look for them at the end of the file first, without parsing all the detections.
+            trailing = sequence_reader.read_trailing_keys(fp, file_size, 'classes')
+            if trailing is not None:
+                header = dict(header, **trailing)
+            else:
+                # Read past the detections to find the classes, then go back
+                for _ in reader.iter_images():
+                    pass
+                header = reader.header
+                fp.seek(0)
+                reader = sequence_reader.SequenceReader(fp, name=sequence_name)
+                reader.read_header()
+        yield header, reader, file_size
 
 
-def validate_sequence(sequence_json):
+class _ArraySequenceReader(object):
+    """
+    Reads the images from a sequence_arrays.SequenceArrays, in the same way as sequence_reader.SequenceReader.
+    The bytes read are estimated from the number of images.
+    """
+
+    def __init__(self, arrays, file_size):
+        self.arrays = arrays
+        self.file_size = file_size
+        self.header = {'classes': arrays.classes}
+        self.has_detections = True
+        self.bytes_read = 0
+
+    def read_header(self):
+        return self.header
+
+    def iter_images(self):
+        for img_idx in range(self.arrays.num_images):
+            yield self.arrays.get_image(img_idx)
+            self.bytes_read = self.file_size * (img_idx + 1) // max(self.arrays.num_images, 1)
+
+
+def get_sequence_file_name(sequence_json):
+    """
+    Get the file name of a sequence, used in error messages
+    :param sequence_json: The path to the json file, or a (zip path, member name) tuple
+    :return: The file name, without any folders
+    """
+    if isinstance(sequence_json, tuple):
+        return posixpath.basename(sequence_json[1])
+    return os.path.basename(sequence_json)
+
+
+def validate_sequences_parallel(sequence_jsons, jobs, warning_collector=None, num_images=None, metrics=None):
+    """
+    Validate several sequence files at once using a pool of processes.
+    The results are reported in the order of the list, as if the sequences were validated one at a time:
+    warnings are re-issued in this process as each sequence is reported,
+    and the error from the first invalid sequence is raised.
+    Instead of the progress for each image, the progress over all the sequences is shown.
+    :param sequence_jsons: The list of sequence json files to validate, as paths or (zip path, member name) tuples
+    :param jobs: The number of processes to use
+    :param warning_collector: A WarningCollector to count warnings, see validate_submission.
+    Each process collects its own warnings, which are merged into this one.
+    :param num_images: A list of the number of images expected in each sequence, or None to not check
+    :param metrics: A ValidationMetrics, to which the measurements from each process are added
+    :return:
+    """
+    max_samples = None if warning_collector is None else warning_collector.max_samples
+    if num_images is None:
+        num_images = [None for _ in sequence_jsons]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_validate_sequence_in_worker, sequence_json, max_samples, sequence_images,
+                               metrics is not None)
+                   for sequence_json, sequence_images in zip(sequence_jsons, num_images)]
+        for idx, (sequence_json, future) in enumerate(zip(sequence_jsons, futures)):
+            caught_warnings, collected, measured, error = future.result()
+            sequence_name = os.path.splitext(get_sequence_file_name(sequence_json))[0]
+            print("\rValidated submission for sequence {0}".format(sequence_name))
+            for message, category in caught_warnings:
+                warnings.warn(message, category)
+            if collected is not None:
+                warning_collector.merge(collected)
+            if measured is not None:
+                metrics.merge(measured)
+            if error is not None:
+                for remaining in futures[idx + 1:]:
+                    remaining.cancel()
+                raise error
+            print_progress((idx + 1) / len(sequence_jsons))
+    print('\r  Complete!                  ')
+
+
+def validate_sequences_cached(sequence_jsons, cache, jobs=1, warning_collector=None, num_images=None,
+                              metrics=None):
+    """
+    Validate several sequence files, re-using the results from a cache for those that have not changed.
+    Sequences that have changed are validated, in parallel if jobs is more than 1, and the results are saved
+    to the cache. Like validate_sequences_parallel, the results are reported in the order of the list.
+    :param sequence_jsons: The list of sequence json files to validate, as paths or (zip path, member name) tuples
+    :param cache: The ValidationCache
+    :param jobs: The number of processes to use
+    :param warning_collector: A WarningCollector, to which the warnings for each sequence are added
+    :param num_images: A list of the number of images expected in each sequence, or None to not check
+    :param metrics: A ValidationMetrics, to record the sequences that are validated
+    :return:
+    """
+    max_samples = 10 if warning_collector is None else warning_collector.max_samples
+    if num_images is None:
+        num_images = [None for _ in sequence_jsons]
+    cached = [cache.get(sequence_json, max_samples, sequence_images)
+              for sequence_json, sequence_images in zip(sequence_jsons, num_images)]
+    pool = None
+    futures = {}
+    if jobs > 1 and sum(1 for entry in cached if entry is None) > 1:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        futures = {idx: pool.submit(_validate_sequence_in_worker, sequence_jsons[idx], max_samples, num_images[idx],
+                                    metrics is not None)
+                   for idx, entry in enumerate(cached) if entry is None}
+    try:
+        for idx, (sequence_json, entry) in enumerate(zip(sequence_jsons, cached)):
+            sequence_name = os.path.splitext(get_sequence_file_name(sequence_json))[0]
+            if entry is not None:
+                print("Sequence {0} has not changed since it was validated".format(sequence_name))
+                collected, error = entry
+            else:
+                print("Validating submission for sequence {0}...".format(sequence_name))
+                if idx in futures:
+                    caught_warnings, collected, measured, error = futures[idx].result()
+                else:
+                    caught_warnings, collected, measured, error = _validate_sequence_in_worker(
+                        sequence_json, max_samples, num_images[idx], metrics is not None)
+                for message, category in caught_warnings:
+                    warnings.warn(message, category)
+                if measured is not None:
+                    metrics.merge(measured)
+                cache.put(sequence_json, collected, error, num_images[idx])
+                cache.save()
+            if warning_collector is not None:
+                warning_collector.merge(collected)
+            if error is not None:
+                raise error
+    finally:
+        if pool is not None:
+            for future in futures.values():
+                future.cancel()
+            pool.shutdown()
+
+
+def _validate_sequence_in_worker(sequence_json, max_samples=None, num_images=None, measure=False):
+    """
+    Validate a sequence in a worker process, see validate_sequences_parallel.
+    Warnings and errors are caught and passed back to the main process, so they can be reported in order.
+    :param sequence_json: The sequence json file to validate
+    :param max_samples: If not None, count the validation warnings with a WarningCollector keeping this many messages
+    :param num_images: The number of images expected in the sequence, or None to not check
+    :param measure: Whether to measure the time and memory taken, with a ValidationMetrics
+    :return: A list of (message, category) for each warning, the WarningCollector or None,
+    the ValidationMetrics or None, and the error that was raised, or None
+    """
+    error = None
+    warning_collector = None if max_samples is None else WarningCollector(max_samples)
+    metrics = ValidationMetrics() if measure else None
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        try:
+            validate_sequence(sequence_json, show_progress=False, warning_collector=warning_collector,
+                              num_images=num_images, metrics=metrics)
+        except Exception as err:
+            error = err
+    return [(str(warning.message), warning.category) for warning in caught], warning_collector, metrics, error
+
+
+def validate_sequence(sequence_json, show_progress=True, warning_collector=None, num_images=None, metrics=None):
     """
     Read and validate a sequence's detections json file.
     json file contains a dictionary which has a key 'detections' containing a list of list of
@@ -186,45 +594,71 @@ def validate_sequence(sequence_json):
             or all zeros (regular BBox).
     Order of list of lists should correspond with ground truth image order.
     If an image does not have any detections, entry should be an empty list.
-    :param sequence_json:
+    :param sequence_json: The path to the json file, or a (zip path, member name) tuple to read it from a zip file.
+    This can also be a binary array file, see sequence_arrays.
+    :param show_progress: Whether to print a progress bar while validating the images
+    :param warning_collector: A WarningCollector to count warnings, instead of issuing each one with warnings.warn
+    :param num_images: The number of images in the sequence. If given, there must be detections for each image.
+    :param metrics: A ValidationMetrics, to record the time taken to read and check the sequence.
+    Invalid sequences are not recorded.
     :return: generator of generator of DetectionInstances for each image
     """
-    with open(sequence_json, 'r') as f:
-        data_dict = json.load(f)
-    sequence_name = os.path.basename(sequence_json)
-
-    # Validate
-    if 'classes' not in data_dict:
-        raise KeyError("{0} : Missing key \'classes\'".format(sequence_name))
-    if 'detections' not in data_dict:
-        raise KeyError("{0} : Missing key \'detections\'".format(sequence_name))
-    if len(set(data_dict['classes']) & (set(CLASS_IDS) | set(SYNONYMS.keys()))) <= 0:
-        raise ValueError("{0} : classes does not contain any recognized classes".format(sequence_name))
+    sequence_name = get_sequence_file_name(sequence_json)
+    start_time = time.perf_counter()
+    check_time = 0
+    num_detections = 0
+    with open_sequence_reader(sequence_json) as (header, reader, file_size):
+        # Validate
+        if 'classes' not in header:
+            raise KeyError("{0} : Missing key \'classes\'".format(sequence_name))
+        if not reader.has_detections:
+            raise KeyError("{0} : Missing key \'detections\'".format(sequence_name))
+        if len(set(header['classes']) & (set(CLASS_IDS) | set(SYNONYMS.keys()))) <= 0:
+            raise ValueError("{0} : classes does not contain any recognized classes".format(sequence_name))
 
-    # Work out which of the submission classes correspond to which of our classes
-    our_class_ids = []
-    sub_class_ids = []
-    for sub_class_id, class_name in enumerate(data_dict['classes']):
-        our_class_id = get_class_id(class_name)
-        if our_class_id is not None:
-            our_class_ids.append(our_class_id),
-            sub_class_ids.append(sub_class_id)
+        # Work out which of the submission classes correspond to which of our classes
+        our_class_ids, sub_class_ids = get_class_mapping(header['classes'])
 
-    # create a detection instance for each detection described by dictionaries in dict_dets
-    dict_dets = data_dict['detections']
-    next_progress = 0
-    for img_idx, img_dets in enumerate(dict_dets):
-        validate_detections(img_dets, (our_class_ids, sub_class_ids),
-                            num_classes=len(data_dict['classes']), img_idx=img_idx, sequence_name=sequence_name)
-        progress = img_idx / len(dict_dets)
-        if progress > next_progress:
-            print_progress(progress)
-            next_progress += 0.05
-    print('\r  Complete!                  ')    # Padding to remove previous lines
+        # Check the images in batches of a few thousand detections, as they are read
+        batch = []
+        batch_detections = 0
+        first_img_idx = 0
+        last_progress_time = start_time
+        for img_dets in reader.iter_images():
+            batch.append(img_dets)
+            if isinstance(img_dets, list):
+                num_detections += len(img_dets)
+            # Count empty images as well, so that the batch is limited in images too
+            batch_detections += max(len(img_dets), 1) if isinstance(img_dets, list) else 1
+            if batch_detections >= VALIDATION_BATCH_SIZE:
+                check_start = time.perf_counter()
+                validate_images(batch, (our_class_ids, sub_class_ids), num_classes=len(header['classes']),
+                                first_img_idx=first_img_idx, sequence_name=sequence_name,
+                                warning_collector=warning_collector)
+                check_end = time.perf_counter()
+                check_time += check_end - check_start
+                first_img_idx += len(batch)
+                batch = []
+                batch_detections = 0
+                if show_progress and check_end - last_progress_time >= PROGRESS_INTERVAL:
+                    print_progress(reader.bytes_read / max(file_size, 1))
+                    last_progress_time = check_end
+        check_start = time.perf_counter()
+        validate_images(batch, (our_class_ids, sub_class_ids), num_classes=len(header['classes']),
+                        first_img_idx=first_img_idx, sequence_name=sequence_name, warning_collector=warning_collector)
+        check_time += time.perf_counter() - check_start
+        if num_images is not None and first_img_idx + len(batch) != num_images:
+            raise ValueError("{0} : There are detections for {1} images, but the sequence has {2} images".format(
+                sequence_name, first_img_idx + len(batch), num_images))
+    if metrics is not None:
+        metrics.add(sequence_name, time.perf_counter() - start_time, check_time, file_size,
+                    first_img_idx + len(batch), num_detections)
+    if show_progress:
+        print('\r  Complete!                  ')    # Padding to remove previous lines
 
 
 def validate_detections(img_dets, class_mapping, num_classes=len(CLASSES), img_idx=-1,
-                        sequence_name='unknown'):
+                        sequence_name='unknown', warning_collector=None):
     """
     Validate detections for a given image.
 
@@ -240,67 +674,623 @@ def validate_detections(img_dets, class_mapping, num_classes=len(CLASSES), img_i
     :param num_classes: The number of classes to expect
     :param img_idx: The current image index, for error reporting
     :param sequence_name: The current image name, for error reporting
+    :param warning_collector: A WarningCollector to count warnings, instead of issuing each one with warnings.warn
     :return: generator of DetectionInstances
     """
-    for det_idx, det in enumerate(img_dets):
-        if 'label_probs' not in det:
-            raise KeyError(make_error_msg("missing key \'label_probs\'", sequence_name, img_idx, det_idx))
-        if 'bbox' not in det:
-            raise KeyError(make_error_msg("missing key \'bbox\'", sequence_name, img_idx, det_idx))
-        if len(det['label_probs']) != num_classes:
-            raise KeyError(make_error_msg("The number of class probabilities doesn't match the number of classes",
-                                          sequence_name, img_idx, det_idx))
-        if len(det['bbox']) != 4:
-            raise ValueError(make_error_msg("The bounding box must contain exactly 4 entries",
-                                            sequence_name, img_idx, det_idx))
-        if det['bbox'][2] < det['bbox'][0]:
-            raise ValueError(make_error_msg("The x1 coordinate must be less than the x2 coordinate",
-                                            sequence_name, img_idx, det_idx))
-        if det['bbox'][3] < det['bbox'][1]:
-            raise ValueError(make_error_msg("The y1 coordinate must be less than the y2 coordinate",
-                                            sequence_name, img_idx, det_idx))
-
-        # Use numpy list indexing to move specific indexes from the submission
-        label_probs = np.zeros(len(CLASSES), dtype=np.float32)
-        label_probs[class_mapping[0]] = np.array(det['label_probs'])[class_mapping[1]]
-        total_prob = np.sum(label_probs)
-
-        if total_prob > 0.5:  # Arbitrary theshold for classes we care about.
-            # Normalize the label probability
-            if total_prob > 1:
-                warnings.warn(make_error_msg("The class probabilities were greater than 1, and were normalized",
-                                             sequence_name, img_idx, det_idx))
-                label_probs /= total_prob
-            if 'covars' in det and det['covars'] != [[[0, 0], [0, 0]], [[0, 0], [0, 0]]]:
-                covars = np.array(det['covars'])
-                if covars.shape != (2, 2, 2):
-                    raise ValueError(make_error_msg("Key 'covars' must contain 2 2x2 matrices",
-                                                    sequence_name, img_idx, det_idx))
-                if not np.allclose(covars.transpose((0, 2, 1)), covars):
-                    raise ValueError(make_error_msg("Given covariances are not symmetric",
-                                                    sequence_name, img_idx, det_idx))
-                if not is_positive_semi_definite(covars[0]):
-                    raise ValueError(make_error_msg("The upper-left covariance is not positive semi-definite",
-                                                    sequence_name, img_idx, det_idx))
-                if not is_positive_semi_definite(covars[1]):
-                    raise ValueError(make_error_msg("The lower-right covariance is not positive semi-definite",
-                                                    sequence_name, img_idx, det_idx))
-        else:
-            warnings.warn(make_error_msg("The detection was ignored as it's total probability across "
-                                         "all known classes was {0}, which is less than 0.5".format(total_prob),
-                                         sequence_name, img_idx, det_idx))
+    validate_images([img_dets], class_mapping, num_classes=num_classes, first_img_idx=img_idx,
+                    sequence_name=sequence_name, warning_collector=warning_collector)
+
+
+def validate_images(images, class_mapping, num_classes=len(CLASSES), first_img_idx=0, sequence_name='unknown',
+                    warning_collector=None):
+    """
+    Validate the detections for several images at once.
+    This gives the same errors and warnings as calling validate_detections for each image in turn,
+    but the detections are stacked into arrays and checked together, which is much faster.
+    The first invalid detection is found from the arrays, and is then checked on its own to raise the error.
+    If the detections are too malformed to be stacked, they are checked one at a time instead.
+
+    :param images: A list of lists of detections, one for each image. See validate_detections
+    :param class_mapping: A pair of lists of indexes, the first to our class list, and the second to theirs
+    :param num_classes: The number of classes to expect
+    :param first_img_idx: The index of the first image in the sequence, for error reporting
+    :param sequence_name: The current image name, for error reporting
+    :param warning_collector: A WarningCollector to count warnings, instead of issuing each one with warnings.warn
+    :return:
+    """
+    detections = [det for img_dets in images for det in img_dets]
+    img_indices = []
+    det_indices = []
+    for img_idx, img_dets in enumerate(images):
+        img_indices.extend([first_img_idx + img_idx] * len(img_dets))
+        det_indices.extend(range(len(img_dets)))
+    img_indices = np.array(img_indices, dtype=np.int64)
+    det_indices = np.array(det_indices, dtype=np.int64)
+
+    try:
+        num_valid, total_probs = _check_detection_arrays(detections, class_mapping, num_classes)
+    except (TypeError, ValueError, IndexError):
+        # The detections are malformed in some way that stops them being stacked, check them individually
+        num_valid, total_probs = 0, np.zeros(0, dtype=np.float32)
+
+    # Warn about the valid detections that are ignored or normalized, see _validate_detection
+    is_ignored = ~(total_probs > 0.5)
+    is_normalized = (total_probs > 0.5) & (total_probs > 1)
+    if warning_collector is not None:
+        warning_collector.add_many('ignored', sequence_name, img_indices[:num_valid][is_ignored],
+                                   det_indices[:num_valid][is_ignored], total_probs[is_ignored])
+        warning_collector.add_many('normalized', sequence_name, img_indices[:num_valid][is_normalized],
+                                   det_indices[:num_valid][is_normalized])
+    else:
+        for idx in np.nonzero(is_ignored | is_normalized)[0]:
+            _report_warning(None, 'ignored' if is_ignored[idx] else 'normalized', sequence_name,
+                            img_indices[idx], det_indices[idx], total_probs[idx])
+
+    for idx in range(num_valid, len(detections)):
+        # This should raise an error for the first detection, but keep checking in case it doesn't
+        _validate_detection(detections[idx], class_mapping, num_classes, int(img_indices[idx]),
+                            int(det_indices[idx]), sequence_name, warning_collector)
+
+
+def _check_detection_arrays(detections, class_mapping, num_classes):
+    """
+    Find how many detections pass all the checks in validate_detections, checking them as arrays.
+    Each check is only done for the detections that passed the previous checks,
+    so that the returned warnings match what checking each detection in turn would produce.
+    :param detections: A flat list of detection dicts
+    :param class_mapping: A pair of lists of indexes, the first to our class list, and the second to theirs
+    :param num_classes: The number of classes to expect
+    :return: The number of detections before the first invalid one,
+    and the total probability of the known classes for each of those detections
+    """
+    num_valid = _count_leading_true([
+        'label_probs' in det and 'bbox' in det for det in detections
+    ])
+    probs = [det['label_probs'] for det in detections[:num_valid]]
+    boxes = [det['bbox'] for det in detections[:num_valid]]
+    num_valid = _count_leading_true([
+        len(det_probs) == num_classes and len(bbox) == 4 for det_probs, bbox in zip(probs, boxes)
+    ])
+
+    boxes = _stack_numbers(boxes[:num_valid], (num_valid, 4))
+    num_valid = _count_leading_true(~((boxes[:, 2] < boxes[:, 0]) | (boxes[:, 3] < boxes[:, 1])))
+
+    # Use numpy list indexing to move specific indexes from the submission
+    probs = _stack_numbers(probs[:num_valid], (num_valid, num_classes))
+    label_probs = np.zeros((num_valid, len(CLASSES)), dtype=np.float32)
+    label_probs[:, np.asarray(class_mapping[0], dtype=np.intp)] = \
+        probs[:, np.asarray(class_mapping[1], dtype=np.intp)]
+    total_probs = np.sum(label_probs, axis=1)
+    is_used = total_probs > 0.5   # Arbitrary theshold for classes we care about.
+
+    # Check the covariances of the detections that are used, ignoring those that are all zero
+    zero_covars = [[[0, 0], [0, 0]], [[0, 0], [0, 0]]]
+    covar_indices = [idx for idx in np.nonzero(is_used)[0]
+                     if 'covars' in detections[idx] and detections[idx]['covars'] != zero_covars]
+    covars = [detections[idx]['covars'] for idx in covar_indices]
+    num_shaped = _count_leading_true([_has_shape(covar, (2, 2, 2)) for covar in covars])
+    if num_shaped < len(covars):
+        num_valid = int(covar_indices[num_shaped])
+        covar_indices = covar_indices[:num_shaped]
+    if len(covar_indices) > 0:
+        covars = _stack_numbers(covars[:num_shaped], (num_shaped, 2, 2, 2))
+        covars_valid = np.all(covariance_checks.is_symmetric_mask(covars, rtol=1e-5, atol=1e-8), axis=1) & \
+            np.all(covariance_checks.is_positive_semi_definite_mask(covars), axis=1)
+        first_invalid = covariance_checks.first_failure(covars_valid)
+        if first_invalid is not None:
+            num_valid = min(num_valid, int(covar_indices[first_invalid]))
+
+    return num_valid, total_probs[:num_valid]
+
+
+def _count_leading_true(mask):
+    """
+    Count how many entries at the start of a boolean list are true, that is, find the first false entry.
+    :param mask: A list or array of booleans
+    :return: The index of the first false entry, or the length of the list if they are all true
+    """
+    first_false = covariance_checks.first_failure(np.asarray(mask, dtype=bool).reshape(-1))
+    return len(mask) if first_false is None else first_false
+
+
+def _has_shape(values, shape):
+    """
+    Check if nested lists have a particular shape, without raising an error if they are ragged.
+    :param values: The nested lists
+    :param shape: The expected shape
+    :return: True if np.shape of the values is the given shape
+    """
+    try:
+        return np.shape(values) == shape
+    except ValueError:
+        return False
+
+
+def _stack_numbers(values, shape):
+    """
+    Stack a list of lists of numbers into a single array, with an expected shape.
+    :param values: The nested lists of numbers
+    :param shape: The shape the stacked array must have
+    :return: A numeric numpy array of the given shape
+    :raises ValueError: If the values are not all numbers, or are the wrong shape
+    """
+    if len(values) <= 0:
+        return np.zeros(shape, dtype=np.float64)
+    array = np.array(values)
+    if array.shape != shape or array.dtype.kind not in 'biuf':
+        raise ValueError("Values cannot be stacked into an array of shape {0}".format(shape))
+    return array
+
+
+def _validate_detection(det, class_mapping, num_classes, img_idx, det_idx, sequence_name, warning_collector=None):
+    """
+    Validate a single detection, see validate_detections.
+    :param det: The detection dict
+    :param class_mapping: A pair of lists of indexes, the first to our class list, and the second to theirs
+    :param num_classes: The number of classes to expect
+    :param img_idx: The index of the image containing the detection, for error reporting
+    :param det_idx: The index of the detection within the image, for error reporting
+    :param sequence_name: The current image name, for error reporting
+    :param warning_collector: A WarningCollector to count warnings, or None to issue them with warnings.warn
+    :return:
+    """
+    if 'label_probs' not in det:
+        raise KeyError(make_error_msg("missing key \'label_probs\'", sequence_name, img_idx, det_idx))
+    if 'bbox' not in det:
+        raise KeyError(make_error_msg("missing key \'bbox\'", sequence_name, img_idx, det_idx))
+    if len(det['label_probs']) != num_classes:
+        raise KeyError(make_error_msg("The number of class probabilities doesn't match the number of classes",
+                                      sequence_name, img_idx, det_idx))
+    if len(det['bbox']) != 4:
+        raise ValueError(make_error_msg("The bounding box must contain exactly 4 entries",
+                                        sequence_name, img_idx, det_idx))
+    if det['bbox'][2] < det['bbox'][0]:
+        raise ValueError(make_error_msg("The x1 coordinate must be less than the x2 coordinate",
+                                        sequence_name, img_idx, det_idx))
+    if det['bbox'][3] < det['bbox'][1]:
+        raise ValueError(make_error_msg("The y1 coordinate must be less than the y2 coordinate",
+                                        sequence_name, img_idx, det_idx))
+
+    # Use numpy list indexing to move specific indexes from the submission
+    label_probs = np.zeros(len(CLASSES), dtype=np.float32)
+    label_probs[class_mapping[0]] = np.array(det['label_probs'])[class_mapping[1]]
+    total_prob = np.sum(label_probs)
+
+    if total_prob > 0.5:  # Arbitrary theshold for classes we care about.
+        # Normalize the label probability
+        if total_prob > 1:
+            _report_warning(warning_collector, 'normalized', sequence_name, img_idx, det_idx)
+            label_probs /= total_prob
+        if 'covars' in det and det['covars'] != [[[0, 0], [0, 0]], [[0, 0], [0, 0]]]:
+            if not _has_shape(det['covars'], (2, 2, 2)):
+                raise ValueError(make_error_msg("Key 'covars' must contain 2 2x2 matrices",
+                                                sequence_name, img_idx, det_idx))
+            covars = np.array(det['covars'])
+            if not np.all(covariance_checks.is_symmetric_mask(covars, rtol=1e-5, atol=1e-8)):
+                raise ValueError(make_error_msg("Given covariances are not symmetric",
+                                                sequence_name, img_idx, det_idx))
+            is_psd = covariance_checks.is_positive_semi_definite_mask(covars)
+            if not is_psd[0]:
+                raise ValueError(make_error_msg("The upper-left covariance is not positive semi-definite",
+                                                sequence_name, img_idx, det_idx))
+            if not is_psd[1]:
+                raise ValueError(make_error_msg("The lower-right covariance is not positive semi-definite",
+                                                sequence_name, img_idx, det_idx))
+    else:
+        _report_warning(warning_collector, 'ignored', sequence_name, img_idx, det_idx, total_prob)
+
+
+def _report_warning(warning_collector, category, sequence_name, img_idx, det_idx, value=None):
+    """
+    Report a warning about a detection, either to a collector, or with warnings.warn
+    :param warning_collector: The WarningCollector, or None
+    :param category: The kind of warning, a key in WARNING_MESSAGES
+    :param sequence_name: The name of the sequence containing the detection
+    :param img_idx: The index of the image the detection was made on
+    :param det_idx: The index of the detection within that image
+    :param value: A value to include in the message, such as the total probability
+    :return:
+    """
+    if warning_collector is None:
+        warnings.warn(make_error_msg(WARNING_MESSAGES[category].format(value), sequence_name, img_idx, det_idx))
+    else:
+        warning_collector.add(category, sequence_name, img_idx, det_idx, value)
+
+
+class WarningCollector(object):
+    """
+    Collects validation warnings, instead of issuing each one with warnings.warn.
+    Some submissions produce a warning for most detections, so rather than building every message,
+    this counts the warnings for each category, sequence, and image, and keeps only the first few
+    as examples. Messages are only formatted for the examples, when the summary is printed.
+    ```
+    collector = WarningCollector()
+    validate_submission('submission', warning_collector=collector)
+    collector.print_summary()
+    ```
+    """
+
+    def __init__(self, max_samples=10):
+        """
+        :param max_samples: The number of example warnings to keep
+        """
+        self.max_samples = max_samples
+        self._image_counts = {}     # The number of warnings for each image, by (category, sequence name)
+        self._samples = []          # (category, sequence name, image index, detection index, value)
+
+    @property
+    def total(self):
+        """
+        :return: The total number of warnings collected
+        """
+        return sum(sum(counts.values()) for counts in self._image_counts.values())
+
+    def add(self, category, sequence_name, img_idx, det_idx, value=None):
+        """
+        Record a single warning.
+        :param category: The kind of warning, a key in WARNING_MESSAGES
+        :param sequence_name: The name of the sequence containing the detection
+        :param img_idx: The index of the image the detection was made on
+        :param det_idx: The index of the detection within that image
+        :param value: The value to include in the message, if any
+        :return:
+        """
+        counts = self._image_counts.setdefault((category, sequence_name), {})
+        counts[img_idx] = counts.get(img_idx, 0) + 1
+        if len(self._samples) < self.max_samples:
+            self._samples.append((category, sequence_name, img_idx, det_idx, value))
+
+    def add_many(self, category, sequence_name, img_indices, det_indices, values=None):
+        """
+        Record the same kind of warning for many detections at once.
+        :param category: The kind of warning, a key in WARNING_MESSAGES
+        :param sequence_name: The name of the sequence containing the detections
+        :param img_indices: An array of the image index of each detection
+        :param det_indices: An array of the index of each detection within its image
+        :param values: An array of the value to include in the message for each detection, or None
+        :return:
+        """
+        if len(img_indices) <= 0:
+            return
+        counts = self._image_counts.setdefault((category, sequence_name), {})
+        for img_idx, count in zip(*np.unique(img_indices, return_counts=True)):
+            counts[int(img_idx)] = counts.get(int(img_idx), 0) + int(count)
+        for idx in range(min(len(img_indices), self.max_samples - len(self._samples))):
+            self._samples.append((category, sequence_name, int(img_indices[idx]), int(det_indices[idx]),
+                                  None if values is None else values[idx]))
+
+    def to_dict(self):
+        """
+        Convert the collected warnings to a dict that can be saved as json, see ValidationCache
+        :return: A dict of the counts and examples
+        """
+        return {
+            'image_counts': [
+                [category, sequence_name, {str(img_idx): count for img_idx, count in counts.items()}]
+                for (category, sequence_name), counts in self._image_counts.items()
+            ],
+            'samples': [
+                [category, sequence_name, img_idx, det_idx, None if value is None else float(value)]
+                for category, sequence_name, img_idx, det_idx, value in self._samples
+            ]
+        }
+
+    @classmethod
+    def from_dict(cls, data, max_samples=10):
+        """
+        Re-create a collector from a dict made by 'to_dict'
+        :param data: The dict of counts and examples
+        :param max_samples: The number of example warnings to keep
+        :return: A new WarningCollector
+        """
+        collector = cls(max_samples)
+        for category, sequence_name, counts in data['image_counts']:
+            collector._image_counts[(category, sequence_name)] = {
+                int(img_idx): count for img_idx, count in counts.items()}
+        collector._samples = [tuple(sample) for sample in data['samples'][:max_samples]]
+        return collector
+
+    def merge(self, other):
+        """
+        Add the warnings from another collector to this one, such as from validating a different sequence.
+        :param other: Another WarningCollector
+        :return:
+        """
+        for key, other_counts in other._image_counts.items():
+            counts = self._image_counts.setdefault(key, {})
+            for img_idx, count in other_counts.items():
+                counts[img_idx] = counts.get(img_idx, 0) + count
+        self._samples.extend(other._samples[:max(0, self.max_samples - len(self._samples))])
+
+    def count(self, category=None, sequence_name=None):
+        """
+        Count the warnings, either all of them, or for a particular category and/or sequence
+        :param category: The kind of warning to count, or None for all of them
+        :param sequence_name: The sequence to count warnings for, or None for all of them
+        :return: The number of warnings
+        """
+        return sum(
+            sum(counts.values()) for (key_category, key_sequence), counts in self._image_counts.items()
+            if (category is None or key_category == category) and
+            (sequence_name is None or key_sequence == sequence_name)
+        )
+
+    def get_image_counts(self, category, sequence_name):
+        """
+        :param category: The kind of warning
+        :param sequence_name: The name of the sequence
+        :return: A dict of the number of warnings for each image index
+        """
+        return dict(self._image_counts.get((category, sequence_name), {}))
+
+    def get_messages(self):
+        """
+        :return: The full messages for the example warnings that were kept
+        """
+        return [make_error_msg(WARNING_MESSAGES[category].format(value), sequence_name, img_idx, det_idx)
+                for category, sequence_name, img_idx, det_idx, value in self._samples]
+
+    def summary(self):
+        """
+        :return: A short description of the warnings, with a line for each category and sequence
+        """
+        if len(self._image_counts) <= 0:
+            return "No warnings"
+        lines = ["{0} warnings:".format(self.total)]
+        for category in sorted(set(key_category for key_category, _ in self._image_counts.keys())):
+            sequence_names = sorted(key_sequence for key_category, key_sequence in self._image_counts.keys()
+                                    if key_category == category)
+            lines.append("  {0}: {1} detections in {2} sequences".format(
+                category, self.count(category=category), len(sequence_names)))
+            for sequence_name in sequence_names:
+                counts = self._image_counts[(category, sequence_name)]
+                lines.append("    {0}: {1} detections in {2} images".format(
+                    sequence_name, sum(counts.values()), len(counts)))
+        lines.append("  Examples:")
+        lines.extend("    " + message for message in self.get_messages())
+        return '\n'.join(lines)
+
+    def print_summary(self):
+        """
+        Print the summary of the warnings.
+        :return:
+        """
+        print(self.summary())
+
+
+class ValidationMetrics(object):
+    """
+    Measurements of how long validation takes, so that the cost of validating can be tracked as submissions grow.
+    For each sequence, records the total time, the time spent checking the detections
+    (the rest is spent reading and parsing the file), the file size, the number of images and detections,
+    and the peak memory use of the process so far.
+    """
+
+    def __init__(self):
+        self.sequences = []
+
+    def add(self, sequence_name, wall_time, check_time, num_bytes, num_images, num_detections):
+        """
+        Record the measurements for a sequence, along with the current peak memory use.
+        :param sequence_name: The name of the sequence file
+        :param wall_time: The total time taken to validate the sequence, in seconds
+        :param check_time: The time spent checking the detections, in seconds
+        :param num_bytes: The size of the sequence file
+        :param num_images: The number of images in the sequence
+        :param num_detections: The total number of detections in the sequence
+        :return:
+        """
+        self.sequences.append({
+            'sequence': sequence_name,
+            'wall_time': wall_time,
+            'parse_time': max(wall_time - check_time, 0.0),
+            'check_time': check_time,
+            'bytes': num_bytes,
+            'images': num_images,
+            'detections': num_detections,
+            'bytes_per_second': num_bytes / wall_time if wall_time > 0 else None,
+            'detections_per_second': num_detections / wall_time if wall_time > 0 else None,
+            'peak_rss_bytes': get_peak_rss()
+        })
+
+    def merge(self, other):
+        """
+        Add the measurements from another ValidationMetrics, such as one from a worker process.
+        :param other: Another ValidationMetrics
+        :return:
+        """
+        self.sequences.extend(other.sequences)
+
+    def to_dict(self):
+        """
+        Get the measurements for each sequence, and the totals over all of them, for serializing as json.
+        When validating in parallel, the total wall time is the sum over the sequences,
+        and the peak memory use is the largest of any one process.
+        :return: A dict of the metrics
+        """
+        wall_time = sum(entry['wall_time'] for entry in self.sequences)
+        num_bytes = sum(entry['bytes'] for entry in self.sequences)
+        num_detections = sum(entry['detections'] for entry in self.sequences)
+        peak_rss = [entry['peak_rss_bytes'] for entry in self.sequences if entry['peak_rss_bytes'] is not None]
+        return {
+            'validator_version': VALIDATOR_VERSION,
+            'sequences': list(self.sequences),
+            'total': {
+                'wall_time': wall_time,
+                'parse_time': sum(entry['parse_time'] for entry in self.sequences),
+                'check_time': sum(entry['check_time'] for entry in self.sequences),
+                'bytes': num_bytes,
+                'images': sum(entry['images'] for entry in self.sequences),
+                'detections': num_detections,
+                'bytes_per_second': num_bytes / wall_time if wall_time > 0 else None,
+                'detections_per_second': num_detections / wall_time if wall_time > 0 else None,
+                'peak_rss_bytes': max(peak_rss) if len(peak_rss) > 0 else None
+            }
+        }
+
+    def save(self, output_file):
+        """
+        Write the metrics to a json file.
+        :param output_file: The file to write to
+        :return:
+        """
+        with open(output_file, 'w') as fp:
+            json.dump(self.to_dict(), fp, indent=2)
+
+
+def get_peak_rss():
+    """
+    Get the peak memory use (resident set size) of this process.
+    :return: The peak memory use in bytes, or None if it cannot be measured on this platform
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, but OSX reports bytes
+    return int(peak_rss) if sys.platform == 'darwin' else int(peak_rss) * 1024
+
+
+class ValidationCache(object):
+    """
+    A record of the results of validating each sequence file, saved to a json file,
+    so that sequences that have not changed do not need to be validated again.
+    Each entry records the size, modification time, and hash of the file, the VALIDATOR_VERSION,
+    whether the sequence was valid (or the error if it was not), and the warnings.
+    Files whose modification time has changed are hashed to check if the contents actually changed.
+    For members of a zip file, the size and CRC from the zip are used instead, so nothing needs to be read.
+    ```
+    cache = ValidationCache('validation_cache.json')
+    validate_submission('submission', warning_collector=collector, cache=cache)
+    ```
+    """
+
+    def __init__(self, cache_file):
+        """
+        :param cache_file: The json file to store the results in. It is read if it exists.
+        """
+        self.cache_file = cache_file
+        self._entries = {}
+        if os.path.isfile(cache_file):
+            with open(cache_file, 'r') as fp:
+                data = json.load(fp)
+            if data.get('version') == VALIDATOR_VERSION:
+                self._entries = data.get('sequences', {})
+
+    def get(self, sequence_json, max_samples=10, num_images=None):
+        """
+        Get the cached result for a sequence file, if the file has not changed.
+        :param sequence_json: The path to the json file, or a (zip path, member name) tuple
+        :param max_samples: The number of example warnings to keep
+        :param num_images: The number of images the sequence was checked against, which must be the same
+        :return: A WarningCollector of the sequence's warnings and the error it raised (or None),
+        or None if the result is not cached or the file has changed.
+        """
+        entry = self._entries.get(get_sequence_key(sequence_json))
+        if entry is None or entry.get('num_images') != num_images:
+            return None
+        fingerprint = get_sequence_fingerprint(sequence_json)
+        if fingerprint['size'] != entry['size']:
+            return None
+        if isinstance(sequence_json, tuple):
+            if fingerprint['crc'] != entry.get('crc'):
+                return None
+        elif fingerprint['mtime'] != entry['mtime']:
+            # The file has been modified, but may still be the same, check the contents
+            if _hash_file(sequence_json) != entry.get('sha256'):
+                return None
+            entry['mtime'] = fingerprint['mtime']
+
+        error = None
+        if entry['error'] is not None:
+            error_type, message = entry['error']
+            error = {'KeyError': KeyError}.get(error_type, ValueError)(message)
+        return WarningCollector.from_dict(entry['warnings'], max_samples), error
+
+    def put(self, sequence_json, warning_collector, error=None, num_images=None):
+        """
+        Record the result of validating a sequence file.
+        Only validation errors (KeyError and ValueError) are recorded, other errors may not happen next time.
+        :param sequence_json: The path to the json file, or a (zip path, member name) tuple
+        :param warning_collector: The WarningCollector containing the warnings for only this sequence
+        :param error: The error raised when validating the sequence, or None if it is valid
+        :param num_images: The number of images the sequence was checked against, if any
+        :return:
+        """
+        key = get_sequence_key(sequence_json)
+        if error is not None and not isinstance(error, (KeyError, ValueError)):
+            self._entries.pop(key, None)
+            return
+        entry = get_sequence_fingerprint(sequence_json)
+        if not isinstance(sequence_json, tuple):
+            entry['sha256'] = _hash_file(sequence_json)
+        entry['num_images'] = num_images
+        entry['warnings'] = warning_collector.to_dict()
+        entry['error'] = None
+        if error is not None:
+            entry['error'] = [type(error).__name__, error.args[0] if len(error.args) > 0 else str(error)]
+        self._entries[key] = entry
+
+    def save(self):
+        """
+        Write the cache file, replacing the old one in a single step so it is never left half written.
+        :return:
+        """
+        with open(self.cache_file + '.tmp', 'w') as fp:
+            json.dump({'version': VALIDATOR_VERSION, 'sequences': self._entries}, fp)
+        os.replace(self.cache_file + '.tmp', self.cache_file)
+
+
+def get_sequence_key(sequence_json):
+    """
+    Get a unique key for a sequence file, for caching results, see ValidationCache.
+    :param sequence_json: The path to the json file, or a (zip path, member name) tuple
+    :return: The absolute path of the file, or of the zip file followed by the member name
+    """
+    if isinstance(sequence_json, tuple):
+        return os.path.abspath(sequence_json[0]) + '/' + sequence_json[1]
+    return os.path.abspath(sequence_json)
+
+
+def get_sequence_fingerprint(sequence_json):
+    """
+    Get the size and modification time of a sequence file, or for a zip member, the size and CRC,
+    to tell if it has changed without reading it.
+    :param sequence_json: The path to the json file, or a (zip path, member name) tuple
+    :return: A dict of the size, and either mtime or crc
+    """
+    if isinstance(sequence_json, tuple):
+        with zipfile.ZipFile(sequence_json[0], 'r') as zip_file:
+            info = zip_file.getinfo(sequence_json[1])
+        return {'size': info.file_size, 'crc': info.CRC}
+    stat = os.stat(sequence_json)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _hash_file(path, chunk_size=1 << 20):
+    """
+    Get the sha256 hash of a file, reading it in chunks
+    :param path: The file to hash
+    :param chunk_size: The amount to read at a time
+    :return: The hex digest of the hash
+    """
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        chunk = fp.read(chunk_size)
+        while len(chunk) > 0:
+            file_hash.update(chunk)
+            chunk = fp.read(chunk_size)
+    return file_hash.hexdigest()
 
 
 def is_positive_semi_definite(mat):
     """
     Check if a matrix is positive semi-definite, that is, all it's eigenvalues are positive.
     All covariance matrices must be positive semi-definite.
-    Only works on symmetric matrices (due to eigh), so check that first
+    Only works on symmetric 2x2 matrices (uses the lower triangle), so check that first
     :param mat:
     :return: True iff the matrix is positive semi-definite
     """
-    eigvals, _ = np.linalg.eigh(mat)
-    return np.all(eigvals >= -1e-14)
+    return bool(covariance_checks.is_positive_semi_definite_mask(mat))
 
 
 def make_error_msg(msg, sequence_name, img_idx, det_idx):
@@ -330,6 +1320,23 @@ def get_class_id(class_name):
     return None
 
 
+def get_class_mapping(class_list):
+    """
+    Work out which classes in a submission's class list correspond to which of our classes.
+    Classes that are not part of the challenge are left out.
+    :param class_list: The list of class names from the submission
+    :return: A pair of lists of indexes, the first to our class list, and the second to the submission's class list
+    """
+    our_class_ids = []
+    sub_class_ids = []
+    for sub_class_id, class_name in enumerate(class_list):
+        our_class_id = get_class_id(class_name)
+        if our_class_id is not None:
+            our_class_ids.append(our_class_id)
+            sub_class_ids.append(sub_class_id)
+    return our_class_ids, sub_class_ids
+
+
 def print_progress(progress):
     """
     Print a progress bar, see https://stackoverflow.com/questions/3002085/python-to-print-out-status-bar-and-percentage
@@ -345,15 +1352,52 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Validator script for submissions to the challenge. '
                                                  'Call this script on a submission to check for errors and invalid '
                                                  'values in your submission before uploading.')
-    parser.add_argument('submission_directory', type=str, help='The folder containing the submission to validate. '
+    parser.add_argument('submission_directory', type=str, help='The folder containing the submission to validate, '
+                                                               'or the submission zip file. '
                                                                'Zip up and submit this folder when done.')
     parser.add_argument('-q', '--quiet', action='store_true',
-                        help='Suppress warning messages, which may occur when class probabilities are '
+                        help='Suppress the summary of warnings, which may occur when class probabilities are '
                              'not normalized or detections are ignored. These are not errors, '
                              'and may produce excessive output')
+    parser.add_argument('--warning-examples', type=int, default=10,
+                        help='The number of example warning messages to show in the summary. Default 10.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='The number of sequences to validate at once, in separate processes. '
+                             'Use 0 for the number of CPUs. Default 1.')
+    parser.add_argument('--data-root', type=str, default=None,
+                        help='The test data folder. If given, check that there are detections for every image '
+                             'in each sequence.')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='A file to save the results for each sequence in. When run again with the same file, '
+                             'sequences that have not changed are not validated again.')
+    parser.add_argument('--metrics-out', type=str, default=None,
+                        help='A json file to write the time, throughput, and peak memory use '
+                             'for validating each sequence to.')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='Profile the validator with cProfile, and save the stats to this file. '
+                             'View them with "python -m pstats". With --jobs, only the main process is profiled.')
     args = parser.parse_args()
 
     if args.quiet:
         warnings.simplefilter('ignore')
 
-    validate_submission(args.submission_directory)
+    collector = WarningCollector(max_samples=args.warning_examples)
+    run_metrics = None if args.metrics_out is None else ValidationMetrics()
+    profiler = None
+    if args.profile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        validate_submission(args.submission_directory, jobs=args.jobs, warning_collector=collector,
+                            cache=None if args.cache is None else ValidationCache(args.cache),
+                            data_root=args.data_root, metrics=run_metrics)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print("Saved profile to {0}".format(args.profile))
+        if run_metrics is not None:
+            run_metrics.save(args.metrics_out)
+        if not args.quiet:
+            collector.print_summary()
@@ -0,0 +1,295 @@
+"""
+Benchmarks for the submission builder and validator, on synthetic submissions.
+
+Each benchmark case generates random detections for a number of sequences, then times
+building the detections with make_detection, writing them with SubmissionWriter, and validating the written files.
+Each stage is timed, and run again under tracemalloc to measure its peak memory use.
+Run from the root of the starter kit:
+```
+python -m tests.benchmark --output benchmark.json
+```
+Use '--quick' for a few small cases that run in a second or two, see also tests/test_benchmark.py.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import json
+import os
+import os.path
+import shutil
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+import submission_builder
+import submission_validator
+
+
+# The parameters of the synthetic submission, see make_synthetic_sequence and make_class_list
+DEFAULT_PARAMS = {
+    'sequences': 4,
+    'images_per_sequence': 200,
+    'detections_per_image': 20,
+    'num_classes': len(submission_validator.CLASSES),
+    'covars': True,
+    'shuffle_classes': False,
+    'synonyms': False,
+    'seed': 0
+}
+
+BENCHMARK_CASES = [
+    {'name': 'default'},
+    {'name': 'no_covars', 'covars': False},
+    {'name': 'dense', 'images_per_sequence': 50, 'detections_per_image': 200},
+    {'name': 'sparse', 'images_per_sequence': 2000, 'detections_per_image': 1},
+    {'name': 'shuffled_synonyms', 'shuffle_classes': True, 'synonyms': True},
+    {'name': 'large_class_list', 'num_classes': 200, 'shuffle_classes': True}
+]
+
+QUICK_CASES = [
+    {'name': 'quick', 'sequences': 2, 'images_per_sequence': 10, 'detections_per_image': 5},
+    {'name': 'quick_shuffled_no_covars', 'sequences': 2, 'images_per_sequence': 10, 'detections_per_image': 5,
+     'covars': False, 'shuffle_classes': True, 'synonyms': True, 'num_classes': 40}
+]
+
+
+def get_params(case):
+    """
+    Fill in the default parameters for a benchmark case
+    :param case: A dict of the parameters that differ from DEFAULT_PARAMS
+    :return: The full dict of parameters, without the name
+    """
+    params = dict(DEFAULT_PARAMS)
+    params.update({key: value for key, value in case.items() if key != 'name'})
+    return params
+
+
+def make_class_list(num_classes, shuffle=False, synonyms=False, seed=0):
+    """
+    Make a class list for a synthetic submission.
+    This starts from the challenge classes, and adds extra classes that are not part of the challenge
+    (or drops some of the challenge classes) to get the right length.
+    :param num_classes: The number of classes
+    :param shuffle: Put the classes in a random order
+    :param synonyms: Use a synonym for each of the classes that have one, such as 'tv' for 'television'
+    :param seed: The random seed for the order
+    :return: A list of class names
+    """
+    class_list = list(submission_validator.CLASSES[:num_classes])
+    class_list += ['extra class {0}'.format(idx) for idx in range(num_classes - len(class_list))]
+    if synonyms:
+        alternatives = {}
+        for synonym, class_name in sorted(submission_validator.SYNONYMS.items()):
+            alternatives.setdefault(class_name, synonym)
+        class_list = [alternatives.get(class_name, class_name) for class_name in class_list]
+    if shuffle:
+        np.random.RandomState(seed).shuffle(class_list)
+    return class_list
+
+
+def make_synthetic_sequence(num_images, detections_per_image, num_classes, covars=True, seed=0):
+    """
+    Make random detections for a sequence of images.
+    Class probabilities are drawn from a Dirichlet distribution, so that most of the probability is in a few classes,
+    and covariances are random positive definite matrices.
+    :param num_images: The number of images in the sequence
+    :param detections_per_image: The number of detections in each image
+    :param num_classes: The length of the class list
+    :param covars: Whether to make covariances for each detection
+    :param seed: The random seed
+    :return: A list of (class probabilities, boxes, covariances) arrays for each image, in the form taken by
+    SubmissionWriter.add_detections. The covariances are None if covars is false.
+    """
+    random = np.random.RandomState(seed)
+    images = []
+    for _ in range(num_images):
+        probs = random.dirichlet(np.full(num_classes, 0.1), size=detections_per_image)
+        corners = random.uniform(0, 600, size=(detections_per_image, 2))
+        sizes = random.uniform(10, 200, size=(detections_per_image, 2))
+        boxes = np.concatenate([corners, corners + sizes], axis=1)
+        image_covars = None
+        if covars:
+            factors = random.normal(0, 3, size=(detections_per_image, 2, 2, 2))
+            image_covars = np.matmul(factors, np.swapaxes(factors, -1, -2))
+        images.append((probs, boxes, image_covars))
+    return images
+
+
+def make_synthetic_submission(params):
+    """
+    Make the class list and detections for each sequence of a synthetic submission.
+    :param params: The parameters of the submission, see DEFAULT_PARAMS
+    :return: The class list, and a dict of the images in each sequence, see make_synthetic_sequence
+    """
+    class_list = make_class_list(params['num_classes'], params['shuffle_classes'], params['synonyms'], params['seed'])
+    sequences = {
+        '{0:06}'.format(idx): make_synthetic_sequence(
+            params['images_per_sequence'], params['detections_per_image'], params['num_classes'],
+            covars=params['covars'], seed=params['seed'] + idx)
+        for idx in range(params['sequences'])
+    }
+    return class_list, sequences
+
+
+def write_submission(submission_folder, class_list, sequences):
+    """
+    Write a synthetic submission with SubmissionWriter
+    :param submission_folder: The folder to write to
+    :param class_list: The class list
+    :param sequences: The images in each sequence, see make_synthetic_submission
+    :return:
+    """
+    writer = submission_builder.SubmissionWriter(submission_folder, class_list)
+    for sequence_name in sorted(sequences.keys()):
+        for probs, boxes, covars in sequences[sequence_name]:
+            writer.add_detections(probs, boxes, covars)
+            writer.next_image()
+        writer.save_sequence(sequence_name)
+    writer.close()
+
+
+def make_all_detections(sequences):
+    """
+    Build the detections for every image one at a time with make_detection, as a simple detector loop would.
+    :param sequences: The images in each sequence, see make_synthetic_submission
+    :return:
+    """
+    for images in sequences.values():
+        for probs, boxes, covars in images:
+            for idx in range(len(boxes)):
+                submission_builder.make_detection(
+                    probs[idx].tolist(), *boxes[idx].tolist(),
+                    upper_left_cov=None if covars is None else covars[idx, 0].tolist(),
+                    lower_right_cov=None if covars is None else covars[idx, 1].tolist())
+
+
+def validate_files(submission_folder, sequence_names):
+    """
+    Validate each of the sequence files in a submission folder, counting the warnings rather than issuing them.
+    :param submission_folder: The submission folder
+    :param sequence_names: The names of the sequences
+    :return:
+    """
+    collector = submission_validator.WarningCollector()
+    for sequence_name in sequence_names:
+        submission_validator.validate_sequence(os.path.join(submission_folder, '{0}.json'.format(sequence_name)),
+                                               show_progress=False, warning_collector=collector)
+
+
+def measure(func, repeat=1):
+    """
+    Time a function, and measure its peak memory use.
+    The function is called 'repeat' times to find the fastest time, and once more under tracemalloc for the memory,
+    since tracing the allocations slows it down.
+    :param func: The function to measure, which takes no arguments
+    :param repeat: The number of times to time it
+    :return: The fastest time in seconds, and the peak memory allocated, in bytes
+    """
+    times = []
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), peak_memory
+
+
+def run_case(case, output_folder, repeat=1):
+    """
+    Run the benchmarks for one case.
+    :param case: The benchmark case, a dict with a 'name' and the parameters that differ from DEFAULT_PARAMS
+    :param output_folder: A folder to write the submission in, it is removed afterwards
+    :param repeat: The number of times to time each stage
+    :return: A list of results for each stage
+    """
+    params = get_params(case)
+    class_list, sequences = make_synthetic_submission(params)
+    num_detections = params['sequences'] * params['images_per_sequence'] * params['detections_per_image']
+    submission_folder = os.path.join(output_folder, case['name'])
+
+    def write():
+        if os.path.isdir(submission_folder):
+            shutil.rmtree(submission_folder)
+        write_submission(submission_folder, class_list, sequences)
+
+    stages = [
+        ('make_detection', lambda: make_all_detections(sequences)),
+        ('write', write),
+        ('validate', lambda: validate_files(submission_folder, sorted(sequences.keys())))
+    ]
+    results = []
+    try:
+        for stage, func in stages:
+            seconds, peak_memory = measure(func, repeat)
+            result = {
+                'case': case['name'],
+                'stage': stage,
+                'params': params,
+                'seconds': seconds,
+                'peak_memory_bytes': peak_memory,
+                'detections': num_detections,
+                'detections_per_second': num_detections / seconds if seconds > 0 else None
+            }
+            if stage == 'write':
+                result['bytes'] = sum(
+                    os.path.getsize(os.path.join(submission_folder, '{0}.json'.format(sequence_name)))
+                    for sequence_name in sequences.keys())
+            results.append(result)
+    finally:
+        if os.path.isdir(submission_folder):
+            shutil.rmtree(submission_folder)
+    return results
+
+
+def run_benchmarks(cases, output_folder=None, repeat=1, verbose=True):
+    """
+    Run the benchmarks for several cases.
+    :param cases: The list of benchmark cases, see BENCHMARK_CASES
+    :param output_folder: A folder to write the submissions to. By default, a temporary folder is used.
+    :param repeat: The number of times to time each stage
+    :param verbose: Print the results for each stage as they finish
+    :return: A list of results, for each stage of each case
+    """
+    temp_folder = None
+    if output_folder is None:
+        temp_folder = tempfile.mkdtemp(prefix='starter_kit_benchmark')
+        output_folder = temp_folder
+    results = []
+    try:
+        for case in cases:
+            for result in run_case(case, output_folder, repeat):
+                if verbose:
+                    print("{0: <26} {1: <15} {2: >9.3f}s {3: >12.0f} detections/s {4: >8.1f} MB".format(
+                        result['case'], result['stage'], result['seconds'], result['detections_per_second'] or 0,
+                        result['peak_memory_bytes'] / (1 << 20)))
+                results.append(result)
+    finally:
+        if temp_folder is not None:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the submission builder and validator '
+                                                 'on synthetic submissions.')
+    parser.add_argument('--quick', action='store_true', help='Run only a few small cases, as a quick check.')
+    parser.add_argument('--case', type=str, action='append', default=None,
+                        help='Run only the case with this name. Can be given more than once.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='The number of times to time each stage, the fastest is reported. Default 3.')
+    parser.add_argument('--output', type=str, default=None, help='A json file to write the results to.')
+    args = parser.parse_args()
+
+    selected = QUICK_CASES if args.quick else BENCHMARK_CASES
+    if args.case is not None:
+        selected = [case for case in BENCHMARK_CASES + QUICK_CASES if case['name'] in args.case]
+    benchmark_results = run_benchmarks(selected, repeat=1 if args.quick else args.repeat)
+    if args.output is not None:
+        with open(args.output, 'w') as fp:
+            json.dump({'results': benchmark_results}, fp, indent=2)
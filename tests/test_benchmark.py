@@ -0,0 +1,83 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os.path
+import shutil
+import numpy as np
+
+import tests.test_helpers as th
+import tests.benchmark as benchmark
+import covariance_checks
+import submission_validator
+
+
+class TestMakeClassList(th.ExtendedTestCase):
+
+    def test_uses_challenge_classes(self):
+        self.assertEqual(submission_validator.CLASSES, benchmark.make_class_list(len(submission_validator.CLASSES)))
+        self.assertEqual(submission_validator.CLASSES[:5], benchmark.make_class_list(5))
+
+    def test_adds_extra_classes(self):
+        class_list = benchmark.make_class_list(50)
+        self.assertEqual(50, len(class_list))
+        self.assertEqual(50, len(set(class_list)))
+        self.assertEqual(submission_validator.CLASSES, class_list[:len(submission_validator.CLASSES)])
+        for class_name in class_list[len(submission_validator.CLASSES):]:
+            self.assertIsNone(submission_validator.get_class_id(class_name))
+
+    def test_shuffles_and_uses_synonyms(self):
+        class_list = benchmark.make_class_list(len(submission_validator.CLASSES), shuffle=True, synonyms=True)
+        self.assertNotEqual(submission_validator.CLASSES, class_list)
+        self.assertNotIn('television', class_list)
+        self.assertNotIn('dining table', class_list)
+        self.assertIn('diningtable', class_list)
+        self.assertEqual(set(range(len(submission_validator.CLASSES))),
+                         {submission_validator.get_class_id(class_name) for class_name in class_list})
+
+
+class TestMakeSyntheticSequence(th.ExtendedTestCase):
+
+    def test_makes_valid_detections(self):
+        images = benchmark.make_synthetic_sequence(5, 7, 12, covars=True, seed=3)
+        self.assertEqual(5, len(images))
+        for probs, boxes, covars in images:
+            self.assertEqual((7, 12), probs.shape)
+            self.assertNPClose(np.ones(7), np.sum(probs, axis=1))
+            self.assertTrue(np.all(boxes[:, 0] < boxes[:, 2]))
+            self.assertTrue(np.all(boxes[:, 1] < boxes[:, 3]))
+            self.assertEqual((7, 2, 2, 2), covars.shape)
+            self.assertTrue(np.all(covariance_checks.is_symmetric_mask(covars)))
+            self.assertTrue(np.all(covariance_checks.is_positive_semi_definite_mask(covars)))
+
+    def test_can_leave_out_covars(self):
+        for _, _, covars in benchmark.make_synthetic_sequence(3, 2, 4, covars=False):
+            self.assertIsNone(covars)
+
+    def test_same_seed_gives_same_detections(self):
+        first = benchmark.make_synthetic_sequence(2, 3, 4, seed=6)
+        second = benchmark.make_synthetic_sequence(2, 3, 4, seed=6)
+        for image_1, image_2 in zip(first, second):
+            for array_1, array_2 in zip(image_1, image_2):
+                self.assertNPEqual(array_1, array_2)
+
+
+class TestRunBenchmarks(th.ExtendedTestCase):
+    temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def test_quick_cases(self):
+        results = benchmark.run_benchmarks(benchmark.QUICK_CASES, self.temp_dir, verbose=False)
+        self.assertEqual([(case['name'], stage) for case in benchmark.QUICK_CASES
+                          for stage in ['make_detection', 'write', 'validate']],
+                         [(result['case'], result['stage']) for result in results])
+        for result in results:
+            self.assertEqual(100, result['detections'])
+            self.assertGreater(result['seconds'], 0)
+            self.assertGreater(result['peak_memory_bytes'], 0)
+            if result['stage'] == 'write':
+                self.assertGreater(result['bytes'], 0)
+
+        # The submissions are cleaned up afterwards
+        self.assertEqual([], os.listdir(self.temp_dir))
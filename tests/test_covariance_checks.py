@@ -0,0 +1,58 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import numpy as np
+
+import tests.test_helpers as th
+import covariance_checks
+
+
+class TestIsSymmetricMask(th.ExtendedTestCase):
+
+    def test_checks_stack_of_matrices(self):
+        mats = np.array([[[3, 1], [1, 4]], [[3, 2], [1, 3]], [[1, 0], [0, 1]]])
+        self.assertNPEqual([True, False, True], covariance_checks.is_symmetric_mask(mats))
+
+    def test_checks_multiple_leading_dimensions(self):
+        mats = np.array([
+            [[[3, 1], [1, 4]], [[3, 2], [1, 3]]],
+            [[[1, 0], [0, 1]], [[5, 6], [6, 8]]]
+        ])
+        self.assertNPEqual([[True, False], [True, True]], covariance_checks.is_symmetric_mask(mats))
+
+    def test_uses_tolerance(self):
+        mats = np.array([[[3, 1], [1 + 1e-9, 4]]])
+        self.assertNPEqual([False], covariance_checks.is_symmetric_mask(mats))
+        self.assertNPEqual([True], covariance_checks.is_symmetric_mask(mats, rtol=1e-5, atol=1e-8))
+
+
+class TestIsPositiveSemiDefiniteMask(th.ExtendedTestCase):
+
+    def test_matches_eigh(self):
+        random = np.random.RandomState(16)
+        mats = random.uniform(-10, 10, size=(1000, 2, 2))
+        mats = (mats + mats.transpose((0, 2, 1))) / 2
+        eigvals = np.linalg.eigvalsh(mats)
+        self.assertNPEqual(np.all(eigvals >= -1e-14, axis=1), covariance_checks.is_positive_semi_definite_mask(mats))
+
+    def test_accepts_singular_matrices(self):
+        mats = np.array([[[1, 1], [1, 1]], [[0, 0], [0, 0]], [[4, 0], [0, 0]]])
+        self.assertNPEqual([True, True, True], covariance_checks.is_positive_semi_definite_mask(mats))
+
+    def test_rejects_indefinite_matrices(self):
+        mats = np.array([[[1, 2], [2, 1]], [[-1, 0], [0, 1]], [[np.nan, 0], [0, 1]]])
+        self.assertNPEqual([False, False, False], covariance_checks.is_positive_semi_definite_mask(mats))
+
+    def test_checks_single_matrix(self):
+        self.assertTrue(covariance_checks.is_positive_semi_definite_mask([[3, 1], [1, 4]]))
+        self.assertFalse(covariance_checks.is_positive_semi_definite_mask([[1, 4], [4, 1]]))
+
+
+class TestFirstFailure(th.ExtendedTestCase):
+
+    def test_finds_first_failure(self):
+        self.assertEqual(2, covariance_checks.first_failure([True, True, False, False]))
+        self.assertEqual((1, 0), covariance_checks.first_failure([[True, True], [False, True], [True, False]]))
+
+    def test_returns_none_if_all_pass(self):
+        self.assertIsNone(covariance_checks.first_failure([True, True]))
+        self.assertIsNone(covariance_checks.first_failure(np.ones((0, 2), dtype=bool)))
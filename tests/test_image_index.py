@@ -0,0 +1,85 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os
+import os.path
+import shutil
+import json
+
+import tests.test_helpers as th
+import image_index
+
+
+class TestImageIndex(th.ExtendedTestCase):
+    temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def make_sequence(self, sequence_name, num_images, start=0):
+        sequence_folder = os.path.join(self.temp_dir, sequence_name)
+        os.makedirs(sequence_folder, exist_ok=True)
+        for idx in range(start, start + num_images):
+            with open(os.path.join(sequence_folder, '{0:06}.png'.format(idx)), 'w') as fp:
+                fp.write('')
+        return sequence_folder
+
+    def test_lists_images_in_order(self):
+        sequence_folder = self.make_sequence('000000', 12)
+        with open(os.path.join(sequence_folder, 'readme.txt'), 'w') as fp:
+            fp.write('')
+        index = image_index.ImageIndex(self.temp_dir)
+        self.assertEqual(['{0:06}.png'.format(idx) for idx in range(12)], index.get_images('000000'))
+        self.assertEqual(12, index.get_image_count('000000'))
+
+    def test_missing_sequence_is_none(self):
+        self.make_sequence('000000', 3)
+        index = image_index.ImageIndex(self.temp_dir)
+        self.assertIsNone(index.get_images('000001'))
+        self.assertIsNone(index.get_image_count('000001'))
+
+    def test_sequence_names_skips_files_and_hidden_folders(self):
+        self.make_sequence('000001', 2)
+        self.make_sequence('000000', 2)
+        self.make_sequence('.hidden', 2)
+        index = image_index.ImageIndex(self.temp_dir)
+        index.save()
+        self.assertEqual(['000000', '000001'], index.sequence_names)
+
+    def test_saves_and_reuses_index(self):
+        self.make_sequence('000000', 5)
+        index = image_index.ImageIndex(self.temp_dir)
+        self.assertEqual(5, index.get_image_count('000000'))
+        self.assertTrue(index.save())
+        self.assertTrue(os.path.isfile(os.path.join(self.temp_dir, image_index.INDEX_NAME)))
+
+        # Change the cached list, so we can tell it is read from the cache rather than the folder
+        cache_file = os.path.join(self.temp_dir, image_index.INDEX_NAME)
+        with open(cache_file, 'r') as fp:
+            data = json.load(fp)
+        data['sequences']['000000']['images'] = ['a.png']
+        with open(cache_file, 'w') as fp:
+            json.dump(data, fp)
+        index = image_index.ImageIndex(self.temp_dir)
+        self.assertEqual(['a.png'], index.get_images('000000'))
+
+    def test_reindexes_changed_folder(self):
+        sequence_folder = self.make_sequence('000000', 5)
+        index = image_index.ImageIndex(self.temp_dir)
+        self.assertEqual(5, index.get_image_count('000000'))
+        index.save()
+
+        self.make_sequence('000000', 2, start=5)
+        stat = os.stat(sequence_folder)
+        os.utime(sequence_folder, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+        index = image_index.ImageIndex(self.temp_dir)
+        self.assertEqual(7, index.get_image_count('000000'))
+
+    def test_rebuilds_corrupt_cache(self):
+        self.make_sequence('000000', 4)
+        os.makedirs(self.temp_dir, exist_ok=True)
+        with open(os.path.join(self.temp_dir, image_index.INDEX_NAME), 'w') as fp:
+            fp.write('{not json')
+        index = image_index.ImageIndex(self.temp_dir)
+        self.assertEqual(4, index.get_image_count('000000'))
+        self.assertTrue(index.save())
@@ -0,0 +1,168 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os.path
+import itertools
+import shutil
+import json
+import unittest.mock as mock
+import numpy as np
+
+import tests.test_helpers as th
+import local_scorer
+import submission_validator
+
+
+def make_probs(class_name, prob=1.0):
+    probs = [0.0] * len(submission_validator.CLASSES)
+    probs[submission_validator.CLASSES.index(class_name)] = prob
+    return probs
+
+
+class TestBoxIoU(th.ExtendedTestCase):
+
+    def test_computes_iou(self):
+        boxes_1 = np.array([[0, 0, 10, 10], [0, 0, 10, 10], [0, 0, 10, 10], [0, 0, 0, 0]], dtype=np.float64)
+        boxes_2 = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30], [0, 0, 0, 0]], dtype=np.float64)
+        self.assertNPClose([1, 1 / 3, 0, 0], local_scorer.box_iou(boxes_1, boxes_2))
+
+
+class TestGetImagePairs(th.ExtendedTestCase):
+
+    def test_pairs_everything_in_each_image(self):
+        det_offsets = np.array([0, 2, 2, 5, 6])
+        gt_offsets = np.array([0, 1, 3, 5, 5])
+        image_ids, det_ids, gt_ids = local_scorer.get_image_pairs(det_offsets, gt_offsets)
+        expected = [(0, 0, 0), (0, 1, 0),
+                    (2, 2, 3), (2, 2, 4), (2, 3, 3), (2, 3, 4), (2, 4, 3), (2, 4, 4)]
+        self.assertEqual(expected, list(zip(image_ids.tolist(), det_ids.tolist(), gt_ids.tolist())))
+
+
+class TestMatchPairs(th.ExtendedTestCase):
+
+    def brute_force_best(self, grid):
+        num_dets, num_gts = grid.shape
+        best = 0
+        for perm in itertools.permutations(range(max(num_dets, num_gts)), num_dets):
+            best = max(best, sum(grid[det, gt] for det, gt in enumerate(perm) if gt < num_gts))
+        return best
+
+    def test_each_detection_and_object_used_once(self):
+        random = np.random.RandomState(13)
+        for num_dets, num_gts in [(1, 1), (3, 2), (2, 3), (4, 4)]:
+            grid = random.uniform(0, 1, size=(num_dets, num_gts))
+            grid[grid < 0.3] = 0
+            image_ids, det_ids, gt_ids = local_scorer.get_image_pairs(np.array([0, num_dets]), np.array([0, num_gts]))
+            for assignment in [local_scorer.linear_sum_assignment, None]:
+                with mock.patch.object(local_scorer, 'linear_sum_assignment', assignment):
+                    chosen = local_scorer.match_pairs(image_ids, det_ids, gt_ids, grid.ravel())
+                self.assertEqual(len(chosen), len(set(det_ids[chosen])))
+                self.assertEqual(len(chosen), len(set(gt_ids[chosen])))
+                self.assertTrue(np.all(grid.ravel()[chosen] > 0))
+                total = np.sum(grid.ravel()[chosen])
+                if assignment is not None:
+                    self.assertAlmostEqual(self.brute_force_best(grid), total)
+                else:
+                    self.assertLessEqual(total, self.brute_force_best(grid) + 1e-12)
+
+    def test_no_pairs(self):
+        empty = np.zeros(0, dtype=np.intp)
+        self.assertEqual(0, len(local_scorer.match_pairs(empty, empty, empty, np.zeros(0))))
+
+
+class TestScoreSubmission(th.ExtendedTestCase):
+    temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def make_ground_truth(self, sequence_name, images):
+        folder = os.path.join(self.temp_dir, 'ground_truth', sequence_name)
+        os.makedirs(folder, exist_ok=True)
+        labels = {}
+        for img_idx, objects in enumerate(images):
+            labels['{0:06}'.format(img_idx)] = {'_metadata': {'mask_name': 'mask.png'}}
+            for obj_idx, (class_name, bbox) in enumerate(objects):
+                labels['{0:06}'.format(img_idx)][str(obj_idx + 1)] = {
+                    'class': class_name, 'bbox': bbox, 'mask_id': obj_idx + 1}
+        with open(os.path.join(folder, local_scorer.LABELS_NAME), 'w') as fp:
+            json.dump(labels, fp)
+
+    def make_submission(self, sequence_name, detections, classes=None):
+        folder = os.path.join(self.temp_dir, 'submission')
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, '{0}.json'.format(sequence_name)), 'w') as fp:
+            json.dump({
+                'classes': submission_validator.CLASSES if classes is None else classes,
+                'detections': detections
+            }, fp)
+
+    def score(self):
+        return local_scorer.score_submission(os.path.join(self.temp_dir, 'submission'),
+                                             os.path.join(self.temp_dir, 'ground_truth'))
+
+    def test_perfect_submission_scores_one(self):
+        self.make_ground_truth('000000', [
+            [('cup', [10, 10, 20, 20]), ('bottle', [30, 30, 50, 60])],
+            [],
+            [('tv', [0, 0, 100, 100])]
+        ])
+        self.make_submission('000000', [
+            [{'label_probs': make_probs('bottle'), 'bbox': [30, 30, 50, 60]},
+             {'label_probs': make_probs('cup'), 'bbox': [10, 10, 20, 20]}],
+            [],
+            [{'label_probs': make_probs('television'), 'bbox': [0, 0, 100, 100]}]
+        ])
+        scores = self.score()
+        for name in ['000000', 'total']:
+            self.assertEqual(1.0, scores[name]['score'])
+            self.assertEqual(3, scores[name]['true_positives'])
+            self.assertEqual(0, scores[name]['false_positives'])
+            self.assertEqual(0, scores[name]['false_negatives'])
+
+    def test_scores_partial_matches(self):
+        self.make_ground_truth('000000', [
+            [('cup', [0, 0, 10, 10])],
+            [('cup', [0, 0, 10, 10])]
+        ])
+        self.make_ground_truth('000001', [
+            [('bottle', [0, 0, 10, 10])]
+        ])
+        self.make_submission('000000', [
+            [{'label_probs': make_probs('cup', 0.6) + [0.4], 'bbox': [5, 0, 15, 10]},
+             {'label_probs': make_probs('cup') + [0], 'bbox': [50, 50, 60, 60]}],
+            []
+        ], classes=submission_validator.CLASSES + ['zebra'])
+        self.make_submission('000001', [
+            [{'label_probs': make_probs('bottle', 0.5), 'bbox': [0, 0, 10, 10]}],
+        ])
+        scores = self.score()
+        self.assertEqual(1, scores['000000']['true_positives'])
+        self.assertEqual(1, scores['000000']['false_positives'])
+        self.assertEqual(1, scores['000000']['false_negatives'])
+        self.assertAlmostEqual(1 / 3, scores['000000']['avg_iou'])
+        self.assertAlmostEqual(0.6, scores['000000']['avg_label_prob'])
+        self.assertAlmostEqual(np.sqrt(0.2) / 3, scores['000000']['score'])
+
+        # The only detection in the second sequence is ignored, since its probability is not more than 0.5
+        self.assertEqual(0, scores['000001']['detections'])
+        self.assertEqual(0.0, scores['000001']['score'])
+
+        self.assertEqual(1, scores['total']['true_positives'])
+        self.assertEqual(1, scores['total']['false_positives'])
+        self.assertEqual(2, scores['total']['false_negatives'])
+        self.assertAlmostEqual(np.sqrt(0.2) / 4, scores['total']['score'])
+
+    def test_errors_if_number_of_images_differs(self):
+        self.make_ground_truth('000000', [[], []])
+        self.make_submission('000000', [[]])
+        with self.assertRaises(ValueError):
+            self.score()
+
+    def test_errors_if_sequence_missing(self):
+        self.make_ground_truth('000000', [[]])
+        self.make_ground_truth('000001', [[]])
+        self.make_submission('000000', [[]])
+        with self.assertRaises(ValueError) as cm:
+            self.score()
+        self.assertIn('000001', str(cm.exception))
@@ -0,0 +1,95 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os.path
+import shutil
+import json
+import numpy as np
+
+import tests.test_helpers as th
+import sequence_arrays
+import submission_builder
+
+
+class TestSequenceArrays(th.ExtendedTestCase):
+    temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def make_arrays(self):
+        probs = np.array([[0.1, 0.9], [0.5, 0.5], [1, 0]], dtype=np.float32)
+        boxes = np.array([[1, 2, 3, 4], [12.5, 14, 55, 46.123456789], [1e-3, 2, 1234567, 4]])
+        covars = np.zeros((3, 2, 2, 2))
+        covars[2] = [[[1, 0], [0, 1]], [[2, 0], [0, 2]]]
+        has_covars = np.array([False, False, True])
+        image_offsets = np.array([0, 1, 1, 3])
+        return ['cup', 'bottle'], probs, boxes, covars, has_covars, image_offsets
+
+    def save(self, file_name='000000.npz'):
+        os.makedirs(self.temp_dir, exist_ok=True)
+        array_file = os.path.join(self.temp_dir, file_name)
+        sequence_arrays.save_sequence_arrays(array_file, *self.make_arrays())
+        return array_file
+
+    def test_save_and_load(self):
+        array_file = self.save()
+        classes, probs, boxes, covars, has_covars, image_offsets = self.make_arrays()
+        for mmap in [True, False]:
+            arrays = sequence_arrays.load_sequence_arrays(array_file, mmap=mmap)
+            self.assertEqual(classes, arrays.classes)
+            self.assertNPEqual(probs, arrays.probs)
+            self.assertNPEqual(boxes, arrays.boxes)
+            self.assertNPEqual(covars, arrays.covars)
+            self.assertNPEqual(has_covars, arrays.has_covars)
+            self.assertNPEqual(image_offsets, arrays.image_offsets)
+            self.assertEqual(3, arrays.num_images)
+            self.assertEqual(3, arrays.num_detections)
+            self.assertEqual(mmap, isinstance(arrays.boxes, np.memmap))
+
+    def test_loads_empty_sequence(self):
+        os.makedirs(self.temp_dir, exist_ok=True)
+        array_file = os.path.join(self.temp_dir, '000000.npz')
+        sequence_arrays.save_sequence_arrays(array_file, ['cup'], np.zeros((0, 1)), np.zeros((0, 4)),
+                                             np.zeros((0, 2, 2, 2)), np.zeros(0, dtype=bool), [0, 0, 0])
+        arrays = sequence_arrays.load_sequence_arrays(array_file)
+        self.assertEqual(2, arrays.num_images)
+        self.assertEqual([], arrays.get_image(1))
+
+    def test_get_image(self):
+        arrays = sequence_arrays.load_sequence_arrays(self.save())
+        self.assertEqual([{'label_probs': [np.float32(0.1).item(), np.float32(0.9).item()], 'bbox': [1, 2, 3, 4]}],
+                         arrays.get_image(0))
+        self.assertEqual([], arrays.get_image(1))
+        image = arrays.get_image(2)
+        self.assertEqual(2, len(image))
+        self.assertNotIn('covars', image[0])
+        self.assertEqual([[[1, 0], [0, 1]], [[2, 0], [0, 2]]], image[1]['covars'])
+
+    def test_is_array_file(self):
+        self.assertTrue(sequence_arrays.is_array_file('submission/000000.npz'))
+        self.assertFalse(sequence_arrays.is_array_file('submission/000000.json'))
+        self.assertFalse(sequence_arrays.is_array_file(('submission.zip', '000000.npz')))
+
+    def test_converts_to_same_json_as_writer(self):
+        classes = ['cup', 'bottle', 'tv']
+        random = np.random.RandomState(3)
+        outputs = []
+        for output_format in ['json', 'npz']:
+            writer = submission_builder.SubmissionWriter(os.path.join(self.temp_dir, output_format), classes,
+                                                         output_format=output_format)
+            for num_detections in [3, 0, 5]:
+                writer.add_detections(random.dirichlet(np.ones(3), size=num_detections),
+                                      np.tile([[1, 2, 14, 15]], (num_detections, 1)))
+                writer.add_detection([0.2, 0.3, 0.5], 1, 2, 3, 4, [[1, 0], [0, 1]], [[2, 0], [0, 2]])
+                writer.next_image()
+            writer.save_sequence('000000')
+            outputs.append(os.path.join(self.temp_dir, output_format, '000000.' + output_format))
+            random = np.random.RandomState(3)
+        self.assertEqual(['000000'], sequence_arrays.convert_folder(os.path.join(self.temp_dir, 'npz'),
+                                                                    os.path.join(self.temp_dir, 'converted')))
+        with open(outputs[0], 'r') as fp:
+            expected = fp.read()
+        with open(os.path.join(self.temp_dir, 'converted', '000000.json'), 'r') as fp:
+            self.assertEqual(expected, fp.read())
+        self.assertEqual(6, len(json.loads(expected)['detections'][2]))
@@ -0,0 +1,150 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os.path
+import shutil
+import json
+import time
+import threading
+import unittest.mock as mock
+import numpy as np
+
+import tests.test_helpers as th
+import sequence_iterator
+import submission_builder
+
+
+def read_text(image_path):
+    """
+    Stand in for decoding an image, the test images are text files
+    """
+    with open(image_path, 'r') as fp:
+        return fp.read()
+
+
+class TestSequenceIterator(th.ExtendedTestCase):
+    temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def make_data(self, sequences):
+        data_root = os.path.join(self.temp_dir, 'test_data')
+        for sequence_name, num_images in sequences.items():
+            folder = os.path.join(data_root, sequence_name)
+            os.makedirs(folder, exist_ok=True)
+            # Write the images out of order, so that the folder is not listed in order
+            for img_idx in reversed(range(num_images)):
+                with open(os.path.join(folder, '{0:06}.png'.format(img_idx)), 'w') as fp:
+                    fp.write('{0}/{1}'.format(sequence_name, img_idx))
+        return data_root
+
+    def test_gives_images_in_order(self):
+        data_root = self.make_data({'000001': 12, '000000': 3})
+        random = np.random.RandomState(4)
+        delays = {}
+
+        def slow_load(image_path):
+            # Later images often finish first
+            time.sleep(delays.setdefault(image_path, random.uniform(0, 0.01)))
+            return read_text(image_path)
+
+        images = sequence_iterator.SequenceIterator(data_root, num_workers=4, prefetch=5, load_image=slow_load)
+        self.assertEqual(['000000', '000001'], images.sequence_names)
+        results = [(sequence_name, list(sequence_images)) for sequence_name, sequence_images in images]
+        self.assertEqual([
+            ('000000', [(idx, '000000/{0}'.format(idx)) for idx in range(3)]),
+            ('000001', [(idx, '000001/{0}'.format(idx)) for idx in range(12)])
+        ], results)
+
+    def test_limits_images_decoded_ahead(self):
+        data_root = self.make_data({'000000': 20})
+        lock = threading.Lock()
+        loaded = []
+
+        def counting_load(image_path):
+            with lock:
+                loaded.append(image_path)
+            return read_text(image_path)
+
+        images = sequence_iterator.SequenceIterator(data_root, num_workers=2, prefetch=3, load_image=counting_load)
+        for img_idx, _ in images.iter_sequence('000000'):
+            time.sleep(0.002)
+            with lock:
+                self.assertLessEqual(len(loaded), img_idx + 3)
+        self.assertEqual(20, len(loaded))
+
+    def test_drives_writer(self):
+        data_root = self.make_data({'000000': 3, '000001': 2})
+        output = os.path.join(self.temp_dir, 'submission')
+        with submission_builder.SubmissionWriter(output, ['cup', 'bottle'], streaming=True) as writer:
+            images = sequence_iterator.SequenceIterator(data_root, writer=writer, load_image=read_text)
+            for sequence_name, sequence_images in images:
+                for img_idx, image in sequence_images:
+                    for _ in range(img_idx):
+                        writer.add_detection([0.2, 0.8], 1, 2, 3, 4)
+        for sequence_name, num_images in [('000000', 3), ('000001', 2)]:
+            with open(os.path.join(output, sequence_name + '.json'), 'r') as fp:
+                detections = json.load(fp)['detections']
+            self.assertEqual(list(range(num_images)), [len(image_dets) for image_dets in detections])
+
+    def test_skips_complete_sequences(self):
+        data_root = self.make_data({'000000': 2, '000001': 2})
+        output = os.path.join(self.temp_dir, 'submission')
+        writer = submission_builder.SubmissionWriter(output, ['cup', 'bottle'])
+        for _ in sequence_iterator.SequenceIterator(data_root, writer=writer, load_image=read_text).iter_sequence(
+                '000000'):
+            pass
+        writer.flush()
+        images = sequence_iterator.SequenceIterator(data_root, writer=writer, load_image=read_text)
+        self.assertEqual(['000001'], images.sequence_names)
+        images = sequence_iterator.SequenceIterator(data_root, writer=writer, skip_complete=False,
+                                                    load_image=read_text)
+        self.assertEqual(['000000', '000001'], images.sequence_names)
+        writer.close()
+
+    def test_stopping_early_does_not_save(self):
+        data_root = self.make_data({'000000': 5})
+        writer = mock.create_autospec(submission_builder.SubmissionWriter, instance=True)
+        writer.is_complete.return_value = False
+        images = sequence_iterator.SequenceIterator(data_root, writer=writer, load_image=read_text)
+        for img_idx, _ in images.iter_sequence('000000'):
+            if img_idx == 2:
+                break
+        writer.start_sequence.assert_called_once_with('000000')
+        self.assertEqual(2, writer.next_image.call_count)
+        self.assertFalse(writer.save_sequence.called)
+        writer.abort_sequence.assert_called_once_with()
+
+    def test_stopping_early_goes_on_to_next_sequence(self):
+        data_root = self.make_data({'000000': 5, '000001': 2})
+        output = os.path.join(self.temp_dir, 'submission')
+        for streaming in [False, True]:
+            with submission_builder.SubmissionWriter(output, ['cup', 'bottle'], streaming=streaming) as writer:
+                images = sequence_iterator.SequenceIterator(data_root, writer=writer, load_image=read_text)
+                for sequence_name, sequence_images in images:
+                    for img_idx, image in sequence_images:
+                        writer.add_detection([0.2, 0.8], 1, 2, 3, 4)
+                        if sequence_name == '000000' and img_idx == 2:
+                            # The pending detection is dropped, not added to the next sequence
+                            break
+            self.assertFalse(writer.is_complete('000000'))
+            self.assertFalse(os.path.exists(os.path.join(output, '000000.json')))
+            self.assertTrue(writer.is_complete('000001'))
+            with open(os.path.join(output, '000001.json'), 'r') as fp:
+                detections = json.load(fp)['detections']
+            self.assertEqual([1, 1], [len(image_dets) for image_dets in detections])
+            shutil.rmtree(output)
+
+    def test_errors_for_missing_sequence(self):
+        data_root = self.make_data({'000000': 1})
+        images = sequence_iterator.SequenceIterator(data_root, load_image=read_text)
+        with self.assertRaises(ValueError):
+            list(images.iter_sequence('000003'))
+
+    def test_default_loader_needs_image_library(self):
+        data_root = self.make_data({'000000': 1})
+        with mock.patch.object(sequence_iterator, 'cv2', None), mock.patch.object(sequence_iterator, 'Image', None):
+            images = sequence_iterator.SequenceIterator(data_root)
+            with self.assertRaises(ImportError):
+                list(images.iter_sequence('000000'))
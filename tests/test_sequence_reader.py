@@ -0,0 +1,132 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import io
+import json
+
+import tests.test_helpers as th
+import sequence_reader
+
+
+class TestSequenceReader(th.ExtendedTestCase):
+
+    def make_file(self, data, text_mode=False):
+        contents = data if isinstance(data, str) else json.dumps(data)
+        if text_mode:
+            return io.StringIO(contents)
+        return io.BytesIO(contents.encode('utf-8'))
+
+    def make_detections(self):
+        return [
+            [{'label_probs': [0.1, 0.9], 'bbox': [1, 2, 3, 4]}],
+            [],
+            [{'label_probs': [0.5, 0.5], 'bbox': [12.5, 14, 55, 46.123456789]},
+             {'label_probs': [1, 0], 'bbox': [1e-3, 2, 1234567, 4], 'covars': [[[1, 0], [0, 1]], [[2, 0], [0, 2]]]}]
+        ]
+
+    def test_reads_header_then_images(self):
+        detections = self.make_detections()
+        for text_mode in [False, True]:
+            for chunk_size in [1, 3, 7, 1 << 20]:
+                reader = sequence_reader.SequenceReader(self.make_file({
+                    'classes': ['cup', 'bottle'],
+                    'detections': detections
+                }, text_mode), chunk_size=chunk_size)
+                self.assertEqual({'classes': ['cup', 'bottle']}, reader.read_header())
+                self.assertTrue(reader.has_detections)
+                self.assertEqual(detections, list(reader.iter_images()))
+
+    def test_reads_keys_after_detections(self):
+        detections = self.make_detections()
+        for chunk_size in [1, 5, 1 << 20]:
+            reader = sequence_reader.SequenceReader(self.make_file(
+                '{"detections": ' + json.dumps(detections) + ', "classes": ["cup", "bottle"], "other": 12345}'
+            ), chunk_size=chunk_size)
+            self.assertEqual({}, reader.read_header())
+            self.assertEqual(detections, list(reader.iter_images()))
+            self.assertEqual({'classes': ['cup', 'bottle'], 'other': 12345}, reader.header)
+
+    def test_reads_numbers_split_between_reads(self):
+        contents = '{"z": 1.5e-07, "n": -12345.25, "t": true, "classes": ["cup"], "detections": [[]], "x": 1e+300}'
+        for chunk_size in range(1, 12):
+            reader = sequence_reader.SequenceReader(self.make_file(contents), chunk_size=chunk_size)
+            self.assertEqual({'z': 1.5e-07, 'n': -12345.25, 't': True, 'classes': ['cup']}, reader.read_header())
+            self.assertEqual([[]], list(reader.iter_images()))
+            self.assertEqual(1e+300, reader.header['x'])
+
+    def test_no_detections(self):
+        reader = sequence_reader.SequenceReader(self.make_file({'classes': ['cup']}), chunk_size=2)
+        self.assertEqual({'classes': ['cup']}, reader.read_header())
+        self.assertFalse(reader.has_detections)
+        self.assertEqual([], list(reader.iter_images()))
+
+    def test_decodes_characters_split_between_reads(self):
+        reader = sequence_reader.SequenceReader(self.make_file('{"classes": ["café", "☕"], "detections": []}'),
+                                                chunk_size=1)
+        self.assertEqual({'classes': ['café', '☕']}, reader.read_header())
+        self.assertEqual([], list(reader.iter_images()))
+
+    def test_errors_for_invalid_json(self):
+        for contents in [
+            '["classes", "detections"]',
+            '{"classes": ["cup"], "detections": [[], [{"bbox": [1, 2, 3, 4]}]',
+            '{"classes": ["cup"], "detections": [[], [] []]}',
+            '{"classes": ["cup"], "detections": {}}',
+            '{"classes": ["cup"], "detections": [[]]} []',
+            '{"classes": ["cup" "detections": [[]]}',
+        ]:
+            reader = sequence_reader.SequenceReader(self.make_file(contents), chunk_size=4)
+            with self.assertRaises(ValueError):
+                reader.read_header()
+                list(reader.iter_images())
+
+    def test_errors_early_without_reading_the_whole_file(self):
+        detections = [[{'label_probs': [0.1] * 31, 'bbox': [1, 2, 3, 4]}] * 20 for _ in range(500)]
+        contents = json.dumps({'classes': ['cup'], 'detections': detections})
+        bad_pos = contents.index('0.1, 0.1') + len('0.1 ')
+        for chunk_size in [7, 1 << 12]:
+            reader = sequence_reader.SequenceReader(self.make_file(contents.replace('0.1, 0.1', '0.1 0.1', 1)),
+                                                    chunk_size=chunk_size, name='000000.json')
+            reader.read_header()
+            with self.assertRaises(ValueError) as cm:
+                list(reader.iter_images())
+            message = str(cm.exception)
+            self.assertIn('000000.json', message)
+            self.assertIn('image 0', message)
+            self.assertIn('character {0}'.format(bad_pos), message)
+            self.assertLess(reader.bytes_read, len(contents) // 100)
+
+    def test_error_gives_position_in_file(self):
+        contents = '{"classes": ["cup"], "detections": [[], [], [{"bbox": [1, 2, 3, 4]}], [{"bbox" [1]}]]}'
+        for chunk_size in [1, 5, 1 << 20]:
+            reader = sequence_reader.SequenceReader(self.make_file(contents), chunk_size=chunk_size)
+            reader.read_header()
+            with self.assertRaises(ValueError) as cm:
+                list(reader.iter_images())
+            self.assertIn('image 3', str(cm.exception))
+            self.assertIn('character {0}'.format(contents.index('[1]}')), str(cm.exception))
+
+
+class TestReadTrailingKeys(th.ExtendedTestCase):
+
+    def test_finds_keys_after_detections(self):
+        detections = [[{'label_probs': [0.1, 0.9], 'bbox': [1, 2, 3, 4]}]] * 100
+        for contents, expected in [
+            ('{"detections": ' + json.dumps(detections) + ', "classes": ["cup", "bottle"]}',
+             {'classes': ['cup', 'bottle']}),
+            ('{"detections": ' + json.dumps(detections) +
+             ',\n "other": 1, "classes": ["cup"], "more": "a, \\"classes\\": "}',
+             {'classes': ['cup'], 'more': 'a, "classes": '}),
+        ]:
+            fp = io.BytesIO(contents.encode('utf-8'))
+            fp.seek(5)
+            self.assertEqual(expected, sequence_reader.read_trailing_keys(fp, len(contents), 'classes'))
+            self.assertEqual(5, fp.tell())
+
+    def test_gives_none_if_key_is_not_near_the_end(self):
+        detections = [[{'label_probs': [0.1, 0.9], 'bbox': [1, 2, 3, 4]}]] * 100
+        for contents in [
+            '{"classes": ["cup"], "detections": ' + json.dumps(detections) + '}',
+            '{"detections": [], "classes": ["cup"], "other": ' + json.dumps(detections) + '}'
+        ]:
+            self.assertIsNone(sequence_reader.read_trailing_keys(io.BytesIO(contents.encode('utf-8')),
+                                                                 len(contents), 'classes', max_size=100))
@@ -0,0 +1,119 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os.path
+import shutil
+import json
+import zipfile
+import unittest.mock as mock
+import numpy as np
+
+import tests.test_helpers as th
+import submission_reader
+import submission_validator
+
+
+class TestSubmissionReader(th.ExtendedTestCase):
+    temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def make_detections(self, num_images=3):
+        return [[{
+            'label_probs': [0.1, 0.2, 0.3, 0.4],
+            'bbox': [12, 14, 55 + img_idx, 46]
+        }] * img_idx for img_idx in range(num_images)]
+
+    def make_submission(self, detections_map, classes=('cup', 'zebra', 'tv', 'bottle')):
+        folder = os.path.join(self.temp_dir, 'submission')
+        os.makedirs(folder, exist_ok=True)
+        for sequence_name, detections in detections_map.items():
+            with open(os.path.join(folder, '{0}.json'.format(sequence_name)), 'w') as fp:
+                json.dump({'classes': list(classes), 'detections': detections}, fp)
+        return folder
+
+    def test_finds_sequences(self):
+        folder = self.make_submission({'{0:06}'.format(idx): [] for idx in [0, 3, 5]})
+        reader = submission_reader.SubmissionReader(folder)
+        self.assertEqual(['000000', '000003', '000005'], reader.sequence_names)
+        self.assertEqual(3, len(reader))
+        self.assertIn('000003', reader)
+        self.assertNotIn('000001', reader)
+        self.assertEqual(['000000', '000003', '000005'], list(reader))
+        with self.assertRaises(KeyError):
+            reader.get_sequence('000001')
+
+    def test_decodes_sequence(self):
+        detections = self.make_detections()
+        detections[2][1] = dict(detections[2][1], covars=[[[1, 0], [0, 1]], [[2, 0], [0, 2]]])
+        folder = self.make_submission({'000000': detections})
+        arrays = submission_reader.SubmissionReader(folder)['000000']
+        self.assertEqual(submission_validator.CLASSES, arrays.classes)
+        self.assertEqual(3, arrays.num_images)
+        self.assertNPEqual([0, 0, 1, 3], arrays.image_offsets)
+        expected_probs = np.zeros((3, len(submission_validator.CLASSES)), dtype=np.float64)
+        expected_probs[:, submission_validator.CLASSES.index('cup')] = 0.1
+        expected_probs[:, submission_validator.CLASSES.index('television')] = 0.3
+        expected_probs[:, submission_validator.CLASSES.index('bottle')] = 0.4
+        self.assertNPEqual(expected_probs, arrays.probs)
+        self.assertNPEqual([[12, 14, 56, 46], [12, 14, 57, 46], [12, 14, 57, 46]], arrays.boxes)
+        self.assertNPEqual([False, False, True], arrays.has_covars)
+        self.assertNPEqual([[[1, 0], [0, 1]], [[2, 0], [0, 2]]], arrays.covars[2])
+        self.assertNPEqual(np.zeros((2, 2, 2, 2)), arrays.covars[:2])
+
+    def test_reads_zip_files(self):
+        folder = self.make_submission({'000000': self.make_detections(), '000001': []})
+        zip_path = os.path.join(self.temp_dir, 'submission.zip')
+        with zipfile.ZipFile(zip_path, 'w') as zip_file:
+            for sequence_name in ['000000', '000001']:
+                zip_file.write(os.path.join(folder, sequence_name + '.json'), 'sub/' + sequence_name + '.json')
+        reader = submission_reader.SubmissionReader(zip_path)
+        self.assertEqual(['000000', '000001'], reader.sequence_names)
+        self.assertEqual(3, reader['000000'].num_detections)
+        self.assertEqual(0, reader['000001'].num_images)
+
+    def test_keeps_recently_used_sequences(self):
+        folder = self.make_submission({'{0:06}'.format(idx): self.make_detections() for idx in range(4)})
+        reader = submission_reader.SubmissionReader(folder, max_cached=2)
+        with mock.patch.object(submission_reader, 'load_sequence',
+                               wraps=submission_reader.load_sequence) as mock_load:
+            first = reader['000000']
+            reader['000001']
+            self.assertIs(first, reader['000000'])
+            self.assertEqual(2, mock_load.call_count)
+            reader['000002']    # Pushes out 000001, which was used least recently
+            reader['000000']
+            self.assertEqual(3, mock_load.call_count)
+            reader['000001']
+            self.assertEqual(4, mock_load.call_count)
+            reader.clear_cache()
+            reader['000001']
+            self.assertEqual(5, mock_load.call_count)
+
+    def test_sidecar_skips_decoding(self):
+        folder = self.make_submission({'000000': self.make_detections(), '000001': self.make_detections(5)})
+        sidecar = os.path.join(self.temp_dir, 'sidecar')
+        first = {name: arrays for name, arrays in submission_reader.SubmissionReader(
+            folder, sidecar_folder=sidecar).iter_sequences()}
+
+        reader = submission_reader.SubmissionReader(folder, sidecar_folder=sidecar)
+        with mock.patch.object(submission_reader, 'load_sequence',
+                               wraps=submission_reader.load_sequence) as mock_load:
+            for name, arrays in reader.iter_sequences():
+                self.assertEqual(first[name].classes, arrays.classes)
+                for attr in ['probs', 'boxes', 'covars', 'has_covars', 'image_offsets']:
+                    self.assertEqual(getattr(first[name], attr).dtype, getattr(arrays, attr).dtype)
+                    self.assertNPEqual(getattr(first[name], attr), getattr(arrays, attr))
+            self.assertEqual(0, mock_load.call_count)
+
+        # Changing the file decodes it again
+        self.make_submission({'000001': self.make_detections(7)})
+        reader = submission_reader.SubmissionReader(folder, sidecar_folder=sidecar)
+        with mock.patch.object(submission_reader, 'load_sequence',
+                               wraps=submission_reader.load_sequence) as mock_load:
+            self.assertEqual(7, reader['000001'].num_images)
+            self.assertEqual(3, reader['000000'].num_images)
+            self.assertEqual(1, mock_load.call_count)
+        reader = submission_reader.SubmissionReader(folder, sidecar_folder=sidecar)
+        self.assertEqual(7, reader['000001'].num_images)
@@ -4,9 +4,14 @@ import os.path
 import warnings
 import shutil
 import json
+import zipfile
+import unittest.mock as mock
+
+import numpy as np
 
 import tests.test_helpers as th
 import submission_validator
+import sequence_arrays
 
 
 class TestSubmissionValidatorValidateDetections(th.ExtendedTestCase):
@@ -134,6 +139,120 @@ class TestSubmissionValidatorValidateDetections(th.ExtendedTestCase):
         self.assertIn(str(det_idx), msg)
 
 
+
+class TestSubmissionValidatorValidateImages(th.ExtendedTestCase):
+
+    def make_images(self):
+        return [
+            [{
+                'label_probs': [0.1, 0.2, 0.3, 0.4, 0.0],
+                'bbox': [12, 14, 55, 46],
+                'covars': [[[1, 0], [0, 1]], [[1, 0], [0, 1]]]
+            }],
+            [],
+            [{
+                'label_probs': [0.01, 0.01, 0.01, 0.01, 0.02],
+                'bbox': [12, 14, 55, 46]
+            }, {
+                'label_probs': [0.5, 0.5, 0.5, 0.0, 0.0],
+                'bbox': [12, 14, 55, 46],
+                'covars': [[[0, 0], [0, 0]], [[0, 0], [0, 0]]]
+            }]
+        ]
+
+    def test_passes_valid_images(self):
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            submission_validator.validate_images(self.make_images(), [list(range(5)), list(range(5))],
+                                                 num_classes=5, first_img_idx=10, sequence_name='test.json')
+        self.assertEqual(2, len(w))
+        self.assertIn('test.json, image index 12, detection index 0', str(w[0].message))
+        self.assertIn('less than 0.5', str(w[0].message))
+        self.assertIn('test.json, image index 12, detection index 1', str(w[1].message))
+        self.assertIn('normalized', str(w[1].message))
+
+    def test_raises_first_error_with_same_message_as_validate_detections(self):
+        for key, value, exception_type in [
+            ('label_probs', [0.1, 0.2], KeyError),
+            ('bbox', [55, 14, 12, 46], ValueError),
+            ('bbox', [12, 46, 55, 14], ValueError),
+            ('bbox', [12, 14, 55], ValueError),
+            ('covars', [[[1, 0], [0, 1]], [[1, 0], [0]]], ValueError),
+            ('covars', [[[1, 2], [0, 1]], [[1, 0], [0, 1]]], ValueError),
+            ('covars', [[[1, 0], [0, 1]], [[1, 2], [2, 1]]], ValueError),
+        ]:
+            images = self.make_images()
+            images[2][1][key] = value
+            images.append([dict(images[2][1])])
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                with self.assertRaises(exception_type) as cm:
+                    submission_validator.validate_detections(images[2], [list(range(5)), list(range(5))],
+                                                             num_classes=5, img_idx=2, sequence_name='test.json')
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always')
+                with self.assertRaises(exception_type) as cm_images:
+                    submission_validator.validate_images(images, [list(range(5)), list(range(5))],
+                                                         num_classes=5, sequence_name='test.json')
+            self.assertEqual(str(cm.exception), str(cm_images.exception))
+            self.assertIn('test.json, image index 2, detection index 1', str(cm_images.exception))
+            # Warnings are only given for the detections before the error
+            self.assertEqual(2 if key == 'covars' else 1, len(w))
+
+
+
+class TestWarningCollector(th.ExtendedTestCase):
+
+    def make_images(self):
+        return [
+            [{'label_probs': [0.01, 0.01, 0.01, 0.01, 0.02], 'bbox': [12, 14, 55, 46]},
+             {'label_probs': [0.5, 0.5, 0.5, 0.0, 0.0], 'bbox': [12, 14, 55, 46]}],
+            [],
+            [{'label_probs': [0.01, 0.01, 0.01, 0.01, 0.02], 'bbox': [12, 14, 55, 46]},
+             {'label_probs': [0.1, 0.1, 0.1, 0.0, 0.0], 'bbox': [12, 14, 55, 46]}]
+        ]
+
+    def test_counts_warnings_instead_of_issuing_them(self):
+        collector = submission_validator.WarningCollector()
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            submission_validator.validate_images(self.make_images(), [list(range(5)), list(range(5))],
+                                                 num_classes=5, first_img_idx=4, sequence_name='test.json',
+                                                 warning_collector=collector)
+            submission_validator.validate_detections(self.make_images()[0], [list(range(5)), list(range(5))],
+                                                     num_classes=5, img_idx=0, sequence_name='other.json',
+                                                     warning_collector=collector)
+        self.assertEqual(0, len(w))
+        self.assertEqual(6, collector.total)
+        self.assertEqual(3, collector.count(category='ignored', sequence_name='test.json'))
+        self.assertEqual(2, collector.count(sequence_name='other.json'))
+        self.assertEqual({4: 1, 6: 2}, collector.get_image_counts('ignored', 'test.json'))
+        self.assertEqual({4: 1}, collector.get_image_counts('normalized', 'test.json'))
+
+    def test_messages_match_warnings(self):
+        collector = submission_validator.WarningCollector()
+        submission_validator.validate_images(self.make_images(), [list(range(5)), list(range(5))],
+                                             num_classes=5, sequence_name='test.json', warning_collector=collector)
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            submission_validator.validate_images(self.make_images(), [list(range(5)), list(range(5))],
+                                                 num_classes=5, sequence_name='test.json')
+        self.assertEqual(sorted(str(warning.message) for warning in w), sorted(collector.get_messages()))
+
+    def test_keeps_limited_number_of_messages(self):
+        collector = submission_validator.WarningCollector(max_samples=3)
+        other = submission_validator.WarningCollector(max_samples=3)
+        submission_validator.validate_images(self.make_images(), [list(range(5)), list(range(5))],
+                                             num_classes=5, sequence_name='test.json', warning_collector=collector)
+        submission_validator.validate_images(self.make_images(), [list(range(5)), list(range(5))],
+                                             num_classes=5, sequence_name='other.json', warning_collector=other)
+        collector.merge(other)
+        self.assertEqual(8, collector.total)
+        self.assertEqual(3, len(collector.get_messages()))
+        summary = collector.summary()
+        self.assertIn('test.json: 3 detections in 2 images', summary)
+        self.assertIn('other.json: 1 detections in 1 images', summary)
+
 class TestSubmissionValidatorValidateSequence(th.ExtendedTestCase):
     temp_dir = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'temp')
 
@@ -179,6 +298,33 @@ class TestSubmissionValidatorValidateSequence(th.ExtendedTestCase):
         self.assertIn('3', msg)
         self.assertIn('1', msg)
 
+    def test_checks_number_of_images(self):
+        sequence_json = self.make_sequence([[], [], []])
+        submission_validator.validate_sequence(sequence_json, num_images=3)
+        for num_images in [2, 4]:
+            with self.assertRaises(ValueError) as cm:
+                submission_validator.validate_sequence(sequence_json, num_images=num_images)
+            msg = str(cm.exception)
+            self.assertIn(os.path.basename(sequence_json), msg)
+            self.assertIn('3 images', msg)
+            self.assertIn('{0} images'.format(num_images), msg)
+
+    def test_validates_array_files(self):
+        os.makedirs(self.temp_dir, exist_ok=True)
+        array_file = os.path.join(self.temp_dir, 'test.npz')
+        probs = np.zeros((3, len(submission_validator.CLASSES)), dtype=np.float32)
+        probs[:, 1] = 1
+        boxes = np.array([[12, 14, 55, 46], [12, 14, 55, 46], [55, 14, 12, 46]], dtype=np.float64)
+        sequence_arrays.save_sequence_arrays(array_file, submission_validator.CLASSES, probs[:2], boxes[:2],
+                                             np.zeros((2, 2, 2, 2)), np.zeros(2, dtype=bool), [0, 1, 1, 2])
+        submission_validator.validate_sequence(array_file, num_images=3)
+
+        sequence_arrays.save_sequence_arrays(array_file, submission_validator.CLASSES, probs, boxes,
+                                             np.zeros((3, 2, 2, 2)), np.zeros(3, dtype=bool), [0, 1, 1, 3])
+        with self.assertRaises(ValueError) as cm:
+            submission_validator.validate_sequence(array_file)
+        self.assertIn('test.npz, image index 2, detection index 1', str(cm.exception))
+
     def test_errors_if_classes_missing(self):
         detections = [
             [{
@@ -262,6 +408,63 @@ class TestSubmissionValidatorValidateSequence(th.ExtendedTestCase):
         self.assertIn('test.json', msg)
 
 
+    def test_reads_classes_after_detections(self):
+        detections = [
+            [{
+                'label_probs': [0.1, 0.2, 0.3, 0.4],
+                'bbox': [12, 14, 55, 46]
+            }],
+            [{
+                'label_probs': [0.1, 0.2, 0.3, 0.4],
+                'bbox': [55, 14, 12, 46]
+            }]
+        ]
+        patch_classes(detections)
+        os.makedirs(self.temp_dir, exist_ok=True)
+        json_file = os.path.join(self.temp_dir, 'test.json')
+        with open(json_file, 'w') as fp:
+            fp.write('{"detections": ' + json.dumps(detections) + ', "classes": ' +
+                     json.dumps(submission_validator.CLASSES) + '}')
+
+        with self.assertRaises(ValueError) as cm:
+            submission_validator.validate_sequence(json_file)
+        self.assertIn('test.json, image index 1, detection index 0', str(cm.exception))
+
+    def test_reads_classes_after_detections_in_one_pass(self):
+        detections = [[{'label_probs': [0.1, 0.2, 0.3, 0.4], 'bbox': [12, 14, 55, 46]}]] * 10
+        patch_classes(detections)
+        os.makedirs(self.temp_dir, exist_ok=True)
+        json_file = os.path.join(self.temp_dir, 'test.json')
+        with open(json_file, 'w') as fp:
+            fp.write('{"detections": ' + json.dumps(detections) + ', "classes": ' +
+                     json.dumps(submission_validator.CLASSES) + '}')
+        zip_path = os.path.join(self.temp_dir, 'test.zip')
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.write(json_file, 'test.json')
+
+        for sequence_json in [json_file, (zip_path, 'test.json')]:
+            with mock.patch.object(submission_validator.sequence_reader, 'SequenceReader',
+                                   wraps=submission_validator.sequence_reader.SequenceReader) as mock_reader:
+                metrics = submission_validator.ValidationMetrics()
+                submission_validator.validate_sequence(sequence_json, show_progress=False, metrics=metrics)
+                self.assertEqual(1, mock_reader.call_count)
+                self.assertEqual(10, metrics.to_dict()['sequences'][0]['images'])
+
+    def test_errors_for_invalid_json_after_invalid_detection(self):
+        detections = [[{
+            'label_probs': [0.1, 0.2, 0.3, 0.4],
+            'bbox': [55, 14, 12, 46]
+        }]] + [[] for _ in range(submission_validator.VALIDATION_BATCH_SIZE)]
+        patch_classes(detections)
+        json_file = self.make_sequence(detections)
+        with open(json_file, 'a') as fp:
+            fp.write('[]')
+
+        # The invalid detection is found before reaching the end of the file
+        with self.assertRaises(ValueError) as cm:
+            submission_validator.validate_sequence(json_file)
+        self.assertIn('test.json, image index 0, detection index 0', str(cm.exception))
+
 class TestSubmissionLoaderReadSubmission(th.ExtendedTestCase):
     temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
 
@@ -283,6 +486,18 @@ class TestSubmissionLoaderReadSubmission(th.ExtendedTestCase):
                     'detections': detections
                 }, fp)
 
+    def make_zip(self, detections_map, subfolder=''):
+        os.makedirs(self.temp_dir, exist_ok=True)
+        zip_path = os.path.join(self.temp_dir, 'submission.zip')
+        with zipfile.ZipFile(zip_path, 'a', compression=zipfile.ZIP_DEFLATED) as zip_file:
+            for sequence_name, detections in detections_map.items():
+                patch_classes(detections)
+                zip_file.writestr(subfolder + '{0}.json'.format(sequence_name), json.dumps({
+                    'classes': submission_validator.CLASSES,
+                    'detections': detections
+                }))
+        return zip_path
+
     def test_raises_error_if_directory_doesnt_exist(self):
         not_a_dir = os.path.join(self.temp_dir, 'not', 'a', 'dir')
         with self.assertRaises(ValueError) as cm:
@@ -331,6 +546,352 @@ class TestSubmissionLoaderReadSubmission(th.ExtendedTestCase):
         msg = str(cm.exception)
         self.assertIn('{0:06}'.format(16), msg)
 
+    def test_parallel_validation_passes_valid_submission(self):
+        self.make_submission({'{0:06}'.format(idx): [[{
+            'label_probs': [0.1, 0.2, 0.3, 0.4],
+            'bbox': [12, 14, 55, 46]
+        }]] for idx in range(18)})
+        submission_validator.validate_submission(self.temp_dir, jobs=4)
+
+    def test_parallel_validation_raises_first_error_in_sequence_order(self):
+        detections_map = {'{0:06}'.format(idx): [] for idx in range(18)}
+        for idx in [12, 5]:
+            detections_map['{0:06}'.format(idx)] = [[], [{
+                'label_probs': [0.1, 0.2, 0.3, 0.4],
+                'bbox': [55, 14, 12, 46]
+            }]]
+        self.make_submission(detections_map)
+
+        with self.assertRaises(ValueError) as cm:
+            submission_validator.validate_submission(self.temp_dir, jobs=4)
+        self.assertIn('000005.json, image index 1', str(cm.exception))
+
+    def test_parallel_validation_reports_warnings_in_sequence_order(self):
+        detections_map = {'{0:06}'.format(idx): [] for idx in range(18)}
+        for idx in [9, 2]:
+            detections_map['{0:06}'.format(idx)] = [[{
+                'label_probs': [0.01, 0.01, 0.01, 0.01],
+                'bbox': [12, 14, 55, 46]
+            }]]
+        self.make_submission(detections_map)
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            submission_validator.validate_submission(self.temp_dir, jobs=3)
+        self.assertEqual(2, len(w))
+        self.assertIn('000002.json', str(w[0].message))
+        self.assertIn('000009.json', str(w[1].message))
+
+        collector = submission_validator.WarningCollector()
+        submission_validator.validate_submission(self.temp_dir, jobs=3, warning_collector=collector)
+        self.assertEqual(2, collector.total)
+        messages = collector.get_messages()
+        self.assertIn('000002.json', messages[0])
+        self.assertIn('000009.json', messages[1])
+
+    def make_manifest(self, sequence_names):
+        manifest = {}
+        for sequence_name in sequence_names:
+            path = os.path.join(self.temp_dir, '{0}.json'.format(sequence_name))
+            manifest[sequence_name] = {'complete': True, 'path': '{0}.json'.format(sequence_name),
+                                       'bytes': os.path.getsize(path)}
+        with open(os.path.join(self.temp_dir, submission_validator.MANIFEST_NAME), 'w') as fp:
+            json.dump({'sequences': manifest}, fp)
+
+    def test_finds_sequences_from_manifest(self):
+        self.make_submission({'{0:06}'.format(idx): [] for idx in range(18)})
+        self.make_manifest(['{0:06}'.format(idx) for idx in range(18)])
+        # This would be a duplicate if the folder was searched
+        self.make_submission({'000000': []}, 'old_submission')
+
+        sequences = submission_validator.find_folder_sequences(self.temp_dir, {'000000', '000001'})
+        self.assertEqual({
+            '000000': os.path.join(self.temp_dir, '000000.json'),
+            '000001': os.path.join(self.temp_dir, '000001.json')
+        }, sequences)
+        submission_validator.validate_submission(self.temp_dir)
+
+    def test_searches_folder_if_manifest_does_not_match(self):
+        self.make_submission({'{0:06}'.format(idx): [] for idx in range(18)})
+        self.make_manifest(['{0:06}'.format(idx) for idx in range(18)])
+        self.make_submission({'000003': [[]]})
+        self.make_submission({'000000': []}, 'old_submission')
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            with self.assertRaises(ValueError) as cm:
+                submission_validator.validate_submission(self.temp_dir)
+        self.assertIn('old_submission', str(cm.exception))
+        self.assertEqual(1, len(w))
+        self.assertIn('000003.json', str(w[0].message))
+
+    def test_skips_hidden_folders(self):
+        self.make_submission({'{0:06}'.format(idx): [] for idx in range(18)})
+        self.make_submission({'000000': []}, '.hidden')
+        submission_validator.validate_submission(self.temp_dir)
+
+    def make_test_data(self, num_images_map):
+        data_root = os.path.join(self.temp_dir, 'test_data')
+        for sequence_name, num_images in num_images_map.items():
+            os.makedirs(os.path.join(data_root, sequence_name), exist_ok=True)
+            for idx in range(num_images):
+                with open(os.path.join(data_root, sequence_name, '{0:06}.png'.format(idx)), 'w') as fp:
+                    fp.write('')
+        return data_root
+
+    def test_checks_number_of_images_against_test_data(self):
+        self.make_submission({'{0:06}'.format(idx): [[], []] for idx in range(18)}, 'submission')
+        data_root = self.make_test_data({'{0:06}'.format(idx): 2 for idx in range(18)})
+        for jobs in [1, 2]:
+            submission_validator.validate_submission(os.path.join(self.temp_dir, 'submission'),
+                                                     jobs=jobs, data_root=data_root)
+        self.assertTrue(os.path.isfile(os.path.join(data_root, submission_validator.image_index.INDEX_NAME)))
+
+        self.make_test_data({'000005': 3})
+        for jobs in [1, 2]:
+            with self.assertRaises(ValueError) as cm:
+                submission_validator.validate_submission(os.path.join(self.temp_dir, 'submission'),
+                                                         jobs=jobs, data_root=data_root)
+            self.assertIn('000005.json', str(cm.exception))
+
+    def test_warns_if_sequence_missing_from_test_data(self):
+        self.make_submission({'{0:06}'.format(idx): [[], []] for idx in range(18)}, 'submission')
+        data_root = self.make_test_data({'{0:06}'.format(idx): 2 for idx in range(18) if idx != 9})
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            submission_validator.validate_submission(os.path.join(self.temp_dir, 'submission'), data_root=data_root)
+        self.assertEqual(1, len(w))
+        self.assertIn('000009', str(w[0].message))
+
+    def test_validates_zip_file(self):
+        zip_path = self.make_zip({'{0:06}'.format(idx): [[{
+            'label_probs': [0.1, 0.2, 0.3, 0.4],
+            'bbox': [12, 14, 55, 46]
+        }]] for idx in range(18)}, 'submission/')
+        for jobs in [1, 2]:
+            submission_validator.validate_submission(zip_path, jobs=jobs)
+
+    def test_raises_error_for_invalid_sequence_in_zip_file(self):
+        detections_map = {'{0:06}'.format(idx): [] for idx in range(18)}
+        detections_map['000004'] = [[], [{
+            'label_probs': [0.1, 0.2, 0.3, 0.4],
+            'bbox': [55, 14, 12, 46]
+        }]]
+        zip_path = self.make_zip(detections_map)
+        for jobs in [1, 2]:
+            with self.assertRaises(ValueError) as cm:
+                submission_validator.validate_submission(zip_path, jobs=jobs)
+            self.assertIn('000004.json, image index 1', str(cm.exception))
+
+    def test_raises_error_if_missing_sequences_in_zip_file(self):
+        zip_path = self.make_zip({'{0:06}'.format(idx): [] for idx in range(18) if idx != 7})
+        with self.assertRaises(ValueError) as cm:
+            submission_validator.validate_submission(zip_path)
+        self.assertIn('000007', str(cm.exception))
+
+    def test_raises_error_if_duplicate_sequence_in_zip_file(self):
+        self.make_zip({'{0:06}'.format(idx): [] for idx in range(18)}, 'folder_a/')
+        zip_path = self.make_zip({'000000': []}, 'folder_b/')
+        with self.assertRaises(ValueError) as cm:
+            submission_validator.validate_submission(zip_path)
+        msg = str(cm.exception)
+        self.assertIn('folder_a/000000.json', msg)
+        self.assertIn('folder_b/000000.json', msg)
+
+
+
+class TestValidationMetrics(th.ExtendedTestCase):
+    temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def make_submission(self, detections_map):
+        os.makedirs(self.temp_dir, exist_ok=True)
+        for sequence_name, detections in detections_map.items():
+            patch_classes(detections)
+            with open(os.path.join(self.temp_dir, '{0}.json'.format(sequence_name)), 'w') as fp:
+                json.dump({
+                    'classes': submission_validator.CLASSES,
+                    'detections': detections
+                }, fp)
+
+    def make_detections(self, num_images=3):
+        return [[{
+            'label_probs': [0.1, 0.2, 0.3, 0.4],
+            'bbox': [12, 14, 55, 46]
+        }] * idx for idx in range(num_images)]
+
+    def test_records_each_sequence(self):
+        self.make_submission({'{0:06}'.format(idx): self.make_detections() for idx in range(18)})
+        for jobs in [1, 2]:
+            metrics = submission_validator.ValidationMetrics()
+            submission_validator.validate_submission(self.temp_dir, jobs=jobs, metrics=metrics)
+            self.assertEqual(['{0:06}.json'.format(idx) for idx in range(18)],
+                             [entry['sequence'] for entry in metrics.sequences])
+            for entry in metrics.sequences:
+                self.assertEqual(3, entry['images'])
+                self.assertEqual(3, entry['detections'])
+                self.assertEqual(os.path.getsize(os.path.join(self.temp_dir, entry['sequence'])), entry['bytes'])
+                self.assertGreaterEqual(entry['wall_time'], entry['check_time'])
+                self.assertAlmostEqual(entry['wall_time'], entry['parse_time'] + entry['check_time'])
+
+    def test_does_not_record_cached_sequences(self):
+        self.make_submission({'{0:06}'.format(idx): self.make_detections() for idx in range(18)})
+        cache_file = os.path.join(self.temp_dir, 'cache.json')
+        metrics = submission_validator.ValidationMetrics()
+        submission_validator.validate_submission(self.temp_dir, cache=submission_validator.ValidationCache(
+            cache_file), metrics=metrics)
+        self.assertEqual(18, len(metrics.sequences))
+        metrics = submission_validator.ValidationMetrics()
+        submission_validator.validate_submission(self.temp_dir, cache=submission_validator.ValidationCache(
+            cache_file), metrics=metrics)
+        self.assertEqual(0, len(metrics.sequences))
+
+    def test_to_dict_sums_sequences(self):
+        metrics = submission_validator.ValidationMetrics()
+        with mock.patch.object(submission_validator, 'get_peak_rss', return_value=1000):
+            metrics.add('000000.json', 2.0, 0.5, 4000, 10, 100)
+        with mock.patch.object(submission_validator, 'get_peak_rss', return_value=3000):
+            metrics.add('000001.json', 2.0, 1.0, 2000, 5, 20)
+        data = metrics.to_dict()
+        self.assertEqual(1.5, data['sequences'][0]['parse_time'])
+        self.assertEqual(2000, data['sequences'][0]['bytes_per_second'])
+        self.assertEqual(50, data['sequences'][0]['detections_per_second'])
+        self.assertEqual({
+            'wall_time': 4.0,
+            'parse_time': 2.5,
+            'check_time': 1.5,
+            'bytes': 6000,
+            'images': 15,
+            'detections': 120,
+            'bytes_per_second': 1500,
+            'detections_per_second': 30,
+            'peak_rss_bytes': 3000
+        }, data['total'])
+
+    def test_save_writes_json(self):
+        metrics = submission_validator.ValidationMetrics()
+        metrics.add('000000.json', 1.0, 0.5, 100, 1, 1)
+        os.makedirs(self.temp_dir, exist_ok=True)
+        output_file = os.path.join(self.temp_dir, 'metrics.json')
+        metrics.save(output_file)
+        with open(output_file, 'r') as fp:
+            self.assertEqual(json.loads(json.dumps(metrics.to_dict())), json.load(fp))
+
+    def test_progress_is_throttled(self):
+        self.make_submission({'000000': self.make_detections(200)})
+        with mock.patch.object(submission_validator, 'VALIDATION_BATCH_SIZE', 10):
+            with mock.patch.object(submission_validator, 'print_progress') as mock_progress:
+                submission_validator.validate_sequence(os.path.join(self.temp_dir, '000000.json'))
+            self.assertLess(mock_progress.call_count, 5)
+            with mock.patch.object(submission_validator, 'PROGRESS_INTERVAL', 0):
+                with mock.patch.object(submission_validator, 'print_progress') as mock_progress:
+                    submission_validator.validate_sequence(os.path.join(self.temp_dir, '000000.json'))
+            self.assertGreater(mock_progress.call_count, 100)
+
+
+class TestValidationCache(th.ExtendedTestCase):
+    temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def make_submission(self, detections_map):
+        os.makedirs(os.path.join(self.temp_dir, 'submission'), exist_ok=True)
+        for sequence_name, detections in detections_map.items():
+            patch_classes(detections)
+            with open(os.path.join(self.temp_dir, 'submission', '{0}.json'.format(sequence_name)), 'w') as fp:
+                json.dump({
+                    'classes': submission_validator.CLASSES,
+                    'detections': detections
+                }, fp)
+
+    def make_detections(self, total_prob=0.4):
+        return [[{
+            'label_probs': [total_prob / 4] * 4,
+            'bbox': [12, 14, 55, 46]
+        }], []]
+
+    def validate(self, cache_file, jobs=1, expected_validated=18, directory=None):
+        collector = submission_validator.WarningCollector()
+        cache = submission_validator.ValidationCache(cache_file)
+        with mock.patch.object(submission_validator, 'validate_sequence',
+                               wraps=submission_validator.validate_sequence) as mock_validate:
+            submission_validator.validate_submission(os.path.join(self.temp_dir, 'submission')
+                                                     if directory is None else directory,
+                                                     jobs=jobs, warning_collector=collector, cache=cache)
+        if jobs <= 1:
+            self.assertEqual(expected_validated, mock_validate.call_count)
+        return collector
+
+    def test_reuses_results_for_unchanged_sequences(self):
+        self.make_submission({'{0:06}'.format(idx): self.make_detections() for idx in range(18)})
+        cache_file = os.path.join(self.temp_dir, 'cache.json')
+        first = self.validate(cache_file)
+        second = self.validate(cache_file, expected_validated=0)
+        self.assertEqual(18, first.total)
+        self.assertEqual(first.summary(), second.summary())
+
+        # Touching a file without changing it does not validate it again
+        os.utime(os.path.join(self.temp_dir, 'submission', '000003.json'))
+        self.validate(cache_file, expected_validated=0)
+
+        self.make_submission({'000004': self.make_detections(0.8)})
+        third = self.validate(cache_file, expected_validated=1)
+        self.assertEqual(17, third.total)
+
+    def test_reports_cached_errors(self):
+        detections_map = {'{0:06}'.format(idx): self.make_detections() for idx in range(18)}
+        detections_map['000006'][0][0]['bbox'] = [55, 14, 12, 46]
+        self.make_submission(detections_map)
+        cache_file = os.path.join(self.temp_dir, 'cache.json')
+        for expected_validated in [7, 0]:
+            with self.assertRaises(ValueError) as cm:
+                self.validate(cache_file, expected_validated=expected_validated)
+            self.assertIn('000006.json, image index 0, detection index 0', str(cm.exception))
+
+    def test_validates_again_if_number_of_images_changes(self):
+        self.make_submission({'{0:06}'.format(idx): self.make_detections() for idx in range(18)})
+        cache_file = os.path.join(self.temp_dir, 'cache.json')
+        self.validate(cache_file)
+        data_root = os.path.join(self.temp_dir, 'test_data')
+        for idx in range(18):
+            os.makedirs(os.path.join(data_root, '{0:06}'.format(idx)))
+            for img_idx in range(2):
+                with open(os.path.join(data_root, '{0:06}'.format(idx), '{0:06}.png'.format(img_idx)), 'w') as fp:
+                    fp.write('')
+        collector = submission_validator.WarningCollector()
+        cache = submission_validator.ValidationCache(cache_file)
+        with mock.patch.object(submission_validator, 'validate_sequence',
+                               wraps=submission_validator.validate_sequence) as mock_validate:
+            submission_validator.validate_submission(os.path.join(self.temp_dir, 'submission'),
+                                                     warning_collector=collector, cache=cache, data_root=data_root)
+        self.assertEqual(18, mock_validate.call_count)
+
+    def test_ignores_cache_from_different_version(self):
+        self.make_submission({'{0:06}'.format(idx): self.make_detections() for idx in range(18)})
+        cache_file = os.path.join(self.temp_dir, 'cache.json')
+        self.validate(cache_file, jobs=2)
+        with open(cache_file, 'r') as fp:
+            data = json.load(fp)
+        data['version'] = -1
+        with open(cache_file, 'w') as fp:
+            json.dump(data, fp)
+        self.validate(cache_file, expected_validated=18)
+
+    def test_caches_zip_members(self):
+        self.make_submission({'{0:06}'.format(idx): self.make_detections() for idx in range(18)})
+        zip_path = os.path.join(self.temp_dir, 'submission.zip')
+        with zipfile.ZipFile(zip_path, 'w') as zip_file:
+            for idx in range(18):
+                zip_file.write(os.path.join(self.temp_dir, 'submission', '{0:06}.json'.format(idx)),
+                               '{0:06}.json'.format(idx))
+        cache_file = os.path.join(self.temp_dir, 'cache.json')
+        self.validate(cache_file, directory=zip_path)
+        self.validate(cache_file, directory=zip_path, expected_validated=0)
 
 def patch_classes(detections):
     # Patch the label probabilities to be the right length
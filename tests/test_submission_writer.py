@@ -0,0 +1,829 @@
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import os.path
+import shutil
+import zipfile
+import json
+import hashlib
+import pathlib
+import unittest.mock as mock
+import numpy as np
+
+import tests.test_helpers as th
+import submission_builder
+import submission_validator
+
+
+class TestMakeDetections(th.ExtendedTestCase):
+
+    def test_makes_same_detections_as_make_detection(self):
+        probs = np.array([[0.1, 0.2, 0.3, 0.4], [0.5, 0.2, 0.2, 0.6]])
+        boxes = np.array([[1, 3, 12, 14], [2, 4, 22, 18]])
+        covars = np.array([
+            [[[3, 1], [1, 4]], [[10, 0], [0, 15]]],
+            [[[5, 0], [0, 15]], [[16, 1], [1, 8]]]
+        ])
+        dets = submission_builder.make_detections(probs, boxes, covars)
+        self.assertEqual(2, len(dets))
+        for idx in range(2):
+            expected = submission_builder.make_detection(probs[idx], *boxes[idx], covars[idx][0], covars[idx][1])
+            self.assertEqual(expected['bbox'], dets[idx]['bbox'])
+            self.assertNPClose(expected['label_probs'], dets[idx]['label_probs'])
+            self.assertEqual(expected['covars'], dets[idx]['covars'])
+
+    def test_makes_detections_without_covars(self):
+        dets = submission_builder.make_detections([[0.1, 0.2, 0.3, 0.4]], [[1, 3, 12, 14]])
+        self.assertEqual(1, len(dets))
+        self.assertNotIn('covars', dets[0])
+
+    def test_makes_no_detections_for_empty_arrays(self):
+        self.assertEqual([], submission_builder.make_detections(np.zeros((0, 4)), np.zeros((0, 4))))
+
+    def test_errors_if_xmax_less_than_xmin(self):
+        with self.assertRaises(ValueError) as cm:
+            submission_builder.make_detections(np.ones((3, 4)), [[1, 3, 12, 14], [1, 3, 12, 14], [15, 3, 2, 14]])
+        msg = str(cm.exception)
+        self.assertIn('xmax', msg)
+        self.assertIn('2', msg)
+
+    def test_errors_if_ymax_less_than_ymin(self):
+        with self.assertRaises(ValueError) as cm:
+            submission_builder.make_detections(np.ones((2, 4)), [[1, 31, 12, 14], [1, 3, 12, 14]])
+        msg = str(cm.exception)
+        self.assertIn('ymax', msg)
+        self.assertIn('0', msg)
+
+    def test_errors_if_covars_wrong_shape(self):
+        with self.assertRaises(ValueError):
+            submission_builder.make_detections(np.ones((1, 4)), [[1, 3, 12, 14]], [[[1, 0], [0, 1]]])
+
+    def test_errors_if_covar_is_not_symmetric(self):
+        covars = np.array([[[[3, 1], [1, 4]], [[10, 0], [0, 15]]], [[[3, 1], [1, 4]], [[3, 2], [1, 3]]]])
+        with self.assertRaises(ValueError) as cm:
+            submission_builder.make_detections(np.ones((2, 4)), [[1, 3, 12, 14], [1, 3, 12, 14]], covars)
+        self.assertIn('lower-right', str(cm.exception))
+
+    def test_errors_if_covar_is_not_postitive_definite(self):
+        covars = np.array([[[[3, 1], [1, 4]], [[10, 0], [0, 15]]], [[[1, 4], [4, 1]], [[3, 1], [1, 4]]]])
+        with self.assertRaises(ValueError) as cm:
+            submission_builder.make_detections(np.ones((2, 4)), [[1, 3, 12, 14], [1, 3, 12, 14]], covars)
+        self.assertIn('upper-left', str(cm.exception))
+
+
+class TestCheckClassIndices(th.ExtendedTestCase):
+
+    def test_returns_integer_array(self):
+        indices = submission_builder.check_class_indices([[3, 1], [0, 2]], [[0.5, 0.5], [0.1, 0.9]], 4)
+        self.assertNPEqual([[3, 1], [0, 2]], indices)
+
+    def test_errors_if_wrong_shape(self):
+        with self.assertRaises(ValueError):
+            submission_builder.check_class_indices([[3, 1, 2], [0, 2, 1]], [[0.5, 0.5], [0.1, 0.9]], 4)
+
+    def test_errors_if_out_of_range(self):
+        with self.assertRaises(ValueError) as cm:
+            submission_builder.check_class_indices([[3, 1], [0, 4]], [[0.5, 0.5], [0.1, 0.9]], 4)
+        self.assertIn('1', str(cm.exception))
+        with self.assertRaises(ValueError):
+            submission_builder.check_class_indices([[-1, 1], [0, 2]], [[0.5, 0.5], [0.1, 0.9]], 4)
+
+    def test_errors_if_duplicate_class(self):
+        with self.assertRaises(ValueError) as cm:
+            submission_builder.check_class_indices([[3, 1], [2, 2]], [[0.5, 0.5], [0.1, 0.9]], 4)
+        self.assertIn('1', str(cm.exception))
+
+    def test_errors_if_not_integers(self):
+        with self.assertRaises(ValueError):
+            submission_builder.check_class_indices([[3.0, 1.0]], [[0.5, 0.5]], 4)
+
+
+class TestMakeClassProjection(th.ExtendedTestCase):
+
+    def test_maps_classes_and_synonyms(self):
+        projection, classes = submission_builder.make_class_projection(
+            ['person', 'zebra', 'tv', 'Cup', 'frisbee', 'background'])
+        self.assertNPEqual([0, 2, 3, 5], projection)
+        self.assertEqual(['person', 'television', 'cup', 'none'], classes)
+
+    def test_errors_if_two_classes_are_the_same_challenge_class(self):
+        with self.assertRaises(ValueError) as cm:
+            submission_builder.make_class_projection(['tv', 'person', 'tvmonitor'])
+        self.assertIn('tvmonitor', str(cm.exception))
+
+    def test_errors_if_no_challenge_classes(self):
+        with self.assertRaises(ValueError):
+            submission_builder.make_class_projection(['zebra', 'frisbee'])
+
+
+class TestNonMaxSuppression(th.ExtendedTestCase):
+
+    def test_suppresses_overlapping_boxes_of_the_same_class(self):
+        probs = np.array([
+            [0.9, 0.1],
+            [0.8, 0.2],     # Overlaps 0, same class
+            [0.3, 0.7],     # Overlaps 0, different class
+            [0.6, 0.4],     # Does not overlap 0
+            [0.7, 0.3]      # Overlaps 0 by less than the threshold
+        ])
+        boxes = np.array([
+            [0, 0, 10, 10],
+            [1, 1, 11, 11],
+            [0, 0, 10, 10],
+            [20, 20, 30, 30],
+            [6, 0, 16, 10]
+        ])
+        keep, suppressed_by = submission_builder.non_max_suppression(probs, boxes, iou_threshold=0.5)
+        self.assertEqual([0, 2, 3, 4], keep.tolist())
+        self.assertEqual([0, 0, 2, 3, 4], suppressed_by.tolist())
+
+    def test_suppressed_boxes_do_not_suppress_others(self):
+        probs = np.array([[0.9, 0.1], [0.8, 0.2], [0.7, 0.3]])
+        # 1 overlaps 0 and 2, but 2 does not overlap 0
+        boxes = np.array([[0, 0, 10, 10], [3, 0, 13, 10], [6, 0, 16, 10]])
+        keep, suppressed_by = submission_builder.non_max_suppression(probs, boxes, iou_threshold=0.5)
+        self.assertEqual([0, 2], keep.tolist())
+        self.assertEqual([0, 0, 2], suppressed_by.tolist())
+
+    def test_removes_low_scores(self):
+        probs = np.array([[0.4, 0.3, 0.3], [0.9, 0.05, 0.05], [0.2, 0.5, 0.3]])
+        boxes = np.array([[0, 0, 10, 10], [20, 20, 30, 30], [40, 40, 50, 50]])
+        keep, suppressed_by = submission_builder.non_max_suppression(probs, boxes, score_threshold=0.45)
+        self.assertEqual([1, 2], keep.tolist())
+        self.assertEqual([-1, 1, 2], suppressed_by.tolist())
+
+    def test_matches_simple_implementation(self):
+        random = np.random.RandomState(16)
+        for _ in range(20):
+            num_detections = random.randint(1, 40)
+            probs = random.dirichlet(np.ones(3), size=num_detections)
+            corners = random.uniform(0, 50, size=(num_detections, 2))
+            boxes = np.concatenate([corners, corners + random.uniform(5, 30, size=(num_detections, 2))], axis=1)
+
+            expected = []
+            labels = np.argmax(probs, axis=1)
+            for idx in sorted(range(num_detections), key=lambda i: -probs[i, labels[i]]):
+                if probs[idx, labels[idx]] < 0.4:
+                    continue
+                box = boxes[idx]
+                is_suppressed = False
+                for other in expected:
+                    if labels[other] == labels[idx]:
+                        width = max(0, min(box[2], boxes[other, 2]) - max(box[0], boxes[other, 0]))
+                        height = max(0, min(box[3], boxes[other, 3]) - max(box[1], boxes[other, 1]))
+                        union = (box[2] - box[0]) * (box[3] - box[1]) + \
+                            (boxes[other, 2] - boxes[other, 0]) * (boxes[other, 3] - boxes[other, 1]) - width * height
+                        if width * height > 0.3 * union:
+                            is_suppressed = True
+                if not is_suppressed:
+                    expected.append(idx)
+            keep, _ = submission_builder.non_max_suppression(probs, boxes, iou_threshold=0.3, score_threshold=0.4)
+            self.assertEqual(sorted(expected), keep.tolist())
+
+    def test_handles_no_detections(self):
+        keep, suppressed_by = submission_builder.non_max_suppression(np.zeros((0, 3)), np.zeros((0, 4)))
+        self.assertEqual(0, len(keep))
+        self.assertEqual(0, len(suppressed_by))
+
+
+class TestMergeCovariances(th.ExtendedTestCase):
+
+    def test_merges_into_survivor(self):
+        probs = np.array([[0.5, 0.5], [0.5, 0.5], [1.0, 0]])
+        boxes = np.array([[0, 0, 10, 10], [2, 0, 10, 12], [20, 20, 30, 30]])
+        covars = np.array([
+            [[[1, 0], [0, 1]], [[2, 0], [0, 2]]],
+            [[[3, 0], [0, 3]], [[4, 1], [1, 4]]],
+            [[[5, 0], [0, 5]], [[5, 0], [0, 5]]]
+        ], dtype=np.float64)
+        has_covars = np.array([True, True, True])
+        merged, merged_has_covars = submission_builder.merge_covariances(
+            probs, boxes, covars, has_covars, np.array([0, 0, 2]))
+        self.assertNPClose([[[(1 + 3 + 4) / 2, 0], [0, 2]], [[3, 0.5], [0.5, (2 + 4 + 4) / 2]]], merged[0])
+        self.assertNPEqual(covars[1:], merged[1:])
+        self.assertNPEqual([True, True, True], merged_has_covars)
+
+    def test_only_adds_covariances_if_merging_some(self):
+        probs = np.array([[0.9, 0.1], [0.8, 0.2], [0.7, 0.3], [0.6, 0.4]])
+        boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30], [21, 21, 31, 31]])
+        covars = np.zeros((4, 2, 2, 2))
+        covars[3] = [[[1, 0], [0, 1]], [[1, 0], [0, 1]]]
+        has_covars = np.array([False, False, False, True])
+        merged, merged_has_covars = submission_builder.merge_covariances(
+            probs, boxes, covars, has_covars, np.array([0, 0, 2, 2]))
+        self.assertNPEqual([False, False, True, True], merged_has_covars)
+        self.assertNPEqual(np.zeros((2, 2, 2)), merged[0])
+        self.assertNPClose([[[(0.6 * 2) / 1.3, 0.6 / 1.3], [0.6 / 1.3, (0.6 * 2) / 1.3]]] * 2, merged[2])
+
+
+class TestEncodeDetections(th.ExtendedTestCase):
+
+    def test_encodes_same_detections_as_make_detections(self):
+        probs = np.array([[0.5, 0.25, 0.125, 0.125], [0.25, 0.25, 0.25, 0.25]])
+        boxes = np.array([[1, 3, 12, 14], [2.5, 4, 22, 18.25]])
+        covars = np.array([
+            [[[3, 1], [1, 4]], [[10, 0], [0, 15]]],
+            [[[5, 0], [0, 15]], [[16, 1], [1, 8]]]
+        ])
+        # 17 significant digits is enough to represent any double exactly
+        self.assertEqual(submission_builder.make_detections(probs, boxes, covars),
+                         json.loads(submission_builder.encode_detections(probs, boxes, covars, significant_digits=17)))
+        self.assertEqual(submission_builder.make_detections(probs, boxes),
+                         json.loads(submission_builder.encode_detections(probs, boxes, significant_digits=17)))
+
+    def test_rounds_to_significant_digits(self):
+        encoded = submission_builder.encode_detections([[0.123456789, 0.000123456789]], [[1.23456, 2, 3, 4]],
+                                                       significant_digits=3)
+        self.assertNotIn(' ', encoded)
+        dets = json.loads(encoded)
+        self.assertEqual([0.123, 0.000123], dets[0]['label_probs'])
+        self.assertEqual([1.23, 2, 3, 4], dets[0]['bbox'])
+
+    def test_rounded_probabilities_sum_to_at_most_one(self):
+        random = np.random.RandomState(5)
+        probs = random.dirichlet(np.ones(len(submission_validator.CLASSES)), size=1000)
+        for significant_digits in [2, 3, 6]:
+            rounded = submission_builder.round_probabilities(probs, significant_digits)
+            self.assertTrue(np.all(np.sum(rounded, axis=1) <= 1))
+            # The validator adds the probabilities up as float32, in its own class order
+            shuffled = rounded[:, random.permutation(rounded.shape[1])].astype(np.float32)
+            self.assertTrue(np.all(np.sum(shuffled, axis=1) <= 1))
+            self.assertTrue(np.all(np.abs(probs - rounded) < 10 ** (1 - significant_digits)))
+        # Rows that are already exact are left alone
+        self.assertNPEqual([[0.5, 0.25, 0.125, 0.125], [0.1, 0.4, 0.2, 0.3]],
+                           submission_builder.round_probabilities([[0.5, 0.25, 0.125, 0.125], [0.1, 0.4, 0.2, 0.3]], 4))
+
+    def test_only_includes_covars_where_given(self):
+        covars = np.array([[[[3, 1], [1, 4]], [[10, 0], [0, 15]]]] * 3)
+        dets = json.loads(submission_builder.encode_detections(
+            np.ones((3, 2)) / 2, [[1, 3, 12, 14]] * 3, covars, np.array([True, False, True])))
+        self.assertEqual(3, len(dets))
+        self.assertEqual(covars[0].tolist(), dets[0]['covars'])
+        self.assertNotIn('covars', dets[1])
+        self.assertEqual(covars[2].tolist(), dets[2]['covars'])
+
+    def test_encodes_empty_list(self):
+        self.assertEqual('[]', submission_builder.encode_detections(np.zeros((0, 4)), np.zeros((0, 4))))
+
+
+class TestSubmissionWriter(th.ExtendedTestCase):
+    temp_dir = os.path.join(os.path.dirname(__file__), 'temp')
+
+    def tearDown(self):
+        if os.path.isdir(self.temp_dir):
+            shutil.rmtree(self.temp_dir)
+
+    def test_default_output_matches_json_dump(self):
+        random = np.random.RandomState(8)
+        classes = submission_validator.CLASSES
+        images = []
+        for num_detections in [3, 0, 5]:
+            probs = random.uniform(0, 1, size=(num_detections, len(classes)))
+            corners = random.uniform(0, 600, size=(num_detections, 2))
+            boxes = np.concatenate([corners, corners + random.uniform(1, 100, size=(num_detections, 2))], axis=1)
+            covars = np.tile([[[[3.1, 0.7], [0.7, 4.3]], [[10.01, 0], [0, 15.3]]]], (num_detections, 1, 1, 1))
+            images.append((probs, boxes, covars))
+        # The file the writer produced before detections were stored in arrays, one dict per detection
+        expected = json.dumps(submission_builder.make_sequence_output([[
+            submission_builder.make_detection(probs[idx], *boxes[idx].tolist(), upper_left_cov=covars[idx][0],
+                                              lower_right_cov=covars[idx][1])
+            for idx in range(len(boxes))
+        ] for probs, boxes, covars in images], classes))
+
+        for streaming in [False, True]:
+            output_dir = os.path.join(self.temp_dir, str(streaming))
+            writer = submission_builder.SubmissionWriter(output_dir, classes, streaming=streaming)
+            writer.start_sequence('000000')
+            for probs, boxes, covars in images:
+                writer.add_detections(probs, boxes, covars)
+                writer.next_image()
+            writer.save_sequence('000000')
+            with open(os.path.join(output_dir, '000000.json'), 'r') as fp:
+                self.assertEqual(expected, fp.read())
+
+    def test_integer_values_are_written_as_floats(self):
+        detection = submission_builder.make_detection([0.25, 0.75], 1, 2, 14, 15,
+                                                      upper_left_cov=submission_builder.make_simple_covariance(1, 2),
+                                                      lower_right_cov=submission_builder.make_simple_covariance(3, 4))
+        with submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:3]) as writer:
+            writer.add_detection(detection['label_probs'], *detection['bbox'], upper_left_cov=detection['covars'][0],
+                                 lower_right_cov=detection['covars'][1])
+            writer.save_sequence('000000')
+        with open(os.path.join(self.temp_dir, '000000.json'), 'r') as fp:
+            contents = fp.read()
+        # The values are the same as json.dump gives, but integers are written as floats
+        self.assertEqual([[detection]], json.loads(contents)['detections'])
+        self.assertIn('"covars": [[[1.0, 0.0], [0.0, 2.0]], [[3.0, 0.0], [0.0, 4.0]]]', contents)
+
+    def test_add_detections_matches_add_detection(self):
+        probs = np.array([[0.1, 0.4, 0.2, 0.3], [0.8, 0.1, 0.05, 0.05], [0.4, 0.1, 0.3, 0.2]])
+        boxes = np.array([[1, 2, 14, 15], [1, 2, 14, 15], [11, 12, 44, 55]])
+        covars = np.array([
+            [[[1, 0], [0, 1]], [[1, 0], [0, 1]]],
+            [[[10, 2], [2, 10]], [[1, 0], [0, 100]]],
+            [[[5, 0], [0, 15]], [[16, 1], [1, 8]]]
+        ])
+        classes = submission_validator.CLASSES[1:5]
+
+        writer = submission_builder.SubmissionWriter(os.path.join(self.temp_dir, 'single'), classes)
+        for idx in range(len(boxes)):
+            writer.add_detection(probs[idx], *boxes[idx], upper_left_cov=covars[idx][0],
+                                 lower_right_cov=covars[idx][1])
+        writer.next_image()
+        writer.save_sequence('000000')
+
+        writer = submission_builder.SubmissionWriter(os.path.join(self.temp_dir, 'batch'), classes)
+        writer.add_detections(probs, boxes, covars)
+        writer.next_image()
+        writer.save_sequence('000000')
+
+        with open(os.path.join(self.temp_dir, 'single', '000000.json'), 'r') as fp:
+            single = json.load(fp)
+        with open(os.path.join(self.temp_dir, 'batch', '000000.json'), 'r') as fp:
+            batch = json.load(fp)
+        self.assertEqual(single, batch)
+
+    def test_add_detections_errors_if_wrong_number_of_classes(self):
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5])
+        with self.assertRaises(RuntimeError):
+            writer.add_detections(np.ones((2, 5)), [[1, 2, 14, 15], [1, 2, 14, 15]])
+
+    def test_streaming_output_is_identical(self):
+        probs = np.array([[0.1, 0.4, 0.2, 0.3], [0.8, 0.1, 0.05, 0.05]])
+        boxes = np.array([[1, 2, 14, 15], [11, 12, 44, 55]])
+        covars = np.array([
+            [[[1, 0], [0, 1]], [[1, 0], [0, 1]]],
+            [[[10, 2], [2, 10]], [[1, 0], [0, 100]]]
+        ])
+        classes = submission_validator.CLASSES[1:5]
+        outputs = []
+        for streaming in [False, True]:
+            output_dir = os.path.join(self.temp_dir, str(streaming))
+            writer = submission_builder.SubmissionWriter(output_dir, classes, streaming=streaming)
+            writer.start_sequence('000000')
+            writer.add_detections(probs, boxes, covars)
+            writer.next_image()
+            writer.next_image()
+            writer.add_detection(probs[0], *boxes[0])
+            writer.next_image()
+            writer.save_sequence('000000')
+            with open(os.path.join(output_dir, '000000.json'), 'r') as fp:
+                outputs.append(fp.read())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(3, len(json.loads(outputs[1])['detections']))
+
+    def test_streaming_writes_empty_sequence(self):
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5], streaming=True)
+        writer.save_sequence('000000')
+        with open(os.path.join(self.temp_dir, '000000.json'), 'r') as fp:
+            data = json.load(fp)
+        self.assertEqual({'classes': submission_validator.CLASSES[1:5], 'detections': []}, data)
+
+    def test_streaming_errors_if_sequence_not_started(self):
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5], streaming=True)
+        writer.add_detection([0.1, 0.4, 0.2, 0.3], 1, 2, 14, 15)
+        with self.assertRaises(RuntimeError):
+            writer.next_image()
+
+    def test_abort_sequence_drops_detections_and_partial_file(self):
+        probs = np.array([[0.1, 0.4, 0.2, 0.3]])
+        boxes = np.array([[1, 2, 14, 15]])
+        for streaming, background in [(False, False), (True, False), (True, True)]:
+            output_dir = os.path.join(self.temp_dir, '{0}_{1}'.format(streaming, background))
+            with submission_builder.SubmissionWriter(output_dir, submission_validator.CLASSES[1:5], streaming=streaming,
+                                                     background=background) as writer:
+                writer.start_sequence('000000')
+                writer.add_detections(probs, boxes)
+                writer.next_image()
+                writer.add_detections(probs, boxes)
+                writer.abort_sequence()
+                writer.start_sequence('000001')
+                writer.next_image()
+                writer.save_sequence('000001')
+                writer.flush()
+                self.assertFalse(writer.is_complete('000000'))
+                self.assertTrue(writer.is_complete('000001'))
+            self.assertFalse(os.path.exists(os.path.join(output_dir, '000000.json')))
+            with open(os.path.join(output_dir, '000001.json'), 'r') as fp:
+                self.assertEqual([[]], json.load(fp)['detections'])
+
+    def test_save_sequence_errors_if_different_sequence_started(self):
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5])
+        writer.start_sequence('000000')
+        writer.next_image()
+        with self.assertRaises(RuntimeError):
+            writer.save_sequence('000001')
+
+    def test_writes_many_detections(self):
+        random = np.random.RandomState(13)
+        classes = submission_validator.CLASSES[1:5]
+        images = []
+        writer = submission_builder.SubmissionWriter(self.temp_dir, classes)
+        for num_detections in [0, 300, 1, 0, 700, 25]:
+            probs = random.uniform(0.1, 1, size=(num_detections, len(classes)))
+            boxes = np.sort(random.uniform(0, 640, size=(num_detections, 2, 2)), axis=1).reshape(num_detections, 4)
+            images.append((probs / np.sum(probs, axis=1, keepdims=True), boxes))
+            writer.add_detections(probs, boxes)
+            writer.next_image()
+        writer.save_sequence('000000')
+
+        with open(os.path.join(self.temp_dir, '000000.json'), 'r') as fp:
+            data = json.load(fp)
+        self.assertEqual(classes, data['classes'])
+        self.assertEqual(len(images), len(data['detections']))
+        for (probs, boxes), img_dets in zip(images, data['detections']):
+            self.assertEqual(len(boxes), len(img_dets))
+            if len(boxes) > 0:
+                self.assertNPClose(probs, [det['label_probs'] for det in img_dets])
+                self.assertNPEqual(boxes, [det['bbox'] for det in img_dets])
+
+    def test_background_output_is_identical(self):
+        probs = np.array([[0.1, 0.4, 0.2, 0.3], [0.8, 0.1, 0.05, 0.05]])
+        boxes = np.array([[1, 2, 14, 15], [11, 12, 44, 55]])
+        classes = submission_validator.CLASSES[1:5]
+        outputs = []
+        for streaming, background in [(False, False), (False, True), (True, True)]:
+            output_dir = os.path.join(self.temp_dir, '{0}_{1}'.format(streaming, background))
+            with submission_builder.SubmissionWriter(output_dir, classes, streaming=streaming,
+                                                     background=background, max_pending=1) as writer:
+                for sequence_name in ['000000', '000001', '000002']:
+                    writer.start_sequence(sequence_name)
+                    for _ in range(5):
+                        writer.add_detections(probs, boxes)
+                        writer.next_image()
+                    writer.save_sequence(sequence_name)
+            for sequence_name in ['000000', '000001', '000002']:
+                with open(os.path.join(output_dir, sequence_name + '.json'), 'r') as fp:
+                    outputs.append(fp.read())
+        self.assertEqual(outputs[0:3], outputs[3:6])
+        self.assertEqual(outputs[0:3], outputs[6:9])
+
+    def test_background_errors_are_raised_on_flush(self):
+        os.makedirs(self.temp_dir)
+        not_a_folder = os.path.join(self.temp_dir, 'not_a_folder')
+        with open(not_a_folder, 'w') as fp:
+            fp.write('blocked')
+        writer = submission_builder.SubmissionWriter(os.path.join(not_a_folder, 'submission'),
+                                                     submission_validator.CLASSES[1:5], background=True)
+        writer.add_detection([0.1, 0.4, 0.2, 0.3], 1, 2, 14, 15)
+        writer.next_image()
+        writer.save_sequence('000000')
+        with self.assertRaises(OSError):
+            writer.flush()
+        with self.assertRaises(OSError):
+            writer.close()
+
+    def test_significant_digits_output_can_be_read(self):
+        probs = np.array([[0.1, 0.4, 0.2, 0.3], [0.8, 0.1, 0.05, 0.05]])
+        boxes = np.array([[1, 2, 14, 15], [11, 12, 44, 55]])
+        covars = np.array([
+            [[[1, 0], [0, 1]], [[1, 0], [0, 1]]],
+            [[[10, 2], [2, 10]], [[1, 0], [0, 100]]]
+        ])
+        classes = submission_validator.CLASSES[1:5]
+        writer = submission_builder.SubmissionWriter(self.temp_dir, classes, streaming=True, significant_digits=4)
+        writer.start_sequence('000000')
+        writer.add_detections(probs, boxes, covars)
+        writer.next_image()
+        writer.next_image()
+        writer.save_sequence('000000')
+
+        with open(os.path.join(self.temp_dir, '000000.json'), 'r') as fp:
+            text = fp.read()
+        self.assertNotIn(' ', text.replace('wine glass', ''))
+        data = json.loads(text)
+        self.assertEqual(classes, data['classes'])
+        self.assertEqual(2, len(data['detections']))
+        self.assertEqual([], data['detections'][1])
+        for det_idx, det in enumerate(data['detections'][0]):
+            self.assertNPClose(probs[det_idx], det['label_probs'])
+            self.assertNPEqual(boxes[det_idx], det['bbox'])
+            self.assertNPEqual(covars[det_idx], det['covars'])
+
+    def test_significant_digits_probabilities_sum_to_at_most_one(self):
+        random = np.random.RandomState(21)
+        classes = submission_validator.CLASSES
+        writer = submission_builder.SubmissionWriter(self.temp_dir, classes, significant_digits=6)
+        for _ in range(10):
+            probs = random.dirichlet(np.ones(len(classes)), size=500)
+            writer.add_detections(probs, np.tile([[1, 2, 14, 15]], (500, 1)))
+            writer.next_image()
+        writer.save_sequence('000000')
+
+        collector = submission_validator.WarningCollector()
+        submission_validator.validate_sequence(os.path.join(self.temp_dir, '000000.json'), show_progress=False,
+                                               warning_collector=collector)
+        self.assertEqual(0, collector.count('normalized'))
+        self.assertEqual(0, collector.count('ignored'))
+
+    def test_writes_zip_file(self):
+        probs = np.array([[0.1, 0.4, 0.2, 0.3], [0.8, 0.1, 0.05, 0.05]])
+        boxes = np.array([[1, 2, 14, 15], [11, 12, 44, 55]])
+        classes = submission_validator.CLASSES[1:5]
+        zip_path = os.path.join(self.temp_dir, 'submission.zip')
+        for compression_level in [0, 9]:
+            for streaming, background in [(False, False), (True, False), (True, True)]:
+                folder_writer = submission_builder.SubmissionWriter(os.path.join(self.temp_dir, 'folder'), classes)
+                with submission_builder.SubmissionWriter(zip_path, classes, streaming=streaming, background=background,
+                                                         compression_level=compression_level) as writer:
+                    for sequence_name in ['000000', '000001']:
+                        writer.start_sequence(sequence_name)
+                        folder_writer.start_sequence(sequence_name)
+                        for _ in range(3):
+                            writer.add_detections(probs, boxes)
+                            writer.next_image()
+                            folder_writer.add_detections(probs, boxes)
+                            folder_writer.next_image()
+                        writer.save_sequence(sequence_name)
+                        folder_writer.save_sequence(sequence_name)
+
+                with zipfile.ZipFile(zip_path, 'r') as zip_file:
+                    self.assertEqual(['000000.json', '000001.json', 'manifest.json'], zip_file.namelist())
+                    for info in zip_file.infolist():
+                        self.assertEqual(zipfile.ZIP_STORED if compression_level == 0 else zipfile.ZIP_DEFLATED,
+                                         info.compress_type)
+                        with open(os.path.join(self.temp_dir, 'folder', info.filename), 'rb') as fp:
+                            self.assertEqual(fp.read(), zip_file.read(info.filename))
+
+    def test_manifest_records_finished_sequences(self):
+        probs = np.array([[0.1, 0.4, 0.2, 0.3], [0.8, 0.1, 0.05, 0.05]])
+        boxes = np.array([[1, 2, 14, 15], [11, 12, 44, 55]])
+        for streaming, background in [(False, False), (True, False), (True, True)]:
+            output_dir = os.path.join(self.temp_dir, '{0}_{1}'.format(streaming, background))
+            with submission_builder.SubmissionWriter(output_dir, submission_validator.CLASSES[1:5], streaming=streaming,
+                                                     background=background) as writer:
+                self.assertFalse(writer.is_complete('000000'))
+                writer.start_sequence('000000')
+                for _ in range(3):
+                    writer.add_detections(probs, boxes)
+                    writer.next_image()
+                writer.save_sequence('000000')
+                writer.flush()
+                self.assertTrue(writer.is_complete('000000'))
+                self.assertFalse(writer.is_complete('000001'))
+
+            with open(os.path.join(output_dir, '000000.json'), 'rb') as fp:
+                contents = fp.read()
+            with open(os.path.join(output_dir, submission_builder.MANIFEST_NAME), 'r') as fp:
+                manifest = json.load(fp)
+            self.assertEqual({'000000': {
+                'complete': True,
+                'path': '000000.json',
+                'images': 3,
+                'detections': 6,
+                'bytes': len(contents),
+                'sha256': hashlib.sha256(contents).hexdigest()
+            }}, manifest['sequences'])
+
+    def test_resuming_keeps_finished_sequences_and_discards_partial_ones(self):
+        probs = np.array([[0.1, 0.4, 0.2, 0.3], [0.8, 0.1, 0.05, 0.05]])
+        boxes = np.array([[1, 2, 14, 15], [11, 12, 44, 55]])
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5], streaming=True)
+        for sequence_name in ['000000', '000001', '000002']:
+            writer.start_sequence(sequence_name)
+            writer.add_detections(probs, boxes)
+            writer.next_image()
+            if sequence_name != '000002':
+                writer.save_sequence(sequence_name)
+        # Stop part way through sequence 2, and corrupt sequence 1
+        writer.close()
+        with open(os.path.join(self.temp_dir, '000001.json'), 'a') as fp:
+            fp.write(' ')
+        self.assertTrue(os.path.isfile(os.path.join(self.temp_dir, '000002.json')))
+
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5])
+        self.assertTrue(writer.is_complete('000000'))
+        self.assertFalse(writer.is_complete('000001'))
+        self.assertFalse(writer.is_complete('000002'))
+
+        for sequence_name in ['000001', '000002']:
+            writer.add_detections(probs, boxes)
+            writer.save_sequence(sequence_name)
+            self.assertTrue(writer.is_complete(sequence_name))
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5])
+        for sequence_name in ['000000', '000001', '000002']:
+            self.assertTrue(writer.is_complete(sequence_name))
+            with open(os.path.join(self.temp_dir, sequence_name + '.json'), 'r') as fp:
+                self.assertEqual(1, len(json.load(fp)['detections']))
+
+    def test_writers_can_share_a_folder(self):
+        probs = np.array([[0.1, 0.4, 0.2, 0.3]])
+        boxes = np.array([[1, 2, 14, 15]])
+        first = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5], streaming=True)
+        first.start_sequence('000000')
+        first.add_detections(probs, boxes)
+        first.next_image()
+
+        # A second writer does not remove the file the first is still writing
+        second = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5])
+        self.assertFalse(second.is_complete('000000'))
+        second.add_detections(probs, boxes)
+        second.save_sequence('000001')
+        second.close()
+
+        first.save_sequence('000000')
+        first.close()
+        self.assertTrue(first.is_complete('000001'))
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5])
+        for sequence_name in ['000000', '000001']:
+            self.assertTrue(writer.is_complete(sequence_name))
+            with open(os.path.join(self.temp_dir, sequence_name + '.json'), 'r') as fp:
+                self.assertEqual(1, len(json.load(fp)['detections']))
+        self.assertEqual(['000000.json', '000001.json', 'manifest.json'], sorted(os.listdir(self.temp_dir)))
+
+    def test_accepts_pathlib_paths(self):
+        probs = np.array([[0.1, 0.4, 0.2, 0.3]])
+        boxes = np.array([[1, 2, 14, 15]])
+        for output in [pathlib.Path(self.temp_dir) / 'folder', pathlib.Path(self.temp_dir) / 'submission.zip']:
+            with submission_builder.SubmissionWriter(output, submission_validator.CLASSES[1:5]) as writer:
+                writer.add_detections(probs, boxes)
+                writer.next_image()
+                writer.save_sequence('000000')
+                writer.flush()
+                self.assertTrue(writer.is_complete('000000'))
+        self.assertTrue(os.path.isfile(os.path.join(self.temp_dir, 'folder', '000000.json')))
+        with zipfile.ZipFile(os.path.join(self.temp_dir, 'submission.zip'), 'r') as zip_file:
+            self.assertIn('000000.json', zip_file.namelist())
+
+    def test_zip_errors_if_sequence_saved_twice(self):
+        writer = submission_builder.SubmissionWriter(os.path.join(self.temp_dir, 'submission.zip'),
+                                                     submission_validator.CLASSES[1:5])
+        writer.save_sequence('000000')
+        with self.assertRaises(RuntimeError):
+            writer.save_sequence('000000')
+        writer.close()
+
+    def test_sparse_probabilities_match_dense(self):
+        classes = submission_validator.CLASSES[1:7]
+        class_indices = np.array([[0, 3], [5, 1], [2, 4]])
+        sparse_probs = np.array([[0.6, 0.2], [0.3, 0.3], [0.1, 0.1]])
+        dense_probs = np.zeros((3, len(classes)))
+        dense_probs[np.arange(3)[:, np.newaxis], class_indices] = sparse_probs
+        boxes = np.array([[1, 2, 14, 15], [11, 12, 44, 55], [13, 14, 46, 57]])
+
+        outputs = []
+        for sparse in [False, True]:
+            output_dir = os.path.join(self.temp_dir, str(sparse))
+            writer = submission_builder.SubmissionWriter(output_dir, classes, significant_digits=6)
+            for _ in range(2):
+                if sparse:
+                    writer.add_detections(sparse_probs[:2], boxes[:2], class_indices=class_indices[:2])
+                    writer.add_detection(sparse_probs[2], *boxes[2], class_indices=class_indices[2])
+                else:
+                    writer.add_detections(dense_probs[:2], boxes[:2])
+                    writer.add_detection(dense_probs[2], *boxes[2])
+                writer.next_image()
+                writer.add_detections(dense_probs, boxes)
+                writer.next_image()
+            writer.save_sequence('000000')
+            with open(os.path.join(output_dir, '000000.json'), 'r') as fp:
+                outputs.append(fp.read())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(4, len(json.loads(outputs[1])['detections']))
+
+    def test_add_detection_errors_if_class_index_out_of_range(self):
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5])
+        with self.assertRaises(ValueError):
+            writer.add_detection([0.5, 0.5], 1, 2, 14, 15, class_indices=[1, 4])
+
+    def test_project_classes_writes_challenge_classes(self):
+        model_classes = ['zebra', 'person', 'tv', 'frisbee', 'cup']
+        probs = np.array([[0.1, 0.4, 0.2, 0.2, 0.1], [0.5, 0.1, 0.1, 0.2, 0.1]])
+        boxes = np.array([[1, 2, 14, 15], [11, 12, 44, 55]])
+        writer = submission_builder.SubmissionWriter(self.temp_dir, model_classes, project_classes=True)
+        writer.add_detections(probs, boxes)
+        writer.add_detection(probs[1], *boxes[1])
+        writer.next_image()
+        writer.add_detections(probs[:, [3, 1]], boxes, class_indices=[[3, 1], [3, 1]])
+        writer.next_image()
+        writer.save_sequence('000000')
+
+        with open(os.path.join(self.temp_dir, '000000.json'), 'r') as fp:
+            data = json.load(fp)
+        self.assertEqual(['person', 'television', 'cup'], data['classes'])
+        self.assertNPClose(probs[:, [1, 2, 4]], [det['label_probs'] for det in data['detections'][0][:2]])
+        self.assertNPClose(probs[1, [1, 2, 4]], data['detections'][0][2]['label_probs'])
+        self.assertNPClose([[0.4 / 0.6, 0, 0], [0.1 / 0.3, 0, 0]],
+                           [det['label_probs'] for det in data['detections'][1]])
+
+    def test_nms_removes_overlapping_detections(self):
+        probs = np.array([[0.9, 0.05, 0.05], [0.8, 0.1, 0.1], [0.1, 0.8, 0.1], [0.2, 0.2, 0.6]])
+        boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [1, 1, 11, 11], [50, 50, 60, 60]])
+        covars = np.array([[[[1, 0], [0, 1]], [[1, 0], [0, 1]]]] * 4, dtype=np.float64)
+        for streaming in [False, True]:
+            output_dir = os.path.join(self.temp_dir, str(streaming))
+            writer = submission_builder.SubmissionWriter(output_dir, submission_validator.CLASSES[1:4],
+                                                         streaming=streaming, nms_iou_threshold=0.5,
+                                                         nms_score_threshold=0.5)
+            writer.start_sequence('000000')
+            writer.add_detections(probs, boxes, covars)
+            writer.next_image()
+            writer.next_image()
+            writer.add_detections(probs[::-1], boxes[::-1])
+            writer.next_image()
+            writer.save_sequence('000000')
+            with open(os.path.join(output_dir, '000000.json'), 'r') as fp:
+                data = json.load(fp)
+            self.assertEqual(3, len(data['detections']))
+            self.assertNPClose(boxes[[0, 2, 3]], [det['bbox'] for det in data['detections'][0]])
+            self.assertNPClose(covars[[0, 2, 3]], [det['covars'] for det in data['detections'][0]])
+            self.assertEqual([], data['detections'][1])
+            self.assertNPClose(boxes[[3, 2, 0]], [det['bbox'] for det in data['detections'][2]])
+            self.assertNPClose(probs[[3, 2, 0]], [det['label_probs'] for det in data['detections'][2]])
+            self.assertEqual(6, writer._manifest['000000']['detections'])
+
+    def test_nms_with_sparse_probabilities_matches_dense(self):
+        classes = submission_validator.CLASSES[1:7]
+        class_indices = np.array([[0, 3], [5, 1], [0, 4], [0, 2]])
+        sparse_probs = np.array([[0.9, 0.1], [0.7, 0.3], [0.6, 0.4], [0.4, 0.35]])
+        dense_probs = np.zeros((4, len(classes)))
+        dense_probs[np.arange(4)[:, np.newaxis], class_indices] = sparse_probs
+        boxes = np.array([[1, 2, 14, 15], [11, 12, 44, 55], [2, 2, 14, 15], [30, 30, 40, 40]])
+        covars = np.array([[[[1, 0], [0, 1]], [[1, 0], [0, 1]]]] * 2, dtype=np.float64)
+
+        outputs = []
+        for sparse in [False, True]:
+            output_dir = os.path.join(self.temp_dir, str(sparse))
+            writer = submission_builder.SubmissionWriter(output_dir, classes, nms_iou_threshold=0.5,
+                                                         nms_score_threshold=0.55, nms_merge_covars=True)
+            for _ in range(2):
+                writer.add_detections(dense_probs[:2], boxes[:2])
+                if sparse:
+                    writer.add_detections(sparse_probs[2:], boxes[2:], covars, class_indices=class_indices[2:])
+                else:
+                    writer.add_detections(dense_probs[2:], boxes[2:], covars)
+                writer.next_image()
+            writer.save_sequence('000000')
+            with open(os.path.join(output_dir, '000000.json'), 'r') as fp:
+                outputs.append(fp.read())
+        self.assertEqual(outputs[0], outputs[1])
+        data = json.loads(outputs[1])
+        self.assertEqual(2, len(data['detections']))
+        for image in data['detections']:
+            self.assertNPClose(boxes[:2], [det['bbox'] for det in image])
+            self.assertNPClose(dense_probs[:2], [det['label_probs'] for det in image])
+            self.assertNotIn('covars', image[1])
+            # Detection 2 is merged into detection 0, with weight 0.6 to 0.9
+            self.assertNPClose([[[0.8, 0], [0, 0.4]], [[0.4, 0], [0, 0.4]]], image[0]['covars'])
+
+    def test_writes_array_files(self):
+        probs = np.array([[0.1, 0.4, 0.2, 0.3], [0.8, 0.1, 0.05, 0.05]])
+        boxes = np.array([[1, 2, 14, 15], [11, 12, 44, 55]])
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5],
+                                                     output_format='npz')
+        writer.add_detections(probs, boxes)
+        writer.next_image()
+        writer.next_image()
+        writer.save_sequence('000000')
+
+        arrays = submission_builder.sequence_arrays.load_sequence_arrays(os.path.join(self.temp_dir, '000000.npz'))
+        self.assertEqual(submission_validator.CLASSES[1:5], arrays.classes)
+        self.assertNPClose(probs, arrays.probs)
+        self.assertNPEqual(boxes, arrays.boxes)
+        self.assertNPEqual([0, 2, 2], arrays.image_offsets)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir, '000000.json')))
+
+        # The manifest records the array file, so the sequence can be resumed
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5],
+                                                     output_format='npz')
+        self.assertTrue(writer.is_complete('000000'))
+        self.assertEqual('000000.npz', writer._manifest['000000']['path'])
+        self.assertEqual(2, writer._manifest['000000']['images'])
+
+    def test_resuming_discards_partial_array_files(self):
+        def crash(output_file, *args):
+            with open(output_file, 'wb') as fp:
+                fp.write(b'partial')
+            raise KeyboardInterrupt
+
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5],
+                                                     output_format='npz')
+        writer.add_detections(np.array([[0.1, 0.4, 0.2, 0.3]]), np.array([[1, 2, 14, 15]]))
+        writer.next_image()
+        with mock.patch.object(submission_builder.sequence_arrays, 'save_sequence_arrays', crash):
+            with self.assertRaises(KeyboardInterrupt):
+                writer.save_sequence('000000')
+        self.assertTrue(os.path.isfile(os.path.join(self.temp_dir, '000000.npz')))
+
+        # The partial file is only removed when the sequence is written again, here as json
+        writer = submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5])
+        self.assertFalse(writer.is_complete('000000'))
+        self.assertTrue(os.path.isfile(os.path.join(self.temp_dir, '000000.npz')))
+        writer.save_sequence('000000')
+        self.assertTrue(writer.is_complete('000000'))
+        self.assertFalse(os.path.isfile(os.path.join(self.temp_dir, '000000.npz')))
+
+    def test_array_files_cannot_be_streamed_or_zipped(self):
+        with self.assertRaises(ValueError):
+            submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5], streaming=True,
+                                                output_format='npz')
+        with self.assertRaises(ValueError):
+            submission_builder.SubmissionWriter(os.path.join(self.temp_dir, 'submission.zip'),
+                                                submission_validator.CLASSES[1:5], output_format='npz')
+        with self.assertRaises(ValueError):
+            submission_builder.SubmissionWriter(self.temp_dir, submission_validator.CLASSES[1:5], output_format='xml')
+
+    def test_project_classes_checks_length_against_model_classes(self):
+        writer = submission_builder.SubmissionWriter(self.temp_dir, ['zebra', 'person', 'cup'],
+                                                     project_classes=True)
+        with self.assertRaises(RuntimeError):
+            writer.add_detections([[0.5, 0.5]], [[1, 2, 14, 15]])